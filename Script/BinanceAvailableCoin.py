@@ -1,27 +1,40 @@
 import asyncio
+import argparse
 import ccxt.async_support as accxt
+from BinanceMarkets import MarketCache, perpetual_symbols
+
+def print_symbols(futures_symbols):
+    print("Available Binance Futures Symbols (PERPETUAL):")
+    print("\n".join(futures_symbols))
+
+async def get_list_futures_binance_symbols(market, refresh=False):
+    # Any cached answer is printed at once; a stale one is then refreshed for the next call
+    cache = MarketCache()
+    futures_markets = None if refresh else cache.get(market)
+    if futures_markets is not None:
+        print_symbols(perpetual_symbols(futures_markets))
+        if cache.fresh(market):
+            return
 
-async def get_list_futures_binance_symbols(market):
     binance = accxt.binance({
         'options': {'defaultType': market},
         'enableRateLimit': True
     })
-    
+
     try:
-        await binance.load_markets()
-        futures_markets = binance.markets
-        
-        futures_symbols = [
-            symbol for symbol, details in futures_markets.items()
-            if 'contractType' in details['info'] and details['info']['contractType'] == 'PERPETUAL'
-        ]
-        
-        print("Available Binance Futures Symbols (PERPETUAL):")
-        print("\n".join(futures_symbols))
-        
+        cache.set(market, await binance.load_markets(reload=True))
+        if futures_markets is None:
+            print_symbols(perpetual_symbols(binance.markets))
+
     finally:
         await binance.close()
 
 if __name__ == "__main__":
-    market_type = 'future'  # Ensure this matches the option expected by ccxt for Binance futures
-    asyncio.run(get_list_futures_binance_symbols(market_type))
+    parser = argparse.ArgumentParser()
+    # Ensure this matches the option expected by ccxt for Binance futures
+    parser.add_argument("--market", default="future", type=str)
+    parser.add_argument("--refresh", action="store_true", help="Reload the markets from the exchange instead of the cache.")
+
+    args = parser.parse_args()
+
+    asyncio.run(get_list_futures_binance_symbols(args.market, args.refresh))
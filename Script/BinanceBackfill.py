@@ -0,0 +1,70 @@
+import asyncio
+from collections import deque
+from BinanceListing import first_candle
+from BinancePipeline import fetch_pages
+from BinanceRetry import with_retry
+
+MINUTE_MS = 60_000
+PAGE_LIMIT = 1500
+
+def split_windows(start, end, window_ms):
+    # Half-open [start, end) windows whose seams sit on minute boundaries, so every
+    # candle belongs to exactly one window. The last window is left open-ended.
+    window_ms -= window_ms % MINUTE_MS
+    windows = []
+    boundary = start - start % MINUTE_MS + window_ms
+    while boundary < end:
+        windows.append((start, boundary))
+        start = boundary
+        boundary += window_ms
+    windows.append((start, None))
+    return windows
+
+async def window_pages(binance, symbol, start, end, scheduler=None, stats=None, retry=None):
+    # The pages of [start, end) one at a time, so callers can write them as they arrive
+    pages = fetch_pages(binance, symbol, start, stats, limit=PAGE_LIMIT, scheduler=scheduler, retry=retry)
+    try:
+        async for tohlcv in pages:
+            if end is not None and tohlcv[-1][0] >= end:
+                tohlcv = [x for x in tohlcv if x[0] < end]
+                if tohlcv:
+                    yield tohlcv
+                break
+            yield tohlcv
+    finally:
+        await pages.aclose()
+
+async def fetch_window(binance, symbol, start, end, scheduler=None, stats=None, retry=None):
+    return [tohlcv async for tohlcv in window_pages(binance, symbol, start, end, scheduler, stats, retry)]
+
+async def backfill_pages(binance, symbol, since, shards=4, window_pages=10, scheduler=None, stats=None, retry=None):
+    # Drop-in replacement for fetch_pages: the history is fetched as independent time
+    # windows, up to `shards` at a time, and the pages are yielded back in time order.
+    # A resolved start (watermark or listing) is used as is; only an unknown one is probed.
+    start = since
+    if not start:
+        start = await with_retry(lambda: first_candle(binance, symbol, since, scheduler), retry, symbol, scheduler,
+                                 lambda: binance.last_response_headers)
+        if start is None:
+            return
+
+    windows = iter(split_windows(start, binance.milliseconds(), window_pages * PAGE_LIMIT * MINUTE_MS))
+    in_flight = deque()
+
+    def launch():
+        window = next(windows, None)
+        if window is not None:
+            in_flight.append(asyncio.create_task(fetch_window(binance, symbol, *window, scheduler, stats, retry)))
+
+    for _ in range(max(shards, 1)):
+        launch()
+    try:
+        while in_flight:
+            pages = await in_flight.popleft()
+            launch()
+            for tohlcv in pages:
+                yield tohlcv
+    finally:
+        for task in in_flight:
+            task.cancel()
+        await asyncio.gather(*in_flight, return_exceptions=True)
@@ -0,0 +1,125 @@
+from decimal import Decimal
+import numpy as np
+
+DEFAULT_DIGITS = 8
+# Smallest magnitude that no longer fits a BIGINT, exact as a float64
+INT64_LIMIT = 2.0 ** 63
+
+def precision_digits(value):
+    # ccxt reports precision as decimal places (int) or, in TICK_SIZE mode, as a step (float)
+    if value is None:
+        return DEFAULT_DIGITS
+    if isinstance(value, int):
+        return value
+    return max(0, -Decimal(str(value)).normalize().as_tuple().exponent)
+
+class ScaledCodec:
+    """ Stores prices and volumes as integers in units of the market's price/amount step """
+
+    def __init__(self, price_digits, volume_digits):
+        self.price_digits = price_digits
+        self.volume_digits = volume_digits
+        self.price_scale = 10 ** price_digits
+        self.volume_scale = 10 ** volume_digits
+
+    @classmethod
+    def from_market(cls, market):
+        precision = market.get('precision') or {}
+        return cls(precision_digits(precision.get('price')), precision_digits(precision.get('amount')))
+
+    def encode_row(self, row):
+        ps = self.price_scale
+        return (row[0], round(row[1] * ps), round(row[2] * ps), round(row[3] * ps), round(row[4] * ps),
+                round(row[5] * self.volume_scale))
+
+    def decode_row(self, row):
+        ps = self.price_scale
+        return (row[0], row[1] / ps, row[2] / ps, row[3] / ps, row[4] / ps, row[5] / self.volume_scale)
+
+    def encode(self, rows):
+        return [self.encode_row(row) for row in rows]
+
+    def decode(self, rows):
+        return [self.decode_row(row) for row in rows]
+
+    def encode_columns(self, columns):
+        ps = self.price_scale
+        return [scaled_int64(columns.open, ps, "open"), scaled_int64(columns.high, ps, "high"),
+                scaled_int64(columns.low, ps, "low"), scaled_int64(columns.close, ps, "close"),
+                scaled_int64(columns.volume, self.volume_scale, "volume")]
+
+def scaled_int64(values, scale, name):
+    # astype(np.int64) wraps out-of-range values silently; Python ints in encode_row are range-checked by the driver
+    scaled = np.rint(values * scale)
+    if len(scaled) and not np.abs(scaled).max() < INT64_LIMIT:
+        raise OverflowError(f"{name} does not fit a BIGINT at scale {scale:g}; store it with a smaller scale or another encoding")
+    return scaled.astype(np.int64)
+
+class NumericEncoding:
+    name = "numeric"
+    sql_type = "NUMERIC"
+    rollup_type = "NUMERIC"
+    suffix = ""
+
+    def codec(self, market):
+        return None
+
+    def binary_columns(self, columns, codec=None):
+        # NUMERIC has no fixed-width binary COPY form, so these columns go through per-row records
+        return None
+
+    def select_columns(self, alias, scales_alias=None):
+        return f"{alias}.timestamp, {alias}.open, {alias}.high, {alias}.low, {alias}.close, {alias}.volume"
+
+    def convert_columns(self, codec=None):
+        # Expressions converting NUMERIC source columns, used when migrating tables
+        return "open, high, low, close, volume"
+
+class Float8Encoding(NumericEncoding):
+    name = "float8"
+    sql_type = "DOUBLE PRECISION"
+    rollup_type = "DOUBLE PRECISION"
+    suffix = "_f8"
+
+    def binary_columns(self, columns, codec=None):
+        return [columns.open, columns.high, columns.low, columns.close, columns.volume]
+
+    def convert_columns(self, codec=None):
+        return "open::float8, high::float8, low::float8, close::float8, volume::float8"
+
+class ScaledEncoding(NumericEncoding):
+    name = "scaled"
+    sql_type = "BIGINT"
+    rollup_type = "DOUBLE PRECISION"  # rollups hold decoded prices
+    suffix = "_i64"
+    scales_table = "ohlcv_scales"
+
+    def codec(self, market):
+        return ScaledCodec.from_market(market or {})
+
+    def binary_columns(self, columns, codec=None):
+        return codec.encode_columns(columns)
+
+    def select_columns(self, alias, scales_alias="scales"):
+        price = f"power(10::float8, {scales_alias}.price_digits)"
+        volume = f"power(10::float8, {scales_alias}.volume_digits)"
+        return (
+            f"{alias}.timestamp, {alias}.open / {price} AS open, {alias}.high / {price} AS high, "
+            f"{alias}.low / {price} AS low, {alias}.close / {price} AS close, {alias}.volume / {volume} AS volume"
+        )
+
+    def convert_columns(self, codec=None):
+        prices = ", ".join(f"round({column} * {codec.price_scale})::bigint" for column in ("open", "high", "low", "close"))
+        return f"{prices}, round(volume * {codec.volume_scale})::bigint"
+
+ENCODINGS = {
+    NumericEncoding.name: NumericEncoding,
+    Float8Encoding.name: Float8Encoding,
+    ScaledEncoding.name: ScaledEncoding,
+}
+
+def make_encoding(name):
+    return ENCODINGS[name]()
+
+def sql_literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
@@ -0,0 +1,147 @@
+import os
+import argparse
+from datetime import datetime, timezone
+from time import perf_counter
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+DAY_MS = 86_400_000
+COLUMNS = ["timestamp", "open", "high", "low", "close", "volume"]
+SCHEMA = pa.schema([
+    ("timestamp", pa.int64()),
+    ("open", pa.float64()),
+    ("high", pa.float64()),
+    ("low", pa.float64()),
+    ("close", pa.float64()),
+    ("volume", pa.float64()),
+])
+EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+def symbol_dir(root, symbol):
+    return os.path.join(root, symbol.replace("/", "_").replace(":", "_"))
+
+def day_name(day):
+    return datetime.fromtimestamp(day * DAY_MS / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+
+def rows_to_table(rows):
+    columns = list(zip(*rows))
+    return pa.Table.from_arrays([pa.array(values, type=field.type) for values, field in zip(columns, SCHEMA)], schema=SCHEMA)
+
+def columns_to_table(columns):
+    # KlineColumns already hold typed NumPy arrays, so Arrow wraps them without per-row objects
+    return pa.Table.from_arrays([pa.array(getattr(columns, name)) for name in COLUMNS], schema=SCHEMA)
+
+class ColumnarSink:
+    """ Per-symbol, per-UTC-day Parquet or Arrow IPC files: <root>/<SYMBOL>/<YYYY-MM-DD>.<ext> """
+
+    def __init__(self, root, file_format="parquet", compression="zstd"):
+        self.root = root
+        self.file_format = file_format
+        self.extension = EXTENSIONS[file_format]
+        # Arrow IPC is left uncompressed by default so reads can map the buffers without copying
+        self.compression = compression if file_format == "parquet" else None
+        self.open_days = {}  # symbol -> (day, table) of the newest day, so appends never re-read it
+
+    def path(self, symbol, day):
+        return os.path.join(symbol_dir(self.root, symbol), f"{day_name(day)}{self.extension}")
+
+    def write(self, symbol, rows):
+        if not rows:
+            return
+        self.write_table(symbol, rows_to_table(rows))
+
+    def write_columns(self, symbol, columns):
+        if not len(columns):
+            return
+        self.write_table(symbol, columns_to_table(columns))
+
+    def write_table(self, symbol, table):
+        os.makedirs(symbol_dir(self.root, symbol), exist_ok=True)
+        days = table["timestamp"].to_numpy() // DAY_MS
+        for day in sorted(set(days.tolist())):
+            day_table = table.filter(pa.array(days == day))
+            self.append_day(symbol, day, day_table)
+
+    def append_day(self, symbol, day, table):
+        cached = self.open_days.get(symbol)
+        if cached is not None and cached[0] == day:
+            existing = cached[1]
+        elif os.path.exists(self.path(symbol, day)):
+            existing = read_file(self.path(symbol, day), self.file_format)
+        else:
+            existing = None
+
+        if existing is not None:
+            # Overlapping rows from a re-fetched page replace nothing; keep the first copy
+            new = table.filter(pc.greater(table["timestamp"], pc.max(existing["timestamp"])))
+            table = pa.concat_tables([existing, new])
+
+        self.write_file(self.path(symbol, day), table)
+        self.open_days[symbol] = (day, table)
+
+    def write_file(self, path, table):
+        tmp_path = f"{path}.tmp"
+        if self.file_format == "parquet":
+            pq.write_table(table, tmp_path, compression=self.compression)
+        else:
+            with pa.OSFile(tmp_path, "wb") as sink:
+                with ipc.new_file(sink, SCHEMA, options=ipc.IpcWriteOptions(compression=self.compression)) as writer:
+                    writer.write_table(table)
+        os.replace(tmp_path, path)
+
+    def last_timestamp(self, symbol):
+        files = day_files(self.root, symbol, self.file_format)
+        if not files:
+            return None
+        return pc.max(read_file(files[-1], self.file_format, ["timestamp"])["timestamp"]).as_py()
+
+def day_files(root, symbol, file_format="parquet"):
+    directory = symbol_dir(root, symbol)
+    if not os.path.isdir(directory):
+        return []
+    extension = EXTENSIONS[file_format]
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(extension))
+
+def read_file(path, file_format, columns=None):
+    if file_format == "parquet":
+        return pq.read_table(path, columns=columns, memory_map=True)
+    # The table's buffers point straight into the mapped file; nothing is copied until used
+    table = ipc.open_file(pa.memory_map(path)).read_all()
+    return table.select(columns) if columns else table
+
+def read_columns(root, symbol, start=None, end=None, columns=None, file_format="parquet"):
+    """ Reads [start, end) as a dict of NumPy arrays, touching only the day files and columns needed """
+    columns = columns or COLUMNS
+    wanted = columns if "timestamp" in columns else ["timestamp"] + columns
+    first_day = day_name(start // DAY_MS) if start is not None else None
+    last_day = day_name((end - 1) // DAY_MS) if end is not None else None
+
+    tables = []
+    for path in day_files(root, symbol, file_format):
+        name = os.path.basename(path)[:10]
+        if (first_day is None or name >= first_day) and (last_day is None or name <= last_day):
+            tables.append(read_file(path, file_format, wanted))
+    if not tables:
+        return {column: pa.array([], type=SCHEMA.field(column).type).to_numpy() for column in columns}
+
+    table = pa.concat_tables(tables)
+    if start is not None:
+        table = table.filter(pc.greater_equal(table["timestamp"], start))
+    if end is not None:
+        table = table.filter(pc.less(table["timestamp"], end))
+    return {column: table[column].to_numpy() for column in columns}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time a column-selective read of a columnar store.")
+    parser.add_argument("--root", default="columnar", type=str)
+    parser.add_argument("--symbol", default="BTC/USDT:USDT", type=str)
+    parser.add_argument("--format", default="parquet", choices=list(EXTENSIONS))
+    parser.add_argument("--columns", default="timestamp,close", type=str)
+
+    args = parser.parse_args()
+
+    started = perf_counter()
+    data = read_columns(args.root, args.symbol, columns=args.columns.split(","), file_format=args.format)
+    print(f"Read {len(data['timestamp']) if 'timestamp' in data else 0} rows of {list(data)} in {perf_counter() - started:.3f}s")
@@ -0,0 +1,127 @@
+import os
+import io
+import csv
+import gzip
+import argparse
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIONS = {None: "", "gzip": ".gz", "zstd": ".zst"}
+TAIL_BYTES = 4096
+
+def check_compression(compression):
+    """ Refuses a codec whose package is missing before anything is fetched, not on the first page """
+    if compression == "zstd" and zstandard is None:
+        raise ValueError("zstd compression needs the zstandard package (pip install zstandard)")
+    return compression
+
+def compression_argument(value):
+    """ argparse type for the CSV compression flags """
+    try:
+        return check_compression(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def format_dates(timestamps):
+    """ 'YYYY-MM-DD HH:MM:SS' UTC strings for a whole page of millisecond timestamps at once """
+    seconds = np.asarray(timestamps, dtype=np.int64) // 1000
+    return np.char.replace(seconds.astype("datetime64[s]").astype(str), "T", " ")
+
+def read_tail_timestamp(path):
+    """ Timestamp of the last complete row of a plain CSV, read with one seek from the end """
+    with open(path, "rb") as file:
+        file.seek(0, os.SEEK_END)
+        size = file.tell()
+        file.seek(max(0, size - TAIL_BYTES))
+        lines = file.read().split(b"\n")[:-1]  # a final line without its newline is not complete
+    for line in reversed(lines):
+        head = line.split(b",", 1)[0]
+        if head.isdigit():
+            return int(head)
+    return None
+
+def truncate_torn_tail(path):
+    """ Cuts a final line left without its newline by an interrupted write; returns the bytes removed """
+    with open(path, "rb+") as file:
+        file.seek(0, os.SEEK_END)
+        size = file.tell()
+        file.seek(max(0, size - TAIL_BYTES))
+        tail = file.read()
+        if not tail or tail.endswith(b"\n"):
+            return 0
+        kept = size - len(tail) + tail.rfind(b"\n") + 1
+        file.truncate(kept)
+    return size - kept
+
+class CsvSink:
+    """ Appends one page at a time to a plain, gzip or zstd CSV and remembers where it stopped """
+
+    def __init__(self, path, compression=None, include_date=True):
+        self.path = path + COMPRESSIONS[check_compression(compression)]
+        self.compression = compression
+        self.header = ["timestamp", "open", "high", "low", "close", "volume"] + (["date"] if include_date else [])
+        self.include_date = include_date
+        self.last = None
+
+    @property
+    def marker_path(self):
+        # Compressed streams cannot be read backwards, so the last timestamp is kept beside them
+        return f"{self.path}.last"
+
+    def last_timestamp(self):
+        if not os.path.exists(self.path):
+            return None
+        if self.compression is None:
+            # The next append would otherwise be glued onto the partial row
+            truncate_torn_tail(self.path)
+            self.last = read_tail_timestamp(self.path)
+        elif os.path.exists(self.marker_path):
+            with open(self.marker_path) as file:
+                self.last = int(file.read().strip())
+        return self.last
+
+    def write(self, rows):
+        if self.last is None:
+            self.last_timestamp()
+        if self.last is not None:
+            rows = [row for row in rows if row[0] > self.last]
+        if not rows:
+            return 0
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if not os.path.exists(self.path):
+            writer.writerow(self.header)
+        if self.include_date:
+            dates = format_dates([row[0] for row in rows])
+            writer.writerows([*row[:6], date] for row, date in zip(rows, dates))
+        else:
+            writer.writerows(row[:6] for row in rows)
+
+        self.append(buffer.getvalue().encode())
+        self.last = rows[-1][0]
+        if self.compression is not None:
+            self.save_marker()
+        return len(rows)
+
+    def append(self, data):
+        # Every page is its own gzip member / zstd frame, so pages before a crash stay readable. The marker is
+        # written after the data and can lag behind it, so a resumed run may append the last page again.
+        if self.compression == "gzip":
+            data = gzip.compress(data)
+        elif self.compression == "zstd":
+            data = zstandard.ZstdCompressor().compress(data)
+        with open(self.path, "ab") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+
+    def save_marker(self):
+        tmp_path = f"{self.marker_path}.tmp"
+        with open(tmp_path, "w") as file:
+            file.write(str(self.last))
+        os.replace(tmp_path, self.marker_path)
@@ -0,0 +1,87 @@
+import threading
+from collections import OrderedDict
+from time import monotonic
+from BinanceRollup import TIMEFRAME_MS, aggregate_sql
+
+class FrameCache:
+    """ LRU of fetched frames; an entry is only served while the symbol's ingest watermark is unchanged """
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.frames = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, watermark):
+        with self.lock:
+            entry = self.frames.get(key)
+            if entry is None or entry[0] != watermark:
+                self.misses += 1
+                return None
+            self.frames.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, watermark, frame):
+        with self.lock:
+            self.frames[key] = (watermark, frame)
+            self.frames.move_to_end(key)
+            while len(self.frames) > self.maxsize:
+                self.frames.popitem(last=False)
+
+class WatermarkCache:
+    """ Newest stored timestamp per symbol, read from the database at most once per `ttl` seconds """
+
+    def __init__(self, read, ttl=2.0, clock=monotonic):
+        self.read = read
+        self.ttl = ttl
+        self.clock = clock
+        self.watermarks = {}
+        self.lock = threading.Lock()
+
+    def get(self, conn, symbol):
+        with self.lock:
+            entry = self.watermarks.get(symbol)
+        if entry is not None and self.clock() - entry[0] < self.ttl:
+            return entry[1]
+        watermark = self.read(conn, symbol)
+        with self.lock:
+            self.watermarks[symbol] = (self.clock(), watermark)
+        return watermark
+
+# Finest timeframe, no finer than the selected one, that keeps the figure under the candle budget
+def pick_timeframe(timeframe, start_timestamp, end_timestamp, max_candles):
+    candidates = sorted((ms, name) for name, ms in TIMEFRAME_MS.items() if ms >= TIMEFRAME_MS[timeframe])
+    for ms, name in candidates:
+        if (end_timestamp - start_timestamp) // ms <= max_candles:
+            return name
+    return candidates[-1][1]
+
+def candles_query(layout, rollups, symbol, timeframe, start_timestamp, end_timestamp, since=None):
+    bucket_ms = TIMEFRAME_MS[timeframe]
+    # The layout decodes float8/scaled columns in SQL, so every encoding reads back as plain prices
+    raw = aggregate_sql(layout.select_sql(symbol), bucket_ms, "timestamp >= %s AND timestamp <= %s")
+    if since is None:
+        return raw, (start_timestamp, end_timestamp)
+
+    # The bucket holding `since` was refreshed from raw rows in full, so it belongs to the rollup side
+    boundary = since // bucket_ms * bucket_ms
+    query = f"""
+    SELECT * FROM ({raw}) AS raw_buckets
+    UNION ALL
+    SELECT timestamp, open, high, low, close, volume FROM {rollups.table(timeframe)}
+    WHERE symbol = %s AND timestamp >= %s AND timestamp <= %s
+    ORDER BY timestamp
+    """
+    return query, (start_timestamp, min(end_timestamp, boundary - 1), symbol, max(start_timestamp, boundary), end_timestamp)
+
+def last_closed_bucket(df, timeframe, watermark):
+    # In live mode the trailing bucket is only plotted once closed, so extensions never need to rewrite it
+    if df.empty:
+        return df, None
+    bucket_ms = TIMEFRAME_MS[timeframe]
+    last = int(df.index[-1].value // 1_000_000)
+    if watermark is not None and last + bucket_ms > watermark + 60_000:
+        df = df.iloc[:-1]
+    return df, (int(df.index[-1].value // 1_000_000) if not df.empty else None)
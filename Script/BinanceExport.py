@@ -4,80 +4,142 @@ import asyncpg
 import ccxt.async_support as accxt
 import argparse
 from configparser import ConfigParser
+from BinanceBackfill import backfill_pages
+from BinanceKlines import KlineColumns, closed_kline_pages, fetch_kline_pages
+from BinanceListing import ListingCache, start_timestamp
+from BinanceMarkets import MarketCache, load_markets, perpetual_symbols
+from BinancePipeline import PipelineStats, closed_pages, fetch_pages, run_pipeline
+from BinanceScheduler import DEFAULT_WEIGHT_LIMIT, WeightScheduler
+from BinanceCodec import ENCODINGS, NumericEncoding
+from BinanceRollup import enable_rollups
+from BinanceStorage import LAYOUTS, PerSymbolLayout, make_layout
+from BinanceMetrics import add_metrics_arguments, metrics
+from BinanceRetry import add_retry_arguments, make_retry_policy, with_retry
 
 async def create_pool(host, database, user, password):
     return await asyncpg.create_pool(host=host, database=database, user=user, password=password, command_timeout=60, min_size=5, max_size=20)
 
-async def download_binance_futures_data(market, db_params, symbols="all"):
-    pool = await create_pool(**db_params)
+async def download_binance_futures_data(market, db_params, symbols="all", write_mode="insert", copy_pages=10,
+                                        queue_size=4, weight_limit=DEFAULT_WEIGHT_LIMIT, backfill_shards=0,
+                                        layout_name=PerSymbolLayout.name, encoding_name=NumericEncoding.name, rollups=True,
+                                        raw_klines=False, retries=8):
+    pool = metrics.wrap_pool(await create_pool(**db_params))
+    layout = make_layout(layout_name, encoding_name=encoding_name)
+    if rollups:
+        enable_rollups(layout)
 
+    # The scheduler owns the request-weight budget, so ccxt's own throttle is disabled
     binance = accxt.binance({
         'options': {'defaultType': market},
-        'enableRateLimit': True
+        'enableRateLimit': False
     })
+    scheduler = WeightScheduler(weight_limit)
+    listing_cache = ListingCache()
+    market_cache = MarketCache()
+    retry = make_retry_policy(retries)
 
     try:
-        await binance.load_markets()
+        async with pool.acquire() as conn:
+            await layout.setup(conn)
+
+        await load_markets(binance, market_cache)
         all_markets = binance.markets
 
-        available_symbols = [
-            symbol for symbol, details in all_markets.items()
-            if 'contractType' in details['info'] and details['info']['contractType'] == 'PERPETUAL'
-        ]
+        available_symbols = perpetual_symbols(all_markets)
 
         if symbols == "all":
             symbols = available_symbols
         else:
             symbols = symbols.split(",")
 
-        tasks = [process_symbol(symbol, binance, pool) for symbol in symbols]
+        tasks = [
+            process_symbol(symbol, binance, pool, write_mode, copy_pages, queue_size, scheduler, backfill_shards, listing_cache, layout,
+                           raw_klines=raw_klines, retry=retry)
+            for symbol in symbols
+        ]
         await asyncio.gather(*tasks)
+        print(f"Scheduler: {scheduler.summary()}")
     finally:
+        await market_cache.wait()
         await binance.close()
         await pool.close()
 
-async def process_symbol(symbol, binance, pool):
-    async with pool.acquire() as conn:  # Acquire a connection from the pool
+async def process_symbol(symbol, binance, pool, write_mode="insert", copy_pages=10, queue_size=4, scheduler=None, backfill_shards=0,
+                         listing_cache=None, layout=None, closed_only=False, raw_klines=False, retry=None):
+    # Connections are only held for DDL and writes, never while waiting on the exchange
+    layout = layout or PerSymbolLayout()
+    # In copy mode several pages are buffered and written with a single COPY
+    batch_pages = copy_pages if write_mode == "copy" else 1
+    committed = 0
+
+    async def ingest():
+        # Every attempt resumes from the committed watermark, so a failed run never rewrites or skips rows
+        market_data = binance.market(symbol)
+
+        async with pool.acquire() as conn:
+            await layout.ensure(conn, symbol, market_data)
+            last_timestamp = await layout.watermark(conn, symbol)
+        timestamp = await start_timestamp(binance, symbol, last_timestamp, listing_cache, scheduler)
+
+        pending = []
+        pending_pages = 0
+
+        async def flush():
+            nonlocal pending, pending_pages, committed
+            if pending:
+                async with pool.acquire() as conn:
+                    if raw_klines:
+                        columns = KlineColumns.concat(pending)
+                        if write_mode == "copy":
+                            await layout.copy_columns(conn, symbol, columns)
+                        else:
+                            await layout.insert(conn, symbol, columns.rows())
+                    elif write_mode == "copy":
+                        await layout.copy(conn, symbol, pending)
+                    else:
+                        await layout.insert(conn, symbol, pending)
+                committed += 1
+                pending = []
+                pending_pages = 0
+
+        async def write_page(tohlcv):
+            nonlocal pending_pages
+            if raw_klines:
+                pending.append(tohlcv)
+            else:
+                pending.extend((x[0], x[1], x[2], x[3], x[4], x[5]) for x in tohlcv)
+            pending_pages += 1
+            if pending_pages >= batch_pages:
+                await flush()
+
+        stats = PipelineStats(symbol, queue_size)
+        if raw_klines:
+            pages = fetch_kline_pages(binance, symbol, timestamp, stats, scheduler=scheduler, retry=retry)
+        elif backfill_shards:
+            pages = backfill_pages(binance, symbol, timestamp, backfill_shards, scheduler=scheduler, stats=stats, retry=retry)
+        else:
+            pages = fetch_pages(binance, symbol, timestamp, stats, scheduler=scheduler, retry=retry)
+        if closed_only:
+            # Repeated passes must not store the still-forming candle, it would never be rewritten
+            pages = closed_kline_pages(pages) if raw_klines else closed_pages(pages)
         try:
-            market_data = binance.market(symbol)
-
-            table_name = symbol.replace("/", "")
-            await conn.execute(f"""
-                CREATE TABLE IF NOT EXISTS "{table_name}" (
-                    timestamp BIGINT,
-                    open NUMERIC,
-                    high NUMERIC,
-                    low NUMERIC,
-                    close NUMERIC,
-                    volume NUMERIC
-                );
-            """)
-
-            last_timestamp = await conn.fetchval(f"SELECT max(timestamp) FROM \"{table_name}\";")
-            timestamp = 0 if last_timestamp is None else last_timestamp + 1
-
-            downloaded = 0
-            while True:
-                tohlcv = await binance.fetch_ohlcv(symbol, timeframe="1m", since=timestamp, limit=1500)
-                if not tohlcv:
-                    break
-
-                await conn.executemany(
-                    f"INSERT INTO \"{table_name}\" (timestamp, open, high, low, close, volume) VALUES ($1, $2, $3, $4, $5, $6);",
-                    [(x[0], x[1], x[2], x[3], x[4], x[5]) for x in tohlcv]
-                )
-
-                timestamp = tohlcv[-1][0] + 1
-                downloaded += len(tohlcv)
-                print(f"Downloaded {downloaded} rows for {symbol}...")
-                await asyncio.sleep(1)  
-
-        except asyncio.CancelledError:
-            print(f"Task for {symbol} was cancelled.")
-        except asyncpg.PostgresError as e:
-            print(f"Database error with {symbol}: {e}")
-        except Exception as e:
-            print(f"An unexpected error occurred with {symbol}: {e}")
+            await run_pipeline(pages, write_page, stats, queue_size)
+        finally:
+            await flush()
+
+        if stats.rows:
+            print(f"Finished {stats.summary()} ({write_mode}, {layout.name}, {layout.encoding.name})")
+
+    try:
+        # Requests already retry in place; this layer covers the writes and restarts from the watermark
+        await with_retry(ingest, retry, symbol, scheduler, lambda: binance.last_response_headers, lambda: committed)
+
+    except asyncio.CancelledError:
+        print(f"Task for {symbol} was cancelled.")
+    except asyncpg.PostgresError as e:
+        print(f"Database error with {symbol}: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred with {symbol}: {e}")
 
 
 def load_config(filename='../database.ini', section='postgresql'):
@@ -99,7 +161,22 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--market", default="future", type=str)
     parser.add_argument("--symbols", default="all", type=str)
+    parser.add_argument("--write-mode", default="insert", choices=["insert", "copy"], help="Row-by-row executemany INSERT or binary COPY.")
+    parser.add_argument("--copy-pages", default=10, type=int, help="Number of 1500-row pages buffered per COPY in copy mode.")
+    parser.add_argument("--queue-size", default=4, type=int, help="Pages the fetch stage may run ahead of the database writer.")
+    parser.add_argument("--weight-limit", default=DEFAULT_WEIGHT_LIMIT, type=int, help="Exchange request-weight limit per minute shared by all symbols.")
+    parser.add_argument("--backfill-shards", default=0, type=int, help="Fetch up to N time windows of a symbol's history concurrently (0 = sequential).")
+    parser.add_argument("--layout", default=PerSymbolLayout.name, choices=list(LAYOUTS), help="One table per symbol or the single partitioned ohlcv table.")
+    parser.add_argument("--encoding", default=NumericEncoding.name, choices=list(ENCODINGS), help="Column type for prices and volumes: NUMERIC, float8 or scaled BIGINT.")
+    parser.add_argument("--raw-klines", action="store_true", help="Fetch from the raw klines endpoint into NumPy columns; with --write-mode copy, float8/scaled tables load by binary COPY.")
+    parser.add_argument("--no-rollups", dest="rollups", action="store_false", help="Skip refreshing the 5T/10T/1H/1D rollup tables.")
+    add_retry_arguments(parser)
+    add_metrics_arguments(parser)
 
     args = parser.parse_args()
+    metrics.start(args.metrics_port, args.metrics_interval)
 
-    asyncio.run(download_binance_futures_data(args.market, db_params, args.symbols))
+    asyncio.run(download_binance_futures_data(
+        args.market, db_params, args.symbols, args.write_mode, args.copy_pages, args.queue_size, args.weight_limit,
+        args.backfill_shards, args.layout, args.encoding, args.rollups, args.raw_klines, args.retries
+    ))
@@ -1,85 +1,146 @@
+import asyncio
 import ccxt
 import psycopg2
 import argparse
 from configparser import ConfigParser
-from time import sleep
+from time import perf_counter, sleep
+from BinanceLive import live
+from BinanceListing import ListingCache, start_timestamp_sync
+from BinanceMarkets import MarketCache, load_markets_sync, perpetual_symbols
+from BinancePipeline import PipelineStats, closed_pages_sync, fetch_pages_sync, run_pipeline_sync
+from BinanceMetrics import add_metrics_arguments, metrics
+from BinanceRetry import add_retry_arguments, make_retry_policy
+from BinanceRollup import enable_rollups
+from BinanceStorage import PerSymbolLayout
 
 def create_connection(db_params):
     conn = psycopg2.connect(**db_params)
     return conn
 
-def download_binance_futures_data(market, db_params, symbols="all"):
+def create_table_sql(table_name):
+    return f"""
+        CREATE TABLE IF NOT EXISTS "{table_name}" (
+            timestamp BIGINT,
+            open NUMERIC,
+            high NUMERIC,
+            low NUMERIC,
+            close NUMERIC,
+            volume NUMERIC
+        );
+    """
+
+def ensure_tables(cursor, symbols, layout=None):
+    # All DDL in one statement batch; with rollups the tables also get the timestamp index their refresh scans
+    statements = [create_table_sql(symbol.replace("/", "")) for symbol in symbols]
+    if layout is not None and layout.rollups is not None:
+        statements += layout.rollups.setup_sql()
+        statements += [sql for symbol in symbols for sql in layout.index_sql(symbol)]
+    cursor.execute("".join(statements))
+
+class WatermarkCache:
+    """ Last stored timestamp per symbol, loaded once at startup and advanced as pages commit """
+
+    def __init__(self):
+        self.watermarks = {}
+
+    def load(self, conn, symbols, layout=None):
+        cursor = conn.cursor()
+        # All watermarks in one round-trip
+        ensure_tables(cursor, symbols, layout)
+        conn.commit()
+
+        query = " UNION ALL ".join(
+            f"SELECT %s, (SELECT max(timestamp) FROM \"{symbol.replace('/', '')}\")" for symbol in symbols
+        )
+        cursor.execute(query, symbols)
+        self.watermarks = dict(cursor.fetchall())
+        cursor.close()
+
+    def get(self, symbol):
+        return self.watermarks.get(symbol)
+
+    def advance(self, symbol, timestamp):
+        current = self.watermarks.get(symbol)
+        if current is None or timestamp > current:
+            self.watermarks[symbol] = timestamp
+
+def download_binance_futures_data(market, db_params, symbols="all", queue_size=4, retries=8, rollups=True):
     conn = create_connection(db_params)
+    # The polling loop writes the numeric per-symbol tables the async exporters use by default
+    layout = PerSymbolLayout()
+    if rollups:
+        enable_rollups(layout)
+    listing_cache = ListingCache()
+    market_cache = MarketCache()
+    retry = make_retry_policy(retries)
     binance = ccxt.binance({
         'options': {'defaultType': market},
         'enableRateLimit': True
     })
 
     try:
-        binance.load_markets()
+        load_markets_sync(binance, market_cache)
         all_markets = binance.markets
 
-        available_symbols = [
-            symbol for symbol, details in all_markets.items()
-            if 'contractType' in details['info'] and details['info']['contractType'] == 'PERPETUAL'
-        ]
+        available_symbols = perpetual_symbols(all_markets)
 
         if symbols == "all":
             symbols = available_symbols
         else:
             symbols = symbols.split(",")
 
+        watermarks = WatermarkCache()
+        watermarks.load(conn, symbols, layout)
+
         # Infinite loop to keep running the process for all symbols
         while True:
+            started = perf_counter()
             for symbol in symbols:
-                process_symbol(symbol, binance, conn)
-            print("All symbols processed. Restarting...")
+                process_symbol(symbol, binance, conn, queue_size, listing_cache, watermarks, retry, layout)
+            print(f"All symbols processed in {perf_counter() - started:.1f}s. Restarting...")
 
             sleep(5)  # Optional delay between each full iteration of symbol processing
 
     finally:
         conn.close()
 
-def process_symbol(symbol, binance, conn):
+def process_symbol(symbol, binance, conn, queue_size=4, listing_cache=None, watermarks=None, retry=None, layout=None):
     try:
         market_data = binance.market(symbol)
         table_name = symbol.replace("/", "")
 
         cursor = conn.cursor()
-        cursor.execute(f"""
-            CREATE TABLE IF NOT EXISTS "{table_name}" (
-                timestamp BIGINT,
-                open NUMERIC,
-                high NUMERIC,
-                low NUMERIC,
-                close NUMERIC,
-                volume NUMERIC
-            );
-        """)
-        conn.commit()
-
-        cursor.execute(f"SELECT max(timestamp) FROM \"{table_name}\";")
-        last_timestamp = cursor.fetchone()[0]
-        timestamp = 0 if last_timestamp is None else last_timestamp + 1
+        if watermarks is None:
+            ensure_tables(cursor, [symbol], layout)
+            conn.commit()
 
-        downloaded = 0
-        while True:
-            tohlcv = binance.fetch_ohlcv(symbol, timeframe="1m", since=timestamp, limit=1500)
-            if not tohlcv:
-                break
+            cursor.execute(f"SELECT max(timestamp) FROM \"{table_name}\";")
+            last_timestamp = cursor.fetchone()[0]
+        else:
+            last_timestamp = watermarks.get(symbol)
+        timestamp = start_timestamp_sync(binance, symbol, last_timestamp, listing_cache)
 
+        def write_page(tohlcv):
             cursor.executemany(
                 f"INSERT INTO \"{table_name}\" (timestamp, open, high, low, close, volume) VALUES (%s, %s, %s, %s, %s, %s);",
                 [(x[0], x[1], x[2], x[3], x[4], x[5]) for x in tohlcv]
             )
+            if layout is not None and layout.rollups is not None:
+                layout.rollups.update_sync(cursor, symbol, tohlcv[0][0], tohlcv[-1][0])
             conn.commit()
-
-            timestamp = tohlcv[-1][0] + 1
-            downloaded += len(tohlcv)
-            print(f"Downloaded {downloaded} rows for {symbol}...")
-            
-            sleep(1)  # Pause to avoid overwhelming the API
+            if watermarks is not None:
+                watermarks.advance(symbol, tohlcv[-1][0])
+
+        # The fetch thread keeps the 1s pause between pages, overlapping it with the commit.
+        # Only closed candles are stored, so a caught-up symbol costs a single request per cycle.
+        # A symbol that still fails is picked up from its watermark on the next cycle.
+        stats = PipelineStats(symbol, queue_size)
+        pages = closed_pages_sync(fetch_pages_sync(binance, symbol, timestamp, stats, retry=retry))
+        run_pipeline_sync(pages, write_page, stats, queue_size)
+        if stats.rows:
+            print(f"Finished {stats.summary()}")
     except psycopg2.DatabaseError as e:
+        conn.rollback()  # the connection is shared by every symbol of the loop
         print(f"Database error with {symbol}: {e}")
     except Exception as e:
         print(f"An unexpected error occurred with {symbol}: {e}")
@@ -103,7 +164,18 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--market", default="future", type=str)
     parser.add_argument("--symbols", default="all", type=str)
+    parser.add_argument("--queue-size", default=4, type=int, help="Pages the fetch thread may run ahead of the database writer.")
+    parser.add_argument("--live", action="store_true", help="Stream closed candles over websockets instead of polling REST.")
+    parser.add_argument("--ws-url", default=None, type=str, help="Combined-stream endpoint for --live, e.g. a local stand-in server.")
+    parser.add_argument("--no-rollups", dest="rollups", action="store_false", help="Skip refreshing the 5T/10T/1H/1D rollup tables.")
+    add_retry_arguments(parser)
+    add_metrics_arguments(parser)
 
     args = parser.parse_args()
+    metrics.start(args.metrics_port, args.metrics_interval)
 
-    download_binance_futures_data(args.market, db_params, args.symbols)
+    if args.live:
+        # Same per-symbol tables as the polling loop, so the two modes can be swapped freely
+        asyncio.run(live(args.market, db_params, args.symbols, url=args.ws_url, rollups=args.rollups, retries=args.retries))
+    else:
+        download_binance_futures_data(args.market, db_params, args.symbols, args.queue_size, args.retries, args.rollups)
@@ -2,9 +2,16 @@ import asyncio
 import argparse
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import Column, BigInteger, Numeric, String, select, func
+from sqlalchemy import Column, BigInteger, Float, Index, Numeric, String, select, func, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from configparser import ConfigParser
 import ccxt.async_support as accxt
+from BinanceListing import ListingCache, start_timestamp
+from BinanceMarkets import MarketCache, load_markets, perpetual_symbols
+from BinancePipeline import PipelineStats, fetch_pages, run_pipeline
+from BinanceScheduler import DEFAULT_WEIGHT_LIMIT, WeightScheduler
+from BinanceMetrics import add_metrics_arguments, metrics
+from BinanceRetry import add_retry_arguments, make_retry_policy, with_retry
 
 Base = declarative_base()
 
@@ -18,6 +25,65 @@ class OHLCV(Base):
     low = Column(Numeric, nullable=False)
     close = Column(Numeric, nullable=False)
     volume = Column(Numeric, nullable=False)
+    # Backs ON CONFLICT and turns the per-symbol max(timestamp) into an index lookup
+    __table_args__ = (Index('ohlcv_data_symbol_timestamp_key', 'symbol', 'timestamp', unique=True),)
+
+class OHLCVFloat8(Base):
+    # Fixed-width float8 columns: half the footprint of NUMERIC and no Decimal decoding on read
+    __tablename__ = 'ohlcv_data_f8'
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    symbol = Column(String(50), nullable=False)
+    timestamp = Column(BigInteger, nullable=False)
+    open = Column(Float(precision=53), nullable=False)
+    high = Column(Float(precision=53), nullable=False)
+    low = Column(Float(precision=53), nullable=False)
+    close = Column(Float(precision=53), nullable=False)
+    volume = Column(Float(precision=53), nullable=False)
+    __table_args__ = (Index('ohlcv_data_f8_symbol_timestamp_key', 'symbol', 'timestamp', unique=True),)
+
+MODELS = {
+    'numeric': OHLCV,
+    'float8': OHLCVFloat8,
+}
+VALUE_COLUMNS = ["symbol", "timestamp", "open", "high", "low", "close", "volume"]
+
+def ensure_unique_index(sync_conn):
+    # create_all skips tables that already exist, so older tables are deduplicated and indexed here
+    for model in MODELS.values():
+        table = model.__table__
+        index = next(iter(table.indexes))
+        exists = sync_conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {'name': index.name}).scalar()
+        if exists:
+            continue
+        sync_conn.execute(text(f"""
+            DELETE FROM {table.name} a USING {table.name} b
+            WHERE a.symbol = b.symbol AND a.timestamp = b.timestamp AND a.id > b.id
+        """))
+        index.create(sync_conn, checkfirst=True)
+
+def bulk_insert_statement(model):
+    # Executed with a list of dicts, SQLAlchemy batches it into multi-row VALUES (insertmanyvalues)
+    return pg_insert(model).on_conflict_do_nothing(index_elements=['symbol', 'timestamp'])
+
+async def copy_rows(session, model, rows):
+    # COPY cannot skip conflicts, so it fills a temp staging table that is merged with ON CONFLICT DO NOTHING
+    table = model.__tablename__
+    staging = f"{table}_staging"
+    connection = await session.connection()
+    raw = await connection.get_raw_connection()
+    driver = raw.driver_connection
+    # The driver connection bypasses the session's transaction; without one of its own every statement
+    # would autocommit and ON COMMIT DELETE ROWS would empty the staging table before the merge
+    async with driver.transaction():
+        await driver.execute(f"""
+            CREATE TEMP TABLE IF NOT EXISTS {staging} ON COMMIT DELETE ROWS AS
+            SELECT {', '.join(VALUE_COLUMNS)} FROM {table} WITH NO DATA;
+        """)
+        await driver.copy_records_to_table(staging, records=rows, columns=VALUE_COLUMNS)
+        await driver.execute(f"""
+            INSERT INTO {table} ({', '.join(VALUE_COLUMNS)}) SELECT {', '.join(VALUE_COLUMNS)} FROM {staging}
+            ON CONFLICT (symbol, timestamp) DO NOTHING;
+        """)
 
 async def create_engine_and_session(db_params):
     engine = create_async_engine(
@@ -26,79 +92,105 @@ async def create_engine_and_session(db_params):
     )
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(ensure_unique_index)
 
     session_factory = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
     return engine, session_factory
 
-async def download_binance_futures_data(market, db_params, symbols="all"):
+async def download_binance_futures_data(market, db_params, symbols="all", queue_size=4, weight_limit=DEFAULT_WEIGHT_LIMIT, encoding="numeric",
+                                        write_mode="core", retries=8):
     engine, session_factory = await create_engine_and_session(db_params)
     
+    # The scheduler owns the request-weight budget, so ccxt's own throttle is disabled
     binance = accxt.binance({
         'options': {'defaultType': market},
-        'enableRateLimit': True
+        'enableRateLimit': False
     })
+    scheduler = WeightScheduler(weight_limit)
+    listing_cache = ListingCache()
+    market_cache = MarketCache()
+    retry = make_retry_policy(retries)
 
     try:
-        await binance.load_markets()
+        await load_markets(binance, market_cache)
         all_markets = binance.markets
 
-        available_symbols = [
-            symbol for symbol, details in all_markets.items()
-            if 'contractType' in details['info'] and details['info']['contractType'] == 'PERPETUAL'
-        ]
+        available_symbols = perpetual_symbols(all_markets)
 
         if symbols == "all":
             symbols = available_symbols
         else:
             symbols = symbols.split(",")
 
-        tasks = [process_symbol(symbol, binance, session_factory) for symbol in symbols]
+        tasks = [
+            process_symbol(symbol, binance, session_factory, queue_size, scheduler, listing_cache, MODELS[encoding], write_mode, retry)
+            for symbol in symbols
+        ]
         await asyncio.gather(*tasks)
+        print(f"Scheduler: {scheduler.summary()}")
     finally:
+        await market_cache.wait()
         await binance.close()
         await engine.dispose()
 
-async def process_symbol(symbol, binance, session_factory):
-    async with session_factory() as session:
-        try:
+async def process_symbol(symbol, binance, session_factory, queue_size=4, scheduler=None, listing_cache=None, model=OHLCV,
+                         write_mode="core", retry=None):
+    # Each write uses a short-lived session so no pooled connection is held while fetching
+    committed = 0
+
+    async def ingest():
+        # Pages commit one session at a time, so a retried run resumes after the last committed one
+        async with session_factory() as session:
             last_timestamp_query = await session.execute(
-                select(func.max(OHLCV.timestamp)).filter(OHLCV.symbol == symbol)
+                select(func.max(model.timestamp)).filter(model.symbol == symbol)
             )
             last_timestamp = last_timestamp_query.scalar()
-            timestamp = 0 if last_timestamp is None else last_timestamp + 1
-
-            downloaded = 0
-            while True:
-                tohlcv = await binance.fetch_ohlcv(symbol, timeframe="1m", since=timestamp, limit=1500)
-                if not tohlcv:
-                    break
-
-                ohlcv_objects = [
-                    OHLCV(
-                        symbol=symbol,
-                        timestamp=x[0],
-                        open=x[1],
-                        high=x[2],
-                        low=x[3],
-                        close=x[4],
-                        volume=x[5]
-                    )
-                    for x in tohlcv
-                ]
-
-                session.add_all(ohlcv_objects)
-                await session.commit()
-
-                timestamp = tohlcv[-1][0] + 1
-                downloaded += len(tohlcv)
-                print(f"Downloaded {downloaded} rows for {symbol}...")
-                await asyncio.sleep(1)
-
-        except asyncio.CancelledError:
-            print(f"Task for {symbol} was cancelled.")
-        except Exception as e:
-            print(f"An unexpected error occurred with {symbol}: {e}")
-            await session.rollback()
+        timestamp = await start_timestamp(binance, symbol, last_timestamp, listing_cache, scheduler)
+
+        async def write_page(tohlcv):
+            nonlocal committed
+            async with session_factory() as session:
+                try:
+                    if write_mode == "orm":
+                        session.add_all([
+                            model(
+                                symbol=symbol,
+                                timestamp=x[0],
+                                open=x[1],
+                                high=x[2],
+                                low=x[3],
+                                close=x[4],
+                                volume=x[5]
+                            )
+                            for x in tohlcv
+                        ])
+                    elif write_mode == "copy":
+                        await copy_rows(session, model, [(symbol, x[0], x[1], x[2], x[3], x[4], x[5]) for x in tohlcv])
+                    else:
+                        await session.execute(bulk_insert_statement(model), [
+                            {'symbol': symbol, 'timestamp': x[0], 'open': x[1], 'high': x[2], 'low': x[3], 'close': x[4], 'volume': x[5]}
+                            for x in tohlcv
+                        ])
+                    await session.commit()
+                    committed += 1
+                except Exception:
+                    await session.rollback()
+                    raise
+
+        stats = PipelineStats(symbol, queue_size)
+        pages = fetch_pages(binance, symbol, timestamp, stats, scheduler=scheduler, retry=retry)
+        await run_pipeline(pages, write_page, stats, queue_size)
+        if stats.rows:
+            print(f"Finished {stats.summary()} ({write_mode})")
+
+    try:
+        # Requests already retry in place; this layer covers the writes and restarts from the last commit
+        await with_retry(ingest, retry, symbol, scheduler, lambda: binance.last_response_headers, lambda: committed)
+
+    except asyncio.CancelledError:
+        print(f"Task for {symbol} was cancelled.")
+    except Exception as e:
+        print(f"An unexpected error occurred with {symbol}: {e}")
 
 def load_config(filename='../database.ini', section='postgresql'):
     parser = ConfigParser()
@@ -119,7 +211,16 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--market", default="future", type=str)
     parser.add_argument("--symbols", default="all", type=str)
+    parser.add_argument("--queue-size", default=4, type=int, help="Pages the fetch stage may run ahead of the database writer.")
+    parser.add_argument("--weight-limit", default=DEFAULT_WEIGHT_LIMIT, type=int, help="Exchange request-weight limit per minute shared by all symbols.")
+    parser.add_argument("--encoding", default="numeric", choices=list(MODELS), help="Column type for prices and volumes.")
+    parser.add_argument("--write-mode", default="core", choices=["core", "copy", "orm"], help="Bulk Core INSERT, COPY via a staging table, or one ORM object per candle.")
+    add_retry_arguments(parser)
+    add_metrics_arguments(parser)
 
     args = parser.parse_args()
+    metrics.start(args.metrics_port, args.metrics_interval)
 
-    asyncio.run(download_binance_futures_data(args.market, db_params, args.symbols))
+    asyncio.run(download_binance_futures_data(
+        args.market, db_params, args.symbols, args.queue_size, args.weight_limit, args.encoding, args.write_mode, args.retries
+    ))
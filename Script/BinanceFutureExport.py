@@ -2,9 +2,19 @@ import asyncio
 import aiohttp
 import asyncpg
 import ccxt.async_support as accxt
-import csv
 import argparse
 from configparser import ConfigParser
+from BinanceColumnar import EXTENSIONS, ColumnarSink
+from BinanceCsv import COMPRESSIONS, CsvSink, compression_argument
+from BinanceListing import ListingCache
+from BinanceMarkets import MarketCache, load_markets, perpetual_symbols
+from BinanceSinks import ColumnarFileSink, CsvFileSink, PostgresSink, export_symbol
+from BinanceScheduler import DEFAULT_WEIGHT_LIMIT, WeightScheduler
+from BinanceCodec import ENCODINGS, NumericEncoding
+from BinanceRollup import enable_rollups
+from BinanceStorage import LAYOUTS, PerSymbolLayout, make_layout
+from BinanceMetrics import add_metrics_arguments, metrics
+from BinanceRetry import add_retry_arguments, make_retry_policy
 
 async def create_pool(host, database, user, password):
     return await asyncpg.create_pool(
@@ -15,77 +25,62 @@ async def create_pool(host, database, user, password):
         command_timeout=60
     )
 
-async def download_binance_futures_data(market, db_params, symbols="all", export_csv=False):
-    pool = await create_pool(**db_params)
+async def download_binance_futures_data(market, db_params, symbols="all", export_csv=False, queue_size=4, weight_limit=DEFAULT_WEIGHT_LIMIT,
+                                        layout_name=PerSymbolLayout.name, encoding_name=NumericEncoding.name,
+                                        columnar_dir=None, columnar_format="parquet", csv_compression=None, rollups=True, retries=8):
+    pool = metrics.wrap_pool(await create_pool(**db_params))
+    columnar = ColumnarSink(columnar_dir, columnar_format) if columnar_dir else None
+    layout = make_layout(layout_name, suffix="_FUTURE", encoding_name=encoding_name)
+    if rollups:
+        enable_rollups(layout)
+    # The scheduler owns the request-weight budget, so ccxt's own throttle is disabled
     binance = accxt.binance({
         'options': {'defaultType': market},
-        'enableRateLimit': True
+        'enableRateLimit': False
     })
+    scheduler = WeightScheduler(weight_limit)
+    listing_cache = ListingCache()
+    market_cache = MarketCache()
+    retry = make_retry_policy(retries)
 
     try:
-        await binance.load_markets()
+        async with pool.acquire() as conn:
+            await layout.setup(conn)
+
+        await load_markets(binance, market_cache)
         all_markets = binance.markets
 
-        available_symbols = [
-            symbol for symbol, details in all_markets.items()
-            if 'contractType' in details['info'] and details['info']['contractType'] == 'PERPETUAL'
-        ]
+        available_symbols = perpetual_symbols(all_markets)
 
         if symbols == "all":
             symbols = available_symbols
         else:
             symbols = [s.strip() for s in symbols.split(",")]
 
-        tasks = [process_symbol(symbol, binance, pool, export_csv) for symbol in symbols]
+        tasks = [
+            process_symbol(symbol, binance, pool, export_csv, queue_size, scheduler, listing_cache, layout, columnar,
+                           csv_compression, retry)
+            for symbol in symbols
+        ]
         await asyncio.gather(*tasks)
+        print(f"Scheduler: {scheduler.summary()}")
     finally:
+        await market_cache.wait()
         await binance.close()
         await pool.close()
 
-async def process_symbol(symbol, binance, pool, export_csv):
+async def process_symbol(symbol, binance, pool, export_csv, queue_size=4, scheduler=None, listing_cache=None, layout=None,
+                         columnar=None, csv_compression=None, retry=None):
     table_name = f"{symbol.replace('/', '')}_FUTURE"
-    async with pool.acquire() as conn:
-        try:
-            await conn.execute(f"""
-                CREATE TABLE IF NOT EXISTS "{table_name}" (
-                    timestamp BIGINT,
-                    open NUMERIC,
-                    high NUMERIC,
-                    low NUMERIC,
-                    close NUMERIC,
-                    volume NUMERIC
-                );
-            """)
-
-            last_timestamp = await conn.fetchval(f"SELECT max(timestamp) FROM \"{table_name}\";")
-            timestamp = 0 if last_timestamp is None else last_timestamp + 1
-
-            downloaded = 0
-            csv_data = []
-            while True:
-                tohlcv = await binance.fetch_ohlcv(symbol, timeframe="1m", since=timestamp, limit=1500)
-                if not tohlcv:
-                    break
-
-                await conn.executemany(
-                    f"INSERT INTO \"{table_name}\" (timestamp, open, high, low, close, volume) VALUES ($1, $2, $3, $4, $5, $6);",
-                    [(x[0], x[1], x[2], x[3], x[4], x[5]) for x in tohlcv]
-                )
-
-                csv_data.extend(tohlcv)
-                timestamp = tohlcv[-1][0] + 1
-                downloaded += len(tohlcv)
-                print(f"Downloaded {downloaded} rows for {symbol}...")
-
-            if export_csv and csv_data:
-                with open(f"{table_name}.csv", "w", newline='') as file:
-                    writer = csv.writer(file)
-                    writer.writerow(["timestamp", "open", "high", "low", "close", "volume"])
-                    writer.writerows(csv_data)
-                print(f"CSV file written for {symbol}")
+    layout = layout or PerSymbolLayout(suffix="_FUTURE")
 
-        except Exception as e:
-            print(f"An error occurred with {symbol}: {e}")
+    # One download feeds every output; each sink resumes from its own last candle
+    sinks = [PostgresSink(symbol, pool, layout, binance.market(symbol), queue_size=queue_size)]
+    if export_csv:
+        sinks.append(CsvFileSink(symbol, CsvSink(f"{table_name}.csv", csv_compression, include_date=False)))
+    if columnar is not None:
+        sinks.append(ColumnarFileSink(symbol, columnar))
+    await export_symbol(symbol, binance, sinks, queue_size, scheduler, listing_cache, retry=retry)
 
 def load_config(filename='../database.ini', section='postgresql'):
     parser = ConfigParser()
@@ -107,7 +102,21 @@ if __name__ == "__main__":
     parser.add_argument("--market", default="future", type=str, help="Market type to download data for.")
     parser.add_argument("--symbols", default="all", type=str, help="Comma-separated list of symbols to fetch data for, or 'all' for all available symbols.")
     parser.add_argument("--export-csv", action="store_true", help="Set this flag to export data to CSV files.")
+    parser.add_argument("--csv-compression", default=None, type=compression_argument, choices=[c for c in COMPRESSIONS if c], help="Compress the CSV export page by page.")
+    parser.add_argument("--queue-size", default=4, type=int, help="Pages the fetch stage may run ahead of the database writer.")
+    parser.add_argument("--weight-limit", default=DEFAULT_WEIGHT_LIMIT, type=int, help="Exchange request-weight limit per minute shared by all symbols.")
+    parser.add_argument("--layout", default=PerSymbolLayout.name, choices=list(LAYOUTS), help="One table per symbol or the single partitioned ohlcv table.")
+    parser.add_argument("--export-columnar", default=None, type=str, help="Also write per-day columnar partitions under this directory.")
+    parser.add_argument("--columnar-format", default="parquet", choices=list(EXTENSIONS), help="Parquet (zstd) or uncompressed Arrow IPC.")
+    parser.add_argument("--encoding", default=NumericEncoding.name, choices=list(ENCODINGS), help="Column type for prices and volumes: NUMERIC, float8 or scaled BIGINT.")
+    parser.add_argument("--no-rollups", dest="rollups", action="store_false", help="Skip refreshing the 5T/10T/1H/1D rollup tables.")
+    add_retry_arguments(parser)
+    add_metrics_arguments(parser)
 
     args = parser.parse_args()
+    metrics.start(args.metrics_port, args.metrics_interval)
 
-    asyncio.run(download_binance_futures_data(args.market, db_params, args.symbols, args.export_csv))
+    asyncio.run(download_binance_futures_data(
+        args.market, db_params, args.symbols, args.export_csv, args.queue_size, args.weight_limit, args.layout, args.encoding,
+        args.export_columnar, args.columnar_format, args.csv_compression, args.rollups, args.retries
+    ))
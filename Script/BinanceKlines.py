@@ -0,0 +1,134 @@
+import asyncio
+import json
+from time import perf_counter, time
+import aiohttp
+import numpy as np
+from ccxt.base.errors import DDoSProtection, ExchangeError, RateLimitExceeded
+from BinanceMetrics import metrics
+from BinanceRetry import retry_after, with_retry
+from BinanceScheduler import kline_weight
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+MINUTE_MS = 60_000
+# ccxt URL keys of the REST APIs serving /klines, by market kind
+KLINE_APIS = {
+    'spot': 'public',
+    'linear': 'fapiPublic',
+    'inverse': 'dapiPublic',
+}
+
+def kline_api(market):
+    if market.get('spot'):
+        return KLINE_APIS['spot']
+    return KLINE_APIS['inverse'] if market.get('inverse') else KLINE_APIS['linear']
+
+class KlineColumns:
+    """ A run of 1m klines as NumPy columns: int64 open times, float64 prices and volume """
+
+    fields = ("timestamp", "open", "high", "low", "close", "volume")
+
+    def __init__(self, timestamp, open, high, low, close, volume):
+        self.timestamp = timestamp
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, np.int64), *(np.empty(0, np.float64) for _ in range(5)))
+
+    @classmethod
+    def from_raw(cls, klines):
+        # Binance sends [openTime, "open", "high", "low", "close", "volume", closeTime, ...] with prices as strings
+        if not klines:
+            return cls.empty()
+        table = np.array(klines, dtype=object)
+        values = table[:, 1:6].astype(np.float64)
+        return cls(table[:, 0].astype(np.int64), *(np.ascontiguousarray(values[:, i]) for i in range(5)))
+
+    @classmethod
+    def concat(cls, pages):
+        if len(pages) == 1:
+            return pages[0]
+        return cls(*(np.concatenate([getattr(page, name) for page in pages]) for name in cls.fields))
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def __getitem__(self, index):
+        # Mirrors a list of rows for callers that only look at a row's open time, e.g. page[-1][0]
+        return (int(self.timestamp[index]), float(self.open[index]), float(self.high[index]), float(self.low[index]),
+                float(self.close[index]), float(self.volume[index]))
+
+    def filter(self, mask):
+        return KlineColumns(*(getattr(self, name)[mask] for name in self.fields))
+
+    def closed(self):
+        # The last kline of a page that reaches the present is still forming
+        open_minute = int(time() * 1000) // MINUTE_MS * MINUTE_MS
+        return self.filter(self.timestamp < open_minute)
+
+    def rows(self):
+        # Per-row tuples, only for sinks that cannot take columns
+        return list(zip(self.timestamp.tolist(), self.open.tolist(), self.high.tolist(), self.low.tolist(),
+                        self.close.tolist(), self.volume.tolist()))
+
+async def fetch_klines(binance, symbol, since, limit=1500, scheduler=None):
+    market = binance.market(symbol)
+    url = f"{binance.urls['api'][kline_api(market)]}/klines"
+    params = {'symbol': market['id'], 'interval': '1m', 'startTime': since, 'limit': limit}
+
+    # Same aiohttp session, and so the same connection pool, as ccxt's own requests
+    binance.open()
+    timeout = aiohttp.ClientTimeout(total=binance.timeout / 1000)
+    async with binance.session.get(url, params=params, timeout=timeout) as response:
+        body = await response.read()
+        if scheduler is not None:
+            scheduler.observe(response.headers)
+        if response.status in (418, 429):
+            # 418 is an IP ban, 429 a weight-limit warning; both say how long to stay away
+            error = (DDoSProtection if response.status == 418 else RateLimitExceeded)(f"{binance.id} {response.status} {body[:200]!r}")
+            error.retry_after = retry_after(None, response.headers)
+            raise error
+        if response.status != 200:
+            raise ExchangeError(f"{binance.id} {response.status} {body[:200]!r}")
+    return KlineColumns.from_raw(loads(body))
+
+async def fetch_kline_pages(binance, symbol, since, stats=None, limit=1500, delay=1, scheduler=None, retry=None):
+    # fetch_pages with the raw endpoint: yields KlineColumns instead of ccxt row lists
+    async def request():
+        if scheduler is not None:
+            await scheduler.acquire(kline_weight(limit))
+        started = perf_counter()
+        columns = await fetch_klines(binance, symbol, since, limit, scheduler)
+        elapsed = perf_counter() - started
+        metrics.observe("fetch", elapsed)
+        if stats is not None:
+            stats.fetch_time += elapsed
+        return columns
+
+    while True:
+        columns = await with_retry(request, retry, symbol, scheduler)
+        if not len(columns):
+            return
+
+        yield columns
+        since = int(columns.timestamp[-1]) + 1
+        if delay and scheduler is None:
+            metrics.observe("throttle", delay)
+            await asyncio.sleep(delay)
+
+async def closed_kline_pages(pages):
+    async for columns in pages:
+        closed = columns.closed()
+        if len(closed):
+            yield closed
+        if len(closed) < len(columns):
+            return
@@ -0,0 +1,232 @@
+import asyncio
+import argparse
+import hashlib
+import math
+import multiprocessing
+import time
+import asyncpg
+import ccxt.async_support as accxt
+from BinanceCodec import ENCODINGS, NumericEncoding
+from BinanceExport import process_symbol
+from BinanceListing import ListingCache
+from BinanceMarkets import MarketCache, load_markets, perpetual_symbols
+from BinanceMetrics import add_metrics_arguments, metrics
+from BinanceRetry import add_retry_arguments, make_retry_policy
+from BinanceRollup import enable_rollups
+from BinanceScheduler import DEFAULT_WEIGHT_LIMIT, WeightScheduler
+from BinanceStorage import LAYOUTS, PerSymbolLayout, load_config, make_layout
+
+LOCK_NAMESPACE = "binance-ingest"
+
+def lock_key(name, namespace=LOCK_NAMESPACE):
+    # Non-negative 63-bit key, so it reads back from pg_locks as (classid << 32) | objid
+    digest = hashlib.blake2b(f"{namespace}:{name}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") >> 1
+
+def shard_of(symbol, shards):
+    return lock_key(symbol) % shards
+
+class ShardWorker:
+    """ Ingests the symbols whose advisory locks it holds; a held shard slot marks its preferred symbols """
+
+    def __init__(self, lock_conn, symbols, shards, slot_hint=0, namespace=LOCK_NAMESPACE):
+        self.lock_conn = lock_conn
+        self.symbols = list(symbols)
+        self.shards = shards
+        self.slot_hint = slot_hint
+        self.namespace = namespace
+        self.slot = None
+        self.owned = set()
+        self.adopt_limit = math.ceil(len(self.symbols) / shards)
+
+    def symbol_key(self, symbol):
+        return lock_key(symbol, self.namespace)
+
+    def slot_key(self, slot):
+        return lock_key(f"shard:{slot}/{self.shards}", self.namespace)
+
+    async def try_lock(self, key):
+        return await self.lock_conn.fetchval("SELECT pg_try_advisory_lock($1);", key)
+
+    async def unlock(self, key):
+        await self.lock_conn.fetchval("SELECT pg_advisory_unlock($1);", key)
+
+    async def held_keys(self):
+        # Advisory locks held by every session, this one included
+        rows = await self.lock_conn.fetch("""
+            SELECT (classid::bigint << 32) | objid::bigint AS key FROM pg_locks
+            WHERE locktype = 'advisory' AND granted AND objsubid = 1;
+        """)
+        return {row['key'] for row in rows}
+
+    async def claim_slot(self):
+        # Hosts may run more workers than there are shards; those only adopt orphaned symbols
+        for offset in range(self.shards):
+            slot = (self.slot_hint + offset) % self.shards
+            if await self.try_lock(self.slot_key(slot)):
+                self.slot = slot
+                return slot
+        return None
+
+    async def rebalance(self):
+        held = await self.held_keys()
+        live_slots = {slot for slot in range(self.shards) if slot == self.slot or self.slot_key(slot) in held}
+        adopted = 0
+        for symbol in self.symbols:
+            shard = shard_of(symbol, self.shards)
+            key = self.symbol_key(symbol)
+            if symbol in self.owned:
+                # Hand an adopted symbol back once its shard has a live owner again
+                if shard != self.slot and shard in live_slots:
+                    await self.unlock(key)
+                    self.owned.discard(symbol)
+                continue
+            if key in held:
+                continue
+            if shard == self.slot:
+                if await self.try_lock(key):
+                    self.owned.add(symbol)
+            elif shard not in live_slots and adopted < self.adopt_limit:
+                if await self.try_lock(key):
+                    self.owned.add(symbol)
+                    adopted += 1
+        return sorted(self.owned)
+
+async def run_worker(index, market, db_params, symbols="all", shards=1, interval=60, concurrency=8, write_mode="insert",
+                     copy_pages=10, queue_size=4, weight_limit=DEFAULT_WEIGHT_LIMIT, layout_name=PerSymbolLayout.name,
+                     suffix="", encoding_name=NumericEncoding.name, rollups=True, metrics_port=None, metrics_interval=None,
+                     retries=8):
+    # Workers share the host, so each serves its metrics on its own port
+    metrics.start(metrics_port + index if metrics_port is not None else None, metrics_interval)
+    # Pooled connections run RESET (pg_advisory_unlock_all) on release, so locks live on their own connection
+    lock_conn = await asyncpg.connect(**db_params)
+    pool = metrics.wrap_pool(await asyncpg.create_pool(**db_params, command_timeout=60, min_size=1, max_size=concurrency))
+    layout = make_layout(layout_name, suffix, encoding_name)
+    if rollups:
+        enable_rollups(layout)
+    binance = accxt.binance({
+        'options': {'defaultType': market},
+        'enableRateLimit': False
+    })
+    scheduler = WeightScheduler(weight_limit)
+    listing_cache = ListingCache()
+    market_cache = MarketCache()
+    retry = make_retry_policy(retries)
+
+    # Losing the lock connection releases every claim, so the worker must stop writing at once
+    lost = asyncio.Event()
+    lock_conn.add_termination_listener(lambda conn: lost.set())
+
+    try:
+        async with pool.acquire() as conn:
+            await layout.setup(conn)
+
+        await load_markets(binance, market_cache)
+        if symbols == "all":
+            symbols = perpetual_symbols(binance.markets)
+        else:
+            symbols = symbols.split(",")
+
+        worker = ShardWorker(lock_conn, symbols, shards, slot_hint=index)
+        slot = await worker.claim_slot()
+        print(f"Worker {index}: shard {slot if slot is not None else '-'} of {shards}")
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded(symbol):
+            async with semaphore:
+                await process_symbol(symbol, binance, pool, write_mode, copy_pages, queue_size, scheduler,
+                                     listing_cache=listing_cache, layout=layout, closed_only=True, retry=retry)
+
+        while True:
+            started = time.monotonic()
+            owned = await worker.rebalance()
+            sweep = asyncio.ensure_future(asyncio.gather(*(bounded(symbol) for symbol in owned)))
+            watchdog = asyncio.ensure_future(lost.wait())
+            await asyncio.wait([sweep, watchdog], return_when=asyncio.FIRST_COMPLETED)
+            watchdog.cancel()
+            if lost.is_set():
+                sweep.cancel()
+                raise ConnectionError(f"Worker {index} lost its lock connection; exiting so no unowned symbol is written")
+            print(f"Worker {index}: synced {len(owned)} symbols in {time.monotonic() - started:.1f}s. Scheduler: {scheduler.summary()}")
+            await asyncio.sleep(max(0, interval - (time.monotonic() - started)))
+    finally:
+        await market_cache.wait()
+        await binance.close()
+        await pool.close()
+        await lock_conn.close()
+
+def worker_main(index, options):
+    asyncio.run(run_worker(index, **options))
+
+def launch(workers, options, restart_delay=5):
+    # Spawned, not forked: each worker starts its own event loop and connections from scratch
+    context = multiprocessing.get_context("spawn")
+    processes = {}
+
+    def start(index):
+        process = context.Process(target=worker_main, args=(index, options), name=f"ingest-{index}", daemon=True)
+        process.start()
+        processes[index] = process
+
+    for index in range(workers):
+        start(index)
+
+    try:
+        while True:
+            time.sleep(restart_delay)
+            for index, process in list(processes.items()):
+                if not process.is_alive():
+                    # Its locks died with it; survivors adopt the orphans until the restarted worker reclaims them
+                    print(f"Worker {index} exited with code {process.exitcode}, restarting")
+                    start(index)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join()
+
+if __name__ == "__main__":
+    db_params = load_config()
+
+    parser = argparse.ArgumentParser(description="Run sharded ingest across worker processes coordinated by advisory locks.")
+    parser.add_argument("--market", default="future", type=str)
+    parser.add_argument("--symbols", default="all", type=str)
+    parser.add_argument("--workers", default=multiprocessing.cpu_count(), type=int, help="Worker processes on this host.")
+    parser.add_argument("--shards", default=None, type=int, help="Shards across all hosts; defaults to --workers.")
+    parser.add_argument("--interval", default=60, type=int, help="Seconds between sync passes of a worker.")
+    parser.add_argument("--concurrency", default=8, type=int, help="Symbols synced in parallel by each worker.")
+    parser.add_argument("--write-mode", default="insert", choices=["insert", "copy"])
+    parser.add_argument("--copy-pages", default=10, type=int)
+    parser.add_argument("--queue-size", default=4, type=int)
+    parser.add_argument("--weight-limit", default=DEFAULT_WEIGHT_LIMIT, type=int, help="Request-weight limit per minute for this host, split across its workers.")
+    parser.add_argument("--layout", default=PerSymbolLayout.name, choices=list(LAYOUTS))
+    parser.add_argument("--suffix", default="", type=str)
+    parser.add_argument("--encoding", default=NumericEncoding.name, choices=list(ENCODINGS))
+    parser.add_argument("--no-rollups", dest="rollups", action="store_false")
+    add_retry_arguments(parser)
+    add_metrics_arguments(parser)
+
+    args = parser.parse_args()
+
+    launch(args.workers, {
+        'market': args.market,
+        'db_params': db_params,
+        'symbols': args.symbols,
+        'shards': args.shards or args.workers,
+        'interval': args.interval,
+        'concurrency': args.concurrency,
+        'write_mode': args.write_mode,
+        'copy_pages': args.copy_pages,
+        'queue_size': args.queue_size,
+        'weight_limit': args.weight_limit // args.workers,
+        'layout_name': args.layout,
+        'suffix': args.suffix,
+        'encoding_name': args.encoding,
+        'rollups': args.rollups,
+        'metrics_port': args.metrics_port,
+        'metrics_interval': args.metrics_interval,
+        'retries': args.retries,
+    })
@@ -0,0 +1,91 @@
+import json
+import os
+import tempfile
+
+LISTING_CACHE_FILE = "listing_cache.json"
+
+def onboard_date(market):
+    # Binance futures report the contract's listing time as info.onboardDate (ms)
+    info = market.get('info') or {}
+    value = info.get('onboardDate') or market.get('created')
+    try:
+        return int(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+def save_json_atomic(path, merge, **dump):
+    # Launcher workers share the cache files: each write goes through its own temp file, so a reader or a
+    # concurrent writer never sees a half-written one; `merge` folds in what other processes saved meanwhile
+    saved = {}
+    if os.path.exists(path):
+        with open(path) as file:
+            saved = json.load(file)
+    data = merge(saved)
+    with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp", delete=False) as file:
+        json.dump(data, file, **dump)
+    os.replace(file.name, path)
+    return data
+
+class ListingCache:
+    """ First available 1m candle per symbol, persisted as JSON across runs """
+
+    def __init__(self, path=LISTING_CACHE_FILE):
+        self.path = path
+        self.listings = {}
+        if os.path.exists(path):
+            with open(path) as file:
+                self.listings = json.load(file)
+
+    def get(self, symbol):
+        return self.listings.get(symbol)
+
+    def set(self, symbol, timestamp):
+        self.listings[symbol] = timestamp
+        self.save()
+
+    def save(self):
+        self.listings = save_json_atomic(self.path, lambda saved: {**saved, **self.listings}, indent=1, sort_keys=True)
+
+async def first_candle(binance, symbol, since=0, scheduler=None):
+    # Binance answers with the first candles at or after `since`, so one tiny page is enough
+    if scheduler is not None:
+        await scheduler.acquire(1)
+    tohlcv = await binance.fetch_ohlcv(symbol, timeframe="1m", since=since, limit=1)
+    if scheduler is not None:
+        scheduler.observe(binance.last_response_headers)
+    return tohlcv[0][0] if tohlcv else None
+
+def first_candle_sync(binance, symbol, since=0):
+    tohlcv = binance.fetch_ohlcv(symbol, timeframe="1m", since=since, limit=1)
+    return tohlcv[0][0] if tohlcv else None
+
+async def resolve_listing(binance, symbol, cache, scheduler=None):
+    listing = cache.get(symbol)
+    if listing is None:
+        listing = await first_candle(binance, symbol, onboard_date(binance.market(symbol)) or 0, scheduler)
+        if listing is not None:
+            cache.set(symbol, listing)
+    return listing
+
+def resolve_listing_sync(binance, symbol, cache):
+    listing = cache.get(symbol)
+    if listing is None:
+        listing = first_candle_sync(binance, symbol, onboard_date(binance.market(symbol)) or 0)
+        if listing is not None:
+            cache.set(symbol, listing)
+    return listing
+
+async def start_timestamp(binance, symbol, last_timestamp, cache=None, scheduler=None):
+    # Resume after the stored watermark; new tables start at the contract's first candle
+    if last_timestamp is not None:
+        return last_timestamp + 1
+    if cache is None:
+        return 0
+    return await resolve_listing(binance, symbol, cache, scheduler) or 0
+
+def start_timestamp_sync(binance, symbol, last_timestamp, cache=None):
+    if last_timestamp is not None:
+        return last_timestamp + 1
+    if cache is None:
+        return 0
+    return resolve_listing_sync(binance, symbol, cache) or 0
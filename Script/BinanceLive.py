@@ -0,0 +1,252 @@
+import asyncio
+import argparse
+import json
+from collections import defaultdict
+from time import perf_counter
+import aiohttp
+import asyncpg
+import ccxt.async_support as accxt
+from BinanceCodec import ENCODINGS, NumericEncoding
+from BinancePipeline import closed_pages, fetch_pages
+from BinanceMarkets import MarketCache, load_markets, perpetual_symbols
+from BinanceScheduler import DEFAULT_WEIGHT_LIMIT, WeightScheduler
+from BinanceRollup import enable_rollups
+from BinanceStorage import LAYOUTS, PerSymbolLayout, load_config, make_layout
+from BinanceMetrics import add_metrics_arguments, metrics
+from BinanceRetry import add_retry_arguments, make_retry_policy
+
+FUTURES_STREAM_URL = "wss://fstream.binance.com/stream"
+SPOT_STREAM_URL = "wss://stream.binance.com:9443/stream"
+# Binance caps the number of streams a single combined-stream connection may carry
+STREAMS_PER_CONNECTION = 200
+
+def kline_row(kline):
+    return (kline['t'], float(kline['o']), float(kline['h']), float(kline['l']), float(kline['c']), float(kline['v']))
+
+class LiveIngest:
+    """ Writes closed 1m candles from combined kline streams in micro-batches """
+
+    def __init__(self, binance, symbols, write, watermarks, url=FUTURES_STREAM_URL, scheduler=None,
+                 batch_size=500, flush_interval=1.0, streams_per_connection=STREAMS_PER_CONNECTION, retry=None,
+                 reconnect_delay=1):
+        self.binance = binance
+        self.symbols = list(symbols)
+        self.write = write
+        self.watermarks = dict(watermarks)
+        self.url = url
+        self.scheduler = scheduler
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.streams_per_connection = streams_per_connection
+        self.retry = retry
+        self.reconnect_delay = reconnect_delay
+        self.symbols_by_id = {binance.market(symbol)['id']: symbol for symbol in self.symbols}
+        self.buffer = defaultdict(list)
+        self.pending = 0
+        self.flush_needed = asyncio.Event()
+        self.stopped = asyncio.Event()
+        self.catch_up_tasks = set()
+        self.first_streamed = {}
+        self.connections = 0
+        self.written = 0
+
+    def stream_url(self, symbols):
+        streams = "/".join(f"{self.binance.market(symbol)['id'].lower()}@kline_1m" for symbol in symbols)
+        return f"{self.url}?streams={streams}"
+
+    async def run(self):
+        chunks = [
+            self.symbols[i:i + self.streams_per_connection]
+            for i in range(0, len(self.symbols), self.streams_per_connection)
+        ]
+        async with aiohttp.ClientSession() as session:
+            tasks = [asyncio.create_task(self.run_connection(session, chunk)) for chunk in chunks]
+            tasks.append(asyncio.create_task(self.run_flusher()))
+            try:
+                await self.stopped.wait()
+            finally:
+                for task in tasks + list(self.catch_up_tasks):
+                    task.cancel()
+                await asyncio.gather(*tasks, *self.catch_up_tasks, return_exceptions=True)
+                await self.flush()
+
+    def stop(self):
+        self.stopped.set()
+
+    async def run_connection(self, session, symbols):
+        backoff = self.reconnect_delay
+        while not self.stopped.is_set():
+            try:
+                async with session.ws_connect(self.stream_url(symbols), heartbeat=30) as ws:
+                    self.connections += 1
+                    backoff = self.reconnect_delay
+                    # Subscribed first, so anything closing during the REST fill also arrives on the stream
+                    self.start_catch_up(symbols)
+                    async for message in ws:
+                        if message.type == aiohttp.WSMsgType.TEXT:
+                            self.handle(json.loads(message.data))
+                        elif message.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                            break
+                print(f"Stream connection for {len(symbols)} symbols closed, reconnecting...")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                print(f"Stream connection for {len(symbols)} symbols failed: {e}")
+
+            if self.stopped.is_set():
+                break
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+
+    def handle(self, message):
+        data = message.get('data', message)
+        kline = data.get('k')
+        if not kline or not kline.get('x'):
+            return  # only closed candles are final
+
+        symbol = self.symbols_by_id.get(kline['s'])
+        if symbol is None:
+            return
+        row = kline_row(kline)
+        self.first_streamed.setdefault(symbol, row[0])
+        self.buffer[symbol].append(row)
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush_needed.set()
+
+    def start_catch_up(self, symbols):
+        # Watermarks are copied before the connection's first message, since flushes of streamed candles
+        # move them forward while earlier symbols are still being filled
+        watermarks = {symbol: self.watermarks.get(symbol) for symbol in symbols}
+        for symbol in symbols:
+            self.first_streamed.pop(symbol, None)
+        task = asyncio.create_task(self.catch_up(watermarks))
+        self.catch_up_tasks.add(task)
+        task.add_done_callback(self.catch_up_tasks.discard)
+
+    async def catch_up(self, watermarks):
+        # REST fill of whatever closed while the stream was down, up to the first candle the stream delivered
+        for symbol, watermark in watermarks.items():
+            if watermark is None:
+                continue
+            try:
+                pages = fetch_pages(self.binance, symbol, watermark + 1, delay=0, scheduler=self.scheduler, retry=self.retry)
+                async for tohlcv in closed_pages(pages):
+                    streamed = self.first_streamed.get(symbol)
+                    rows = [(x[0], x[1], x[2], x[3], x[4], x[5]) for x in tohlcv if streamed is None or x[0] < streamed]
+                    if rows:
+                        await self.write_rows(symbol, rows)
+                    if len(rows) < len(tohlcv):
+                        break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Gap fill for {symbol} failed: {e}")
+
+    async def run_flusher(self):
+        # wait_for() can swallow a cancel that races flush_needed, so stop() is checked as well
+        while not self.stopped.is_set():
+            try:
+                await asyncio.wait_for(self.flush_needed.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.flush_needed.clear()
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Live batch write failed: {e}")
+
+    async def flush(self):
+        if not self.pending:
+            return
+        buffer, self.buffer, self.pending = self.buffer, defaultdict(list), 0
+        error = None
+        for symbol, rows in buffer.items():
+            watermark = self.watermarks.get(symbol)
+            rows = sorted(row for row in rows if watermark is None or row[0] > watermark)
+            if not rows:
+                continue
+            try:
+                await self.write_rows(symbol, rows)
+            except Exception as e:
+                # Keep the candles for the next flush instead of dropping them
+                self.buffer[symbol].extend(rows)
+                self.pending += len(rows)
+                error = e
+        if error is not None:
+            raise error
+
+    async def write_rows(self, symbol, rows):
+        started = perf_counter()
+        await self.write(symbol, rows)
+        metrics.observe("write", perf_counter() - started)
+        metrics.record_page(symbol, rows)
+        self.written += len(rows)
+        self.watermarks[symbol] = max(self.watermarks.get(symbol) or rows[-1][0], rows[-1][0])
+
+async def live(market, db_params, symbols="all", layout_name=PerSymbolLayout.name, suffix="",
+               encoding_name=NumericEncoding.name, url=None, batch_size=500, flush_interval=1.0,
+               weight_limit=DEFAULT_WEIGHT_LIMIT, rollups=True, retries=8):
+    pool = metrics.wrap_pool(await asyncpg.create_pool(**db_params, command_timeout=60, min_size=1, max_size=4))
+    layout = make_layout(layout_name, suffix, encoding_name)
+    if rollups:
+        enable_rollups(layout)
+    binance = accxt.binance({
+        'options': {'defaultType': market},
+        'enableRateLimit': False
+    })
+    scheduler = WeightScheduler(weight_limit)
+    market_cache = MarketCache()
+
+    try:
+        await load_markets(binance, market_cache)
+        if symbols == "all":
+            symbols = perpetual_symbols(binance.markets)
+        else:
+            symbols = symbols.split(",")
+
+        # Stream and REST fill can deliver the same candle, so every write is an upsert
+        watermarks = {}
+        async with pool.acquire() as conn:
+            await layout.setup(conn)
+            for symbol in symbols:
+                await layout.ensure(conn, symbol, binance.market(symbol))
+                await layout.ensure_index(conn, symbol)
+                watermarks[symbol] = await layout.watermark(conn, symbol)
+
+        async def write(symbol, rows):
+            async with pool.acquire() as conn:
+                await layout.upsert(conn, symbol, rows)
+
+        url = url or (FUTURES_STREAM_URL if market == "future" else SPOT_STREAM_URL)
+        ingest = LiveIngest(binance, symbols, write, watermarks, url, scheduler, batch_size, flush_interval,
+                            retry=make_retry_policy(retries))
+        await ingest.run()
+    finally:
+        await market_cache.wait()
+        await binance.close()
+        await pool.close()
+
+if __name__ == "__main__":
+    db_params = load_config()
+
+    parser = argparse.ArgumentParser(description="Ingest closed 1m candles from Binance kline streams.")
+    parser.add_argument("--market", default="future", type=str)
+    parser.add_argument("--symbols", default="all", type=str)
+    parser.add_argument("--layout", default=PerSymbolLayout.name, choices=list(LAYOUTS))
+    parser.add_argument("--suffix", default="", type=str)
+    parser.add_argument("--encoding", default=NumericEncoding.name, choices=list(ENCODINGS))
+    parser.add_argument("--no-rollups", dest="rollups", action="store_false", help="Skip refreshing the 5T/10T/1H/1D rollup tables.")
+    parser.add_argument("--ws-url", default=None, type=str, help="Combined-stream endpoint, e.g. a local stand-in server.")
+    parser.add_argument("--batch-size", default=500, type=int, help="Closed candles buffered before a write.")
+    parser.add_argument("--flush-interval", default=1.0, type=float, help="Seconds between writes of a partial batch.")
+    add_retry_arguments(parser)
+    add_metrics_arguments(parser)
+
+    args = parser.parse_args()
+    metrics.start(args.metrics_port, args.metrics_interval)
+
+    asyncio.run(live(
+        args.market, db_params, args.symbols, args.layout, args.suffix, args.encoding, args.ws_url,
+        args.batch_size, args.flush_interval, rollups=args.rollups, retries=args.retries
+    ))
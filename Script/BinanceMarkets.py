@@ -0,0 +1,95 @@
+import asyncio
+import json
+import os
+import threading
+from time import time
+from BinanceListing import save_json_atomic
+
+MARKET_CACHE_FILE = "market_cache.json"
+MARKET_CACHE_TTL = 6 * 3600
+
+def perpetual_symbols(markets):
+    return [
+        symbol for symbol, details in markets.items()
+        if 'contractType' in details['info'] and details['info']['contractType'] == 'PERPETUAL'
+    ]
+
+def market_type(binance):
+    return binance.options.get('defaultType', 'spot')
+
+class MarketCache:
+    """ ccxt markets per market type, persisted as JSON with the time they were loaded """
+
+    def __init__(self, path=MARKET_CACHE_FILE, ttl=MARKET_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}
+        self.refreshing = None
+        if os.path.exists(path):
+            with open(path) as file:
+                self.entries = json.load(file)
+
+    def get(self, kind):
+        entry = self.entries.get(kind)
+        return entry['markets'] if entry else None
+
+    def fresh(self, kind):
+        entry = self.entries.get(kind)
+        return entry is not None and time() - entry['loaded'] < self.ttl
+
+    def set(self, kind, markets):
+        self.entries[kind] = {'loaded': time(), 'markets': markets}
+        self.save()
+
+    def save(self):
+        # Market types saved by other processes are kept, the ones loaded here win
+        self.entries = save_json_atomic(self.path, lambda saved: {**saved, **self.entries})
+
+    async def wait(self):
+        # A refresh started by this run finishes before the exchange is closed
+        if self.refreshing is not None:
+            await asyncio.gather(self.refreshing, return_exceptions=True)
+
+async def refresh_markets(binance, cache):
+    try:
+        cache.set(market_type(binance), await binance.load_markets(reload=True))
+    except Exception as e:
+        print(f"Market refresh failed, keeping the cached markets: {e}")
+
+async def load_markets(binance, cache=None):
+    """ Markets from the cache; stale ones are used at once and refreshed in the background """
+    if cache is None:
+        return await binance.load_markets()
+    kind = market_type(binance)
+    markets = cache.get(kind)
+    if markets is None:
+        markets = await binance.load_markets()
+        cache.set(kind, markets)
+        return markets
+
+    binance.set_markets(markets)
+    if not cache.fresh(kind) and cache.refreshing is None:
+        cache.refreshing = asyncio.ensure_future(refresh_markets(binance, cache))
+    return binance.markets
+
+def refresh_markets_sync(binance, cache):
+    try:
+        cache.set(market_type(binance), binance.load_markets(reload=True))
+    except Exception as e:
+        print(f"Market refresh failed, keeping the cached markets: {e}")
+
+def load_markets_sync(binance, cache=None):
+    if cache is None:
+        return binance.load_markets()
+    kind = market_type(binance)
+    markets = cache.get(kind)
+    if markets is None:
+        markets = binance.load_markets()
+        cache.set(kind, markets)
+        return markets
+
+    binance.set_markets(markets)
+    if not cache.fresh(kind) and cache.refreshing is None:
+        cache.refreshing = threading.Thread(target=refresh_markets_sync, args=(binance, cache), name="market-refresh", daemon=True)
+        cache.refreshing.start()
+    return binance.markets
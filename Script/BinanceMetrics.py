@@ -0,0 +1,197 @@
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter, sleep, time
+
+MINUTE_MS = 60_000
+# Upper bounds in seconds, from a fast local COPY to a throttled minute
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Histogram:
+    """ Fixed-bucket latency histogram; one bisect and two adds per observation """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def percentile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def cumulative(self):
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            yield bound, seen
+
+class SymbolProgress:
+    def __init__(self):
+        self.rows = 0
+        self.pages = 0
+        self.last_timestamp = None
+
+    def lag(self, now_ms):
+        # Seconds between the newest closed minute and the newest stored candle
+        if self.last_timestamp is None:
+            return None
+        return max(0.0, (now_ms // MINUTE_MS * MINUTE_MS - MINUTE_MS - self.last_timestamp) / 1000)
+
+class Metrics:
+    """ Process-wide hot-path metrics; every call returns at once while disabled """
+
+    def __init__(self):
+        self.enabled = False
+        self.histograms = {}
+        self.symbols = {}
+        self.started = perf_counter()
+        self.reported_rows = 0
+        self.reported_at = self.started
+        self.server = None
+
+    def observe(self, stage, seconds):
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram()
+        histogram.observe(seconds)
+
+    def record_page(self, symbol, page):
+        if not self.enabled or not len(page):
+            return
+        progress = self.symbols.get(symbol)
+        if progress is None:
+            progress = self.symbols[symbol] = SymbolProgress()
+        progress.rows += len(page)
+        progress.pages += 1
+        progress.last_timestamp = int(page[-1][0])
+
+    def wrap_pool(self, pool):
+        # Only an enabled registry puts a timer around pool.acquire()
+        return InstrumentedPool(pool, self) if self.enabled else pool
+
+    def summary(self):
+        now = perf_counter()
+        symbols = list(self.symbols.items())
+        rows = sum(progress.rows for _, progress in symbols)
+        rate = (rows - self.reported_rows) / (now - self.reported_at) if now > self.reported_at else 0.0
+        self.reported_rows, self.reported_at = rows, now
+
+        parts = [f"{len(symbols)} symbols, {rows} rows, {rate:.0f} rows/s"]
+        now_ms = int(time() * 1000)
+        lags = [(progress.lag(now_ms), symbol) for symbol, progress in symbols if progress.last_timestamp is not None]
+        if lags:
+            lag, symbol = max(lags)
+            parts[0] += f", max lag {lag:.0f}s ({symbol})"
+        for stage, histogram in list(self.histograms.items()):
+            parts.append(
+                f"{stage} n={histogram.count} p50 {histogram.percentile(0.5) * 1000:.0f}ms "
+                f"p99 {histogram.percentile(0.99) * 1000:.0f}ms total {histogram.sum:.1f}s"
+            )
+        return " | ".join(parts)
+
+    def render(self):
+        """ Prometheus text exposition format """
+        lines = [
+            "# HELP binance_stage_seconds Latency of exchange requests, writes, pool waits and sleeps.",
+            "# TYPE binance_stage_seconds histogram",
+        ]
+        for stage, histogram in list(self.histograms.items()):
+            for bound, count in histogram.cumulative():
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f'binance_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {count}')
+            lines.append(f'binance_stage_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+            lines.append(f'binance_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+        symbols = list(self.symbols.items())
+        now_ms = int(time() * 1000)
+        lines += ["# HELP binance_rows_total Candles written per symbol.", "# TYPE binance_rows_total counter"]
+        lines += [f'binance_rows_total{{symbol="{symbol}"}} {progress.rows}' for symbol, progress in symbols]
+        lines += ["# HELP binance_lag_seconds Age of the newest stored candle behind the last closed minute.",
+                  "# TYPE binance_lag_seconds gauge"]
+        lines += [
+            f'binance_lag_seconds{{symbol="{symbol}"}} {progress.lag(now_ms):.0f}'
+            for symbol, progress in symbols if progress.last_timestamp is not None
+        ]
+        return "\n".join(lines) + "\n"
+
+    def start(self, port=None, interval=None):
+        """ Enables recording if an endpoint port or a summary interval is given """
+        if port is None and not interval:
+            return
+        self.enabled = True
+        # Threads rather than tasks, so the blocking exporter is covered as well
+        if port is not None:
+            self.server = ThreadingHTTPServer(("", port), metrics_handler(self))
+            threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+            print(f"Metrics on http://localhost:{port}/metrics")
+        if interval:
+            threading.Thread(target=self.report, args=(interval,), name="metrics-summary", daemon=True).start()
+
+    def report(self, interval):
+        while True:
+            sleep(interval)
+            print(f"Metrics: {self.summary()}", flush=True)
+
+class TimedAcquire:
+    def __init__(self, context, metrics):
+        self.context = context
+        self.metrics = metrics
+
+    async def __aenter__(self):
+        started = perf_counter()
+        conn = await self.context.__aenter__()
+        self.metrics.observe("pool_wait", perf_counter() - started)
+        return conn
+
+    async def __aexit__(self, *exc):
+        return await self.context.__aexit__(*exc)
+
+class InstrumentedPool:
+    """ asyncpg pool whose acquire() records the wait for a free connection """
+
+    def __init__(self, pool, metrics):
+        self.pool = pool
+        self.metrics = metrics
+
+    def acquire(self, *args, **kwargs):
+        return TimedAcquire(self.pool.acquire(*args, **kwargs), self.metrics)
+
+    def __getattr__(self, name):
+        return getattr(self.pool, name)
+
+def metrics_handler(metrics):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # scrapes would otherwise log a line each
+
+    return MetricsHandler
+
+metrics = Metrics()
+
+def add_metrics_arguments(parser):
+    parser.add_argument("--metrics-port", default=None, type=int, help="Serve Prometheus metrics on this port.")
+    parser.add_argument("--metrics-interval", default=None, type=float, help="Print a compact metrics summary every N seconds.")
@@ -0,0 +1,265 @@
+import asyncio
+import queue
+import threading
+from time import perf_counter, sleep, time
+from BinanceMetrics import metrics
+from BinanceRetry import with_retry, with_retry_sync
+from BinanceScheduler import kline_weight
+
+# Marks the end of the page stream on the queue
+_DONE = object()
+MINUTE_MS = 60_000
+
+class PipelineStats:
+    def __init__(self, symbol, queue_size):
+        self.symbol = symbol
+        self.queue_size = queue_size
+        self.pages = 0
+        self.rows = 0
+        self.fetch_time = 0.0
+        self.write_time = 0.0
+        self.producer_blocked = 0.0  # time spent waiting for room on a full queue
+        self.consumer_idle = 0.0     # time spent waiting for the next page
+        self.max_depth = 0
+        self.depth_total = 0
+        self.started = perf_counter()
+
+    def record_depth(self, depth):
+        self.depth_total += depth
+        self.max_depth = max(self.max_depth, depth)
+
+    def summary(self):
+        elapsed = perf_counter() - self.started
+        avg_depth = self.depth_total / self.pages if self.pages else 0.0
+        rate = self.rows / elapsed if elapsed else 0.0
+        return (
+            f"{self.symbol}: {self.rows} rows in {self.pages} pages, {elapsed:.1f}s ({rate:.0f} rows/sec) | "
+            f"fetch {self.fetch_time:.1f}s, write {self.write_time:.1f}s | "
+            f"queue avg {avg_depth:.1f}/{self.queue_size}, max {self.max_depth} | "
+            f"producer blocked {self.producer_blocked:.1f}s, consumer idle {self.consumer_idle:.1f}s"
+        )
+
+async def fetch_pages(binance, symbol, since, stats=None, limit=1500, delay=1, scheduler=None, retry=None):
+    # With a scheduler the shared weight budget paces the requests instead of a fixed delay.
+    # With a retry policy a failed request is repeated in place, so the pages already queued keep flowing.
+    async def request():
+        if scheduler is not None:
+            await scheduler.acquire(kline_weight(limit))
+        started = perf_counter()
+        tohlcv = await binance.fetch_ohlcv(symbol, timeframe="1m", since=since, limit=limit)
+        elapsed = perf_counter() - started
+        metrics.observe("fetch", elapsed)
+        if stats is not None:
+            stats.fetch_time += elapsed
+        if scheduler is not None:
+            scheduler.observe(binance.last_response_headers)
+        return tohlcv
+
+    while True:
+        tohlcv = await with_retry(request, retry, symbol, scheduler, lambda: binance.last_response_headers)
+        if not tohlcv:
+            return
+
+        yield tohlcv
+        since = tohlcv[-1][0] + 1
+        if delay and scheduler is None:
+            metrics.observe("throttle", delay)
+            await asyncio.sleep(delay)
+
+def fetch_pages_sync(binance, symbol, since, stats=None, limit=1500, delay=1, retry=None):
+    def request():
+        started = perf_counter()
+        tohlcv = binance.fetch_ohlcv(symbol, timeframe="1m", since=since, limit=limit)
+        elapsed = perf_counter() - started
+        metrics.observe("fetch", elapsed)
+        if stats is not None:
+            stats.fetch_time += elapsed
+        return tohlcv
+
+    while True:
+        tohlcv = with_retry_sync(request, retry, symbol, lambda: binance.last_response_headers)
+        if not tohlcv:
+            return
+
+        yield tohlcv
+        since = tohlcv[-1][0] + 1
+        if delay:
+            metrics.observe("throttle", delay)
+            sleep(delay)
+
+def closed_rows(tohlcv):
+    # REST results end with the candle that is still forming; it must not become the watermark
+    open_minute = int(time() * 1000) // MINUTE_MS * MINUTE_MS
+    return [x for x in tohlcv if x[0] < open_minute]
+
+async def closed_pages(pages):
+    async for tohlcv in pages:
+        closed = closed_rows(tohlcv)
+        if closed:
+            yield closed
+        if len(closed) < len(tohlcv):
+            return  # caught up; no further request needed
+
+def closed_pages_sync(pages):
+    for tohlcv in pages:
+        closed = closed_rows(tohlcv)
+        if closed:
+            yield closed
+        if len(closed) < len(tohlcv):
+            return
+
+async def run_pipeline(pages, write, stats, queue_size=4):
+    # Producer downloads page N+1 while the consumer is still writing page N.
+    # The bounded queue stops the producer from running ahead of a slow writer.
+    page_queue = asyncio.Queue(maxsize=queue_size)
+
+    async def produce():
+        try:
+            async for page in pages:
+                started = perf_counter()
+                await page_queue.put(page)
+                stats.producer_blocked += perf_counter() - started
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            await page_queue.put(_DONE)
+            raise
+        await page_queue.put(_DONE)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            started = perf_counter()
+            page = await page_queue.get()
+            stats.consumer_idle += perf_counter() - started
+            if page is _DONE:
+                break
+
+            stats.record_depth(page_queue.qsize())
+            started = perf_counter()
+            await write(page)
+            elapsed = perf_counter() - started
+            metrics.observe("write", elapsed)
+            metrics.record_page(stats.symbol, page)
+            stats.write_time += elapsed
+            stats.pages += 1
+            stats.rows += len(page)
+
+        await producer  # re-raise a fetch error after the pages before it are written
+    finally:
+        if not producer.done():
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+
+async def run_fanout(pages, sinks, stats):
+    # One fetch stream, one bounded queue and writer task per sink. A slow sink only holds
+    # the stream back once its own buffer is full; the other sinks keep writing meanwhile.
+    queues = [asyncio.Queue(maxsize=sink.queue_size) for sink in sinks]
+    errors = []
+
+    async def consume(sink, page_queue):
+        failed = False
+        while True:
+            page = await page_queue.get()
+            if page is _DONE:
+                break
+            if failed:
+                continue  # keep draining so a broken sink never blocks the stream
+            try:
+                await sink.write(page)
+            except Exception as e:
+                print(f"{sink.name} sink for {stats.symbol} failed: {e}")
+                errors.append(e)
+                failed = True
+        if not failed:
+            try:
+                await sink.close()
+            except Exception as e:
+                print(f"{sink.name} sink for {stats.symbol} failed: {e}")
+                errors.append(e)
+
+    consumers = [asyncio.create_task(consume(sink, page_queue)) for sink, page_queue in zip(sinks, queues)]
+    fetch_error = None
+    try:
+        try:
+            async for page in pages:
+                for sink, page_queue in zip(sinks, queues):
+                    started = perf_counter()
+                    await page_queue.put(page)
+                    blocked = perf_counter() - started
+                    sink.blocked += blocked
+                    stats.producer_blocked += blocked
+                stats.pages += 1
+                stats.rows += len(page)
+                stats.record_depth(max(page_queue.qsize() for page_queue in queues))
+                # Counted once every sink has taken the page; each sink times its own writes
+                metrics.record_page(stats.symbol, page)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            fetch_error = e  # the sinks still flush what they were given before it is re-raised
+        for page_queue in queues:
+            await page_queue.put(_DONE)
+        await asyncio.gather(*consumers)
+    finally:
+        for consumer in consumers:
+            if not consumer.done():
+                consumer.cancel()
+        await asyncio.gather(*consumers, return_exceptions=True)
+    if fetch_error is not None:
+        raise fetch_error
+    if errors:
+        raise errors[0]
+
+def run_pipeline_sync(pages, write, stats, queue_size=4):
+    # Threaded variant for the blocking ccxt/psycopg2 exporter: the fetch runs in a
+    # background thread, the writes stay on the calling thread that owns the connection.
+    page_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+
+    def produce():
+        try:
+            for page in pages:
+                if stop.is_set():
+                    return
+                started = perf_counter()
+                page_queue.put(page)
+                stats.producer_blocked += perf_counter() - started
+        except Exception as e:
+            errors.append(e)
+        finally:
+            if not stop.is_set():
+                page_queue.put(_DONE)
+
+    producer = threading.Thread(target=produce, name=f"fetch-{stats.symbol}", daemon=True)
+    producer.start()
+    try:
+        while True:
+            started = perf_counter()
+            page = page_queue.get()
+            stats.consumer_idle += perf_counter() - started
+            if page is _DONE:
+                break
+
+            stats.record_depth(page_queue.qsize())
+            started = perf_counter()
+            write(page)
+            elapsed = perf_counter() - started
+            metrics.observe("write", elapsed)
+            metrics.record_page(stats.symbol, page)
+            stats.write_time += elapsed
+            stats.pages += 1
+            stats.rows += len(page)
+    finally:
+        stop.set()
+        # Unblock a producer stuck on a full queue after a write failure
+        while producer.is_alive():
+            try:
+                page_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        producer.join()
+
+    if errors:
+        raise errors[0]
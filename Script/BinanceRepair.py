@@ -0,0 +1,204 @@
+import asyncio
+import argparse
+import json
+import os
+import asyncpg
+import ccxt.async_support as accxt
+from BinanceBackfill import MINUTE_MS, PAGE_LIMIT, window_pages
+from BinanceCodec import ENCODINGS, NumericEncoding
+from BinanceListing import ListingCache, save_json_atomic
+from BinanceMarkets import MarketCache, load_markets, perpetual_symbols
+from BinanceRetry import add_retry_arguments, make_retry_policy
+from BinanceScheduler import DEFAULT_WEIGHT_LIMIT, WeightScheduler
+from BinanceRollup import enable_rollups
+from BinanceStorage import LAYOUTS, PerSymbolLayout, load_config, make_layout
+
+HOLE_CACHE_FILE = "exchange_holes.json"
+
+class HoleCache:
+    """ Ranges the exchange was asked for and has no candles in, per symbol, persisted as JSON across runs """
+
+    def __init__(self, path=HOLE_CACHE_FILE):
+        self.path = path
+        self.holes = {}
+        if os.path.exists(path):
+            with open(path) as file:
+                self.holes = json.load(file)
+
+    def covers(self, symbol, gap):
+        return any(start <= gap[0] and gap[1] <= end for start, end in self.holes.get(symbol, []))
+
+    def add(self, symbol, holes):
+        if not holes:
+            return
+        known = self.holes.setdefault(symbol, [])
+        known.extend(list(hole) for hole in holes if list(hole) not in known)
+        self.save()
+
+    def save(self):
+        # Holes other processes saved meanwhile are added to this run's
+        def merge(saved):
+            for symbol, holes in saved.items():
+                known = self.holes.setdefault(symbol, [])
+                known.extend(hole for hole in holes if hole not in known)
+            return self.holes
+        save_json_atomic(self.path, merge, indent=1, sort_keys=True)
+
+class RefetchCoverage:
+    """ Spans of a fetch range the exchange returned no candles for, tracked page by page """
+
+    def __init__(self, start, end):
+        self.next = start
+        self.end = end
+        self.missing = []
+
+    def add(self, timestamps):
+        for timestamp in timestamps:
+            if timestamp > self.next:
+                self.missing.append((self.next, timestamp))
+            self.next = max(self.next, timestamp + MINUTE_MS)
+
+    def holes(self, gaps):
+        # Missing spans inside the gaps; the stored candles between merged gaps are not holes
+        spans = self.missing + ([(self.next, self.end)] if self.next < self.end else [])
+        return [
+            (max(start, gap[0]), min(end, gap[1])) for start, end in spans for gap in gaps
+            if max(start, gap[0]) < min(end, gap[1])
+        ]
+
+async def find_gaps(conn, layout, symbol, since=0):
+    # One ordered pass over the (unique-)indexed timestamps; lead() pairs every candle with the next one
+    rows = await conn.fetch(f"""
+        SELECT timestamp + {MINUTE_MS} AS gap_start, next_timestamp AS gap_end
+        FROM (
+            SELECT timestamp, lead(timestamp) OVER (ORDER BY timestamp) AS next_timestamp
+            FROM ({layout.select_sql(symbol)}) AS candles
+            WHERE timestamp >= $1
+        ) AS paired
+        WHERE next_timestamp - timestamp > {MINUTE_MS};
+    """, since)
+    return [(row['gap_start'], row['gap_end']) for row in rows]
+
+def coalesce_gaps(gaps, max_span=PAGE_LIMIT * MINUTE_MS):
+    # Merge nearby holes into the fewest fetch ranges: refetching a few stored candles is
+    # cheaper than another request, and the idempotent upsert skips them.
+    ranges = []
+    for start, end in sorted(gaps):
+        if ranges and end - ranges[-1][0] <= max_span:
+            ranges[-1] = (ranges[-1][0], max(ranges[-1][1], end))
+        else:
+            ranges.append((start, end))
+    return ranges
+
+async def repair_symbol(symbol, binance, pool, layout, scheduler, listing_cache=None, since=0, dry_run=False, retry=None,
+                        hole_cache=None):
+    try:
+        async with pool.acquire() as conn:
+            if not await layout.exists(conn, symbol):
+                return 0
+            await layout.ensure(conn, symbol, binance.market(symbol))
+            await layout.ensure_index(conn, symbol)
+            gaps = await find_gaps(conn, layout, symbol, since)
+            first = await conn.fetchval(f"SELECT min(timestamp) FROM ({layout.select_sql(symbol)}) AS candles;")
+
+        # Candles between the listing and the first stored row are a hole too
+        listing = listing_cache.get(symbol) if listing_cache is not None else None
+        if listing is not None and first is not None and since <= listing < first:
+            gaps.append((listing, first))
+
+        # Holes the exchange itself has are not asked for again
+        known = [gap for gap in gaps if hole_cache is not None and hole_cache.covers(symbol, gap)]
+        gaps = [gap for gap in gaps if gap not in known]
+        ranges = coalesce_gaps(gaps)
+        missing = sum((end - start) // MINUTE_MS for start, end in gaps)
+        print(f"{symbol}: {len(gaps)} gaps, {missing} missing minutes, {len(ranges)} fetch ranges, {len(known)} known exchange holes")
+        if dry_run:
+            return 0
+
+        repaired = 0
+        for start, end in ranges:
+            # A range can span years (e.g. listing to first row), so every page is its own upsert
+            coverage = RefetchCoverage(start, end)
+            async for tohlcv in window_pages(binance, symbol, start, end, scheduler, retry=retry):
+                rows = [(x[0], x[1], x[2], x[3], x[4], x[5]) for x in tohlcv]
+                async with pool.acquire() as conn:
+                    await layout.upsert(conn, symbol, rows)
+                repaired += len(rows)
+                coverage.add(row[0] for row in rows)
+            if hole_cache is not None:
+                hole_cache.add(symbol, coverage.holes([gap for gap in gaps if start <= gap[0] and gap[1] <= end]))
+        print(f"{symbol}: refetched {repaired} rows")
+        return repaired
+
+    except asyncio.CancelledError:
+        print(f"Repair of {symbol} was cancelled.")
+    except asyncpg.PostgresError as e:
+        print(f"Database error repairing {symbol}: {e}")
+    except Exception as e:
+        print(f"An unexpected error occurred repairing {symbol}: {e}")
+    return 0
+
+async def repair(market, db_params, symbols="all", layout_name=PerSymbolLayout.name, suffix="",
+                 encoding_name=NumericEncoding.name, since=0, concurrency=8, weight_limit=DEFAULT_WEIGHT_LIMIT,
+                 dry_run=False, rollups=True, retries=8):
+    pool = await asyncpg.create_pool(**db_params, command_timeout=None, min_size=1, max_size=concurrency)
+    layout = make_layout(layout_name, suffix, encoding_name)
+    if rollups:
+        enable_rollups(layout)
+    binance = accxt.binance({
+        'options': {'defaultType': market},
+        'enableRateLimit': False
+    })
+    scheduler = WeightScheduler(weight_limit)
+    listing_cache = ListingCache()
+    market_cache = MarketCache()
+    hole_cache = HoleCache()
+    retry = make_retry_policy(retries)
+
+    try:
+        async with pool.acquire() as conn:
+            await layout.setup(conn)
+
+        await load_markets(binance, market_cache)
+        if symbols == "all":
+            symbols = perpetual_symbols(binance.markets)
+        else:
+            symbols = symbols.split(",")
+
+        # Scans are bounded by the pool, refetches by the shared weight budget
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded(symbol):
+            async with semaphore:
+                return await repair_symbol(symbol, binance, pool, layout, scheduler, listing_cache, since, dry_run, retry,
+                                           hole_cache)
+
+        repaired = await asyncio.gather(*(bounded(symbol) for symbol in symbols))
+        print(f"Repaired {sum(repaired)} rows across {len(symbols)} symbols. Scheduler: {scheduler.summary()}")
+    finally:
+        await market_cache.wait()
+        await binance.close()
+        await pool.close()
+
+if __name__ == "__main__":
+    db_params = load_config()
+
+    parser = argparse.ArgumentParser(description="Find missing 1m candles in stored series and refetch only those ranges.")
+    parser.add_argument("--market", default="future", type=str)
+    parser.add_argument("--symbols", default="all", type=str)
+    parser.add_argument("--layout", default=PerSymbolLayout.name, choices=list(LAYOUTS))
+    parser.add_argument("--suffix", default="", type=str, help="Per-symbol table suffix, e.g. _FUTURE.")
+    parser.add_argument("--encoding", default=NumericEncoding.name, choices=list(ENCODINGS))
+    parser.add_argument("--no-rollups", dest="rollups", action="store_false", help="Skip refreshing the 5T/10T/1H/1D rollup tables.")
+    parser.add_argument("--since", default=0, type=int, help="Only scan candles at or after this timestamp (ms).")
+    parser.add_argument("--concurrency", default=8, type=int, help="Symbols scanned in parallel.")
+    parser.add_argument("--weight-limit", default=DEFAULT_WEIGHT_LIMIT, type=int)
+    parser.add_argument("--dry-run", action="store_true", help="Report gaps without refetching them.")
+    add_retry_arguments(parser)
+
+    args = parser.parse_args()
+
+    asyncio.run(repair(
+        args.market, db_params, args.symbols, args.layout, args.suffix, args.encoding, args.since,
+        args.concurrency, args.weight_limit, args.dry_run, args.rollups, args.retries
+    ))
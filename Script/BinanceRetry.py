@@ -0,0 +1,146 @@
+import asyncio
+import random
+from time import sleep
+import aiohttp
+import asyncpg
+from ccxt.base.errors import DDoSProtection, NetworkError, RateLimitExceeded
+from BinanceMetrics import metrics
+
+# Error classes: the exchange asks us to wait, something flaked, or retrying cannot help
+BAN = "ban"
+RATE_LIMIT = "rate_limit"
+TRANSIENT = "transient"
+FATAL = "fatal"
+
+# Binance IP bans (418) start at two minutes
+BAN_PAUSE = 120.0
+RETRY_AFTER_HEADER = "retry-after"
+
+TRANSIENT_ERRORS = (
+    NetworkError,
+    aiohttp.ClientError,
+    asyncio.TimeoutError,  # also asyncpg's command_timeout
+    ConnectionError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.InterfaceError,
+    asyncpg.exceptions.OperatorInterventionError,
+    asyncpg.exceptions.TransactionRollbackError,
+    asyncpg.exceptions.InsufficientResourcesError,
+)
+
+def classify(error):
+    # Wrapped driver errors (e.g. SQLAlchemy's DBAPIError) are classified by their cause
+    while error is not None:
+        if isinstance(error, RateLimitExceeded):
+            return RATE_LIMIT
+        if isinstance(error, DDoSProtection):
+            return BAN
+        if isinstance(error, TRANSIENT_ERRORS):
+            return TRANSIENT
+        error = error.__cause__
+    return FATAL
+
+def retry_after(error, headers=None):
+    seconds = getattr(error, 'retry_after', None)
+    if seconds is None and headers:
+        for key, value in headers.items():
+            if key.lower() == RETRY_AFTER_HEADER:
+                seconds = value
+                break
+    try:
+        return float(seconds) if seconds is not None else None
+    except (TypeError, ValueError):
+        return None
+
+class RetryPolicy:
+    """ Jittered exponential backoff; rate limits and bans wait as long as the exchange asks and are not counted """
+
+    def __init__(self, attempts=8, base=0.5, cap=60.0):
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+
+    def backoff(self, attempt):
+        # Full jitter keeps hundreds of symbols from retrying in lockstep
+        return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+    def delay(self, error, attempt, headers=None):
+        """ (error class, seconds to wait), with None seconds when the error must be raised """
+        kind = classify(error)
+        if kind == FATAL:
+            return kind, None
+        if kind in (BAN, RATE_LIMIT):
+            seconds = retry_after(error, headers)
+            if seconds is None:
+                seconds = BAN_PAUSE if kind == BAN else self.cap / 2 + self.backoff(attempt)
+            return kind, seconds
+        if attempt >= self.attempts:
+            return kind, None
+        return kind, self.backoff(attempt)
+
+def exhausted(error):
+    # An error an inner retry layer already gave up on is raised as is by the layers around it,
+    # so nested retries (per request inside per symbol) never multiply their attempts
+    return getattr(error, 'retries_exhausted', False)
+
+def give_up(error):
+    error.retries_exhausted = True
+    return error
+
+async def with_retry(call, policy, label, scheduler=None, headers=None, progress=None):
+    """ Awaits call() until it succeeds; an exchange ban or rate limit pauses every symbol sharing the scheduler.
+        With `progress` (e.g. a count of committed pages) a failure after the call got further starts the backoff over """
+    if policy is None:
+        return await call()
+    attempt = 0
+    mark = progress() if progress else None
+    while True:
+        try:
+            return await call()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if exhausted(e):
+                raise
+            if progress is not None and progress() != mark:
+                attempt, mark = 0, progress()
+            kind, seconds = policy.delay(e, attempt, headers() if headers else None)
+            if seconds is None:
+                raise give_up(e)
+            print(f"{label}: {kind} error, retrying in {seconds:.1f}s: {e}")
+            metrics.observe("backoff", seconds)
+            if kind != TRANSIENT and scheduler is not None:
+                # Circuit breaker: the next acquire() of every task waits until the pause is over
+                scheduler.pause(seconds)
+            else:
+                await asyncio.sleep(seconds)
+            if kind == TRANSIENT:
+                attempt += 1
+
+def with_retry_sync(call, policy, label, headers=None, progress=None):
+    if policy is None:
+        return call()
+    attempt = 0
+    mark = progress() if progress else None
+    while True:
+        try:
+            return call()
+        except Exception as e:
+            if exhausted(e):
+                raise
+            if progress is not None and progress() != mark:
+                attempt, mark = 0, progress()
+            kind, seconds = policy.delay(e, attempt, headers() if headers else None)
+            if seconds is None:
+                raise give_up(e)
+            print(f"{label}: {kind} error, retrying in {seconds:.1f}s: {e}")
+            metrics.observe("backoff", seconds)
+            sleep(seconds)
+            if kind == TRANSIENT:
+                attempt += 1
+
+def make_retry_policy(retries):
+    return RetryPolicy(retries) if retries else None
+
+def add_retry_arguments(parser):
+    parser.add_argument("--retries", default=8, type=int, help="Retries of a transient failure before a symbol gives up; 0 disables retrying.")
@@ -0,0 +1,196 @@
+import re
+import asyncio
+import argparse
+import asyncpg
+import ccxt.async_support as accxt
+from BinanceCodec import ENCODINGS, NumericEncoding
+from BinanceStorage import LAYOUTS, PerSymbolLayout, load_config, make_layout
+
+# The dashboard's higher timeframes; 1T is the stored series itself
+ROLLUPS = {
+    '5T': 300_000,
+    '10T': 600_000,
+    '1H': 3_600_000,
+    '1D': 86_400_000,
+}
+TIMEFRAME_MS = {'1T': 60_000, **ROLLUPS}
+# asyncpg's numbered parameters, each used once and in order, become psycopg2's positional ones
+NUMBERED_PARAMETER = re.compile(r"\$\d+")
+REBUILD_CHUNK_MS = 30 * ROLLUPS['1D']
+
+def aggregate_sql(source_sql, bucket_ms, where):
+    """ Candles bucketed in SQL: first open, max high, min low, last close, summed volume """
+    return f"""
+    SELECT
+        timestamp / {bucket_ms} * {bucket_ms} AS timestamp,
+        (array_agg(open ORDER BY timestamp))[1] AS open,
+        max(high) AS high,
+        min(low) AS low,
+        (array_agg(close ORDER BY timestamp DESC))[1] AS close,
+        sum(volume) AS volume
+    FROM
+        ({source_sql}) AS candles
+    WHERE
+        {where}
+    GROUP BY 1
+    ORDER BY 1
+    """
+
+def bucket_bounds(first_timestamp, last_timestamp, bucket_ms):
+    # Half-open range of every bucket the timestamps touch
+    return first_timestamp // bucket_ms * bucket_ms, (last_timestamp // bucket_ms + 1) * bucket_ms
+
+class Rollups:
+    """ Per-timeframe aggregate tables derived from a layout's 1m candles, refreshed bucket by bucket """
+
+    def __init__(self, layout, timeframes=None):
+        self.layout = layout
+        self.timeframes = timeframes or list(ROLLUPS)
+        self.prefix = layout.rollup_prefix()
+        # Rollups are complete from coverage.since onwards; earlier ranges are aggregated from raw rows
+        self.coverage_table = f"{self.prefix}_coverage"
+        self.registered = set()
+
+    def table(self, timeframe):
+        return f"{self.prefix}_{timeframe.lower()}"
+
+    def setup_sql(self):
+        value_type = self.layout.encoding.rollup_type
+        statements = [f"""
+                CREATE TABLE IF NOT EXISTS {self.table(timeframe)} (
+                    symbol TEXT NOT NULL,
+                    timestamp BIGINT NOT NULL,
+                    open {value_type} NOT NULL,
+                    high {value_type} NOT NULL,
+                    low {value_type} NOT NULL,
+                    close {value_type} NOT NULL,
+                    volume {value_type} NOT NULL,
+                    PRIMARY KEY (symbol, timestamp)
+                );
+            """ for timeframe in self.timeframes]
+        statements.append(f"""
+            CREATE TABLE IF NOT EXISTS {self.coverage_table} (
+                symbol TEXT PRIMARY KEY,
+                since BIGINT NOT NULL
+            );
+        """)
+        return statements
+
+    async def setup(self, conn):
+        for sql in self.setup_sql():
+            await conn.execute(sql)
+
+    def setup_sync(self, cursor):
+        for sql in self.setup_sql():
+            cursor.execute(sql)
+
+    def update_sql(self, symbol, timeframe):
+        bucket_ms = ROLLUPS[timeframe]
+        source = aggregate_sql(self.layout.select_sql(symbol), bucket_ms, "timestamp >= $2 AND timestamp < $3")
+        return f"""
+            INSERT INTO {self.table(timeframe)} (symbol, timestamp, open, high, low, close, volume)
+            SELECT $1::text, timestamp, open, high, low, close, volume FROM ({source}) AS buckets
+            ON CONFLICT (symbol, timestamp) DO UPDATE SET
+                open = EXCLUDED.open, high = EXCLUDED.high, low = EXCLUDED.low,
+                close = EXCLUDED.close, volume = EXCLUDED.volume;
+        """
+
+    async def refresh(self, conn, symbol, first_timestamp, last_timestamp):
+        # Buckets are recomputed from the stored 1m rows, so partial and repeated batches stay exact
+        for timeframe in self.timeframes:
+            start, end = bucket_bounds(first_timestamp, last_timestamp, ROLLUPS[timeframe])
+            await conn.execute(self.update_sql(symbol, timeframe), symbol, start, end)
+
+    def coverage_sql(self):
+        return f"INSERT INTO {self.coverage_table} (symbol, since) VALUES ($1, $2) ON CONFLICT (symbol) DO NOTHING;"
+
+    async def update(self, conn, symbol, first_timestamp, last_timestamp):
+        symbol = self.layout.symbol_key(symbol)
+        await self.refresh(conn, symbol, first_timestamp, last_timestamp)
+        if symbol not in self.registered:
+            await conn.execute(self.coverage_sql(), symbol, first_timestamp)
+            self.registered.add(symbol)
+
+    def update_sync(self, cursor, symbol, first_timestamp, last_timestamp):
+        # Same statements for the psycopg2 writers, run on their cursor before they commit
+        symbol = self.layout.symbol_key(symbol)
+        for timeframe in self.timeframes:
+            start, end = bucket_bounds(first_timestamp, last_timestamp, ROLLUPS[timeframe])
+            cursor.execute(NUMBERED_PARAMETER.sub("%s", self.update_sql(symbol, timeframe)), (symbol, start, end))
+        if symbol not in self.registered:
+            cursor.execute(NUMBERED_PARAMETER.sub("%s", self.coverage_sql()), (symbol, first_timestamp))
+            self.registered.add(symbol)
+
+    async def rebuild(self, conn, symbol):
+        symbol = self.layout.symbol_key(symbol)
+        bounds = await conn.fetchrow(
+            f"SELECT min(timestamp) AS first, max(timestamp) AS last FROM ({self.layout.select_sql(symbol)}) AS candles;"
+        )
+        if bounds['first'] is None:
+            return 0
+
+        # Day-aligned chunks keep each statement's scan and transaction small
+        chunks = 0
+        start = bounds['first'] // ROLLUPS['1D'] * ROLLUPS['1D']
+        while start <= bounds['last']:
+            end = min(start + REBUILD_CHUNK_MS, bounds['last'] + 1)
+            async with conn.transaction():
+                await self.refresh(conn, symbol, start, end - 1)
+            start += REBUILD_CHUNK_MS
+            chunks += 1
+
+        await conn.execute(f"""
+            INSERT INTO {self.coverage_table} (symbol, since) VALUES ($1, $2)
+            ON CONFLICT (symbol) DO UPDATE SET since = LEAST({self.coverage_table}.since, EXCLUDED.since);
+        """, symbol, bounds['first'])
+        return chunks
+
+def enable_rollups(layout, timeframes=None):
+    # The layout refreshes the rollups after every batch it writes
+    layout.rollups = Rollups(layout, timeframes)
+    return layout
+
+async def rebuild(market, db_params, symbols="all", layout_name=PerSymbolLayout.name, suffix="",
+                  encoding_name=NumericEncoding.name, concurrency=4):
+    pool = await asyncpg.create_pool(**db_params, command_timeout=None, min_size=1, max_size=concurrency)
+    layout = enable_rollups(make_layout(layout_name, suffix, encoding_name))
+    binance = accxt.binance({'options': {'defaultType': market}})
+
+    try:
+        async with pool.acquire() as conn:
+            await layout.setup(conn)
+
+        if symbols == "all":
+            await binance.load_markets()
+            symbols = list(binance.markets)
+        else:
+            symbols = symbols.split(",")
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded(symbol):
+            async with semaphore, pool.acquire() as conn:
+                if not await layout.exists(conn, symbol):
+                    return
+                chunks = await layout.rollups.rebuild(conn, symbol)
+                print(f"Rebuilt {', '.join(layout.rollups.timeframes)} rollups for {symbol} in {chunks} chunks")
+
+        await asyncio.gather(*(bounded(symbol) for symbol in symbols))
+    finally:
+        await binance.close()
+        await pool.close()
+
+if __name__ == "__main__":
+    db_params = load_config()
+
+    parser = argparse.ArgumentParser(description="Rebuild rollup tables from the stored 1m history.")
+    parser.add_argument("--market", default="future", type=str, help="Market whose symbols to rebuild when --symbols is 'all'.")
+    parser.add_argument("--symbols", default="all", type=str)
+    parser.add_argument("--layout", default=PerSymbolLayout.name, choices=list(LAYOUTS))
+    parser.add_argument("--suffix", default="", type=str, help="Per-symbol table suffix, e.g. _FUTURE.")
+    parser.add_argument("--encoding", default=NumericEncoding.name, choices=list(ENCODINGS))
+    parser.add_argument("--concurrency", default=4, type=int, help="Symbols rebuilt in parallel.")
+
+    args = parser.parse_args()
+
+    asyncio.run(rebuild(args.market, db_params, args.symbols, args.layout, args.suffix, args.encoding, args.concurrency))
@@ -0,0 +1,104 @@
+import asyncio
+from time import monotonic, time
+from BinanceMetrics import metrics
+
+# Binance USD-M futures allows 2400 request weight per minute per IP
+DEFAULT_WEIGHT_LIMIT = 2400
+USED_WEIGHT_HEADER = "x-mbx-used-weight-1m"
+
+def kline_weight(limit):
+    # Request weight of GET /fapi/v1/klines by page size
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+def used_weight(headers):
+    if not headers:
+        return None
+    for key, value in headers.items():
+        if key.lower() == USED_WEIGHT_HEADER:
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                return None
+    return None
+
+class WeightScheduler:
+    """ Shares the exchange request-weight budget between all symbol tasks """
+
+    def __init__(self, weight_limit=DEFAULT_WEIGHT_LIMIT, utilization=0.9):
+        self.capacity = weight_limit * utilization
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = monotonic()
+        self.window = int(time() // 60)
+        self.window_used = 0
+        self.lock = asyncio.Lock()
+        self.requests = 0
+        self.waited = 0.0
+        self.paused_until = 0.0
+        self.pauses = 0
+
+    def _refill(self):
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _roll_window(self):
+        window = int(time() // 60)
+        if window != self.window:
+            self.window = window
+            self.window_used = 0
+
+    def _delay(self, weight):
+        if self.paused_until > monotonic():
+            return self.paused_until - monotonic()
+        self._refill()
+        self._roll_window()
+        # Binance counts weight in fixed one-minute windows, so a full window has
+        # to wait for the next minute even if the token bucket has refilled.
+        if self.window_used + weight > self.capacity:
+            return (self.window + 1) * 60 - time()
+        if self.tokens < weight:
+            return (weight - self.tokens) / self.rate
+        return 0.0
+
+    async def acquire(self, weight=1):
+        # The lock is FIFO, so page requests are dispatched across symbols in arrival order
+        async with self.lock:
+            delay = self._delay(weight)
+            while delay > 0:
+                self.waited += delay
+                metrics.observe("throttle", delay)
+                await asyncio.sleep(delay)
+                delay = self._delay(weight)
+
+            self.tokens -= weight
+            self.window_used += weight
+            self.requests += 1
+
+    def pause(self, seconds):
+        # Circuit breaker: a 429 or an IP ban applies to every symbol on this IP, so all of them wait
+        self.paused_until = max(self.paused_until, monotonic() + seconds)
+        self.pauses += 1
+
+    def observe(self, headers):
+        used = used_weight(headers)
+        if used is None:
+            return
+
+        # The server's counter is authoritative; it also covers other clients on this IP
+        self._refill()
+        self._roll_window()
+        self.window_used = max(self.window_used, used)
+        self.tokens = min(self.tokens, self.capacity - used)
+
+    def summary(self):
+        return (
+            f"{self.requests} requests, window weight {self.window_used}/{self.capacity:.0f}, throttled {self.waited:.1f}s, "
+            f"{self.pauses} pauses"
+        )
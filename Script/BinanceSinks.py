@@ -0,0 +1,166 @@
+import asyncio
+from time import perf_counter
+from BinanceListing import start_timestamp
+from BinancePipeline import PipelineStats, closed_pages, fetch_pages, run_fanout
+from BinanceKlines import KlineColumns, closed_kline_pages, fetch_kline_pages
+from BinanceMetrics import metrics
+from BinanceRetry import with_retry
+
+class Sink:
+    """ One destination of a fan-out export for one symbol: skips rows it already has and writes in batches """
+
+    name = None
+    accepts_columns = False  # True if write_batch takes KlineColumns as they come from the raw fast path
+
+    def __init__(self, symbol, batch_pages=1, queue_size=4):
+        self.symbol = symbol
+        self.batch_pages = batch_pages
+        self.queue_size = queue_size
+        self.last = None
+        self.pending = []
+        self.rows = 0
+        self.write_time = 0.0
+        self.blocked = 0.0  # time the shared fetch stream waited on this sink's full buffer
+
+    async def open(self):
+        # Timestamp of the newest candle the sink already holds, or None if it is empty
+        return self.last
+
+    async def write_batch(self, pages):
+        raise NotImplementedError
+
+    def fresh(self, page):
+        if isinstance(page, KlineColumns) and not self.accepts_columns:
+            page = page.rows()
+        if self.last is None:
+            return page
+        if isinstance(page, KlineColumns):
+            return page.filter(page.timestamp > self.last)
+        return [row for row in page if row[0] > self.last]
+
+    async def write(self, page):
+        page = self.fresh(page)
+        if not len(page):
+            return
+        self.pending.append(page)
+        if len(self.pending) >= self.batch_pages:
+            await self.flush()
+
+    async def flush(self):
+        if not self.pending:
+            return
+        pages, self.pending = self.pending, []
+        started = perf_counter()
+        await self.write_batch(pages)
+        elapsed = perf_counter() - started
+        metrics.observe(f"write_{self.name}", elapsed)
+        self.write_time += elapsed
+        self.rows += sum(len(page) for page in pages)
+        self.last = pages[-1][-1][0]
+
+    async def close(self):
+        await self.flush()
+
+    def summary(self):
+        return f"{self.name}: {self.rows} rows, write {self.write_time:.1f}s, stream blocked {self.blocked:.1f}s"
+
+class PostgresSink(Sink):
+    name = "postgres"
+    accepts_columns = True
+
+    def __init__(self, symbol, pool, layout, market=None, write_mode="insert", batch_pages=1, queue_size=4):
+        super().__init__(symbol, batch_pages, queue_size)
+        self.pool = pool
+        self.layout = layout
+        self.market = market
+        self.write_mode = write_mode
+
+    async def open(self):
+        async with self.pool.acquire() as conn:
+            await self.layout.ensure(conn, self.symbol, self.market)
+            self.last = await self.layout.watermark(conn, self.symbol)
+        return self.last
+
+    async def write_batch(self, pages):
+        async with self.pool.acquire() as conn:
+            if isinstance(pages[0], KlineColumns):
+                columns = KlineColumns.concat(pages)
+                if self.write_mode == "copy":
+                    await self.layout.copy_columns(conn, self.symbol, columns)
+                else:
+                    await self.layout.insert(conn, self.symbol, columns.rows())
+                return
+            rows = [(x[0], x[1], x[2], x[3], x[4], x[5]) for page in pages for x in page]
+            if self.write_mode == "copy":
+                await self.layout.copy(conn, self.symbol, rows)
+            else:
+                await self.layout.insert(conn, self.symbol, rows)
+
+class CsvFileSink(Sink):
+    name = "csv"
+
+    def __init__(self, symbol, csv_sink, batch_pages=1, queue_size=16):
+        super().__init__(symbol, batch_pages, queue_size)
+        self.csv_sink = csv_sink
+
+    async def open(self):
+        self.last = await asyncio.to_thread(self.csv_sink.last_timestamp)
+        return self.last
+
+    async def write_batch(self, pages):
+        await asyncio.to_thread(self.csv_sink.write, [row for page in pages for row in page])
+
+class ColumnarFileSink(Sink):
+    name = "columnar"
+    accepts_columns = True
+
+    def __init__(self, symbol, columnar_sink, batch_pages=10, queue_size=16):
+        super().__init__(symbol, batch_pages, queue_size)
+        self.columnar_sink = columnar_sink
+
+    async def open(self):
+        self.last = await asyncio.to_thread(self.columnar_sink.last_timestamp, self.symbol)
+        return self.last
+
+    async def write_batch(self, pages):
+        # Several pages per file rewrite keep the per-day files from being rewritten on every page
+        if isinstance(pages[0], KlineColumns):
+            await asyncio.to_thread(self.columnar_sink.write_columns, self.symbol, KlineColumns.concat(pages))
+        else:
+            await asyncio.to_thread(self.columnar_sink.write, self.symbol, [row for page in pages for row in page])
+
+async def export_symbol(symbol, binance, sinks, queue_size=4, scheduler=None, listing_cache=None, raw_klines=False,
+                        closed_only=False, retry=None):
+    """ Fetches a symbol once, from the oldest resume point among the sinks, and fans the pages out to all of them """
+    async def ingest():
+        # A retried run re-opens the sinks, so each resumes from what it actually stored
+        for sink in sinks:
+            sink.pending = []
+        resume = [await sink.open() for sink in sinks]
+        last_timestamp = None if None in resume else min(resume)
+        timestamp = await start_timestamp(binance, symbol, last_timestamp, listing_cache, scheduler)
+
+        stats = PipelineStats(symbol, queue_size)
+        if raw_klines:
+            pages = fetch_kline_pages(binance, symbol, timestamp, stats, delay=0, scheduler=scheduler, retry=retry)
+            if closed_only:
+                pages = closed_kline_pages(pages)
+        else:
+            pages = fetch_pages(binance, symbol, timestamp, stats, delay=0, scheduler=scheduler, retry=retry)
+            if closed_only:
+                pages = closed_pages(pages)
+
+        await run_fanout(pages, sinks, stats)
+        if stats.rows:
+            print(f"Finished {stats.summary()}")
+            print(f"  {' | '.join(sink.summary() for sink in sinks)}")
+
+    try:
+        # Requests already retry in place; this layer covers the sink writes, reset by every batch they store
+        await with_retry(ingest, retry, symbol, scheduler, lambda: binance.last_response_headers,
+                         lambda: sum(sink.rows for sink in sinks))
+
+    except asyncio.CancelledError:
+        print(f"Task for {symbol} was cancelled.")
+    except Exception as e:
+        print(f"An unexpected error occurred with {symbol}: {e}")
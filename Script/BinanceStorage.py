@@ -0,0 +1,454 @@
+import io
+import struct
+import asyncio
+import argparse
+from datetime import datetime, timezone
+import numpy as np
+import asyncpg
+import ccxt.async_support as accxt
+from configparser import ConfigParser
+from BinanceCodec import ENCODINGS, NumericEncoding, ScaledCodec, ScaledEncoding, make_encoding, sql_literal
+
+COLUMNS = ["timestamp", "open", "high", "low", "close", "volume"]
+PGCOPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+PGCOPY_TRAILER = struct.pack("!h", -1)
+
+def binary_copy(fields):
+    """ PostgreSQL binary COPY payload from int64/float64 arrays and constant bytes fields, without per-row objects """
+    count = next(len(field) for field in fields if not isinstance(field, bytes))
+    layout = [("count", ">i2")]
+    for i, field in enumerate(fields):
+        if isinstance(field, bytes):
+            layout += [(f"size{i}", ">i4"), (f"value{i}", f"S{len(field)}")]
+        else:
+            layout += [(f"size{i}", ">i4"), (f"value{i}", ">i8" if field.dtype.kind == "i" else ">f8")]
+
+    records = np.empty(count, dtype=np.dtype(layout))
+    records["count"] = len(fields)
+    for i, field in enumerate(fields):
+        records[f"size{i}"] = len(field) if isinstance(field, bytes) else 8
+        records[f"value{i}"] = field
+    return PGCOPY_HEADER + records.tobytes() + PGCOPY_TRAILER
+
+def timestamp_bounds(rows):
+    timestamps = [row[0] for row in rows]
+    return min(timestamps), max(timestamps)
+
+class Layout:
+    """ Storage layout base: table naming, encoding of the value columns and the write/read SQL """
+
+    name = None
+
+    def __init__(self, encoding=None):
+        self.encoding = encoding or NumericEncoding()
+        self.codecs = {}
+        self.rollups = None  # BinanceRollup.Rollups, refreshed after every written batch
+
+    async def setup(self, conn):
+        if self.rollups is not None:
+            await self.rollups.setup(conn)
+        if isinstance(self.encoding, ScaledEncoding):
+            await conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {ScaledEncoding.scales_table} (
+                    symbol TEXT PRIMARY KEY,
+                    price_digits INT NOT NULL,
+                    volume_digits INT NOT NULL
+                );
+            """)
+
+    async def prepare_codec(self, conn, symbol, market=None):
+        codec = self.encoding.codec(market)
+        key = self.symbol_key(symbol)
+        if codec is None or key in self.codecs:
+            return
+        # Scales are keyed like the layout lists its symbols, so readers that only know the key find them.
+        # Scales saved under the ccxt symbol by earlier runs are copied over, not replaced.
+        if key != symbol:
+            await conn.execute(f"""
+                INSERT INTO {ScaledEncoding.scales_table} (symbol, price_digits, volume_digits)
+                SELECT $1, price_digits, volume_digits FROM {ScaledEncoding.scales_table} WHERE symbol = $2
+                ON CONFLICT (symbol) DO NOTHING;
+            """, key, symbol)
+        # The first scale stored for a symbol wins, so existing rows keep decoding correctly
+        row = await conn.fetchrow(f"""
+            INSERT INTO {ScaledEncoding.scales_table} (symbol, price_digits, volume_digits) VALUES ($1, $2, $3)
+            ON CONFLICT (symbol) DO UPDATE SET symbol = EXCLUDED.symbol
+            RETURNING price_digits, volume_digits;
+        """, key, codec.price_digits, codec.volume_digits)
+        self.codecs[key] = ScaledCodec(row['price_digits'], row['volume_digits'])
+
+    def codec(self, symbol):
+        return self.codecs.get(self.symbol_key(symbol))
+
+    def encode(self, symbol, rows):
+        codec = self.codec(symbol)
+        return codec.encode(rows) if codec is not None else rows
+
+    def symbol_key(self, symbol):
+        # Name a symbol is stored and listed under by this layout
+        return symbol
+
+    async def update_rollups(self, conn, symbol, first_timestamp, last_timestamp):
+        if self.rollups is not None:
+            await self.rollups.update(conn, symbol, first_timestamp, last_timestamp)
+
+    async def copy_columns(self, conn, symbol, columns):
+        # Binary COPY straight from KlineColumns; encodings without a binary form fall back to records
+        if not len(columns):
+            return
+        values = self.encoding.binary_columns(columns, self.codec(symbol))
+        if values is None:
+            await self.copy(conn, symbol, columns.rows())
+            return
+        await self.copy_binary(conn, symbol, columns, values)
+
+    def scales_join(self, symbol):
+        if not isinstance(self.encoding, ScaledEncoding):
+            return ""
+        return (
+            f" CROSS JOIN (SELECT price_digits, volume_digits FROM {ScaledEncoding.scales_table}"
+            f" WHERE symbol = {sql_literal(self.symbol_key(symbol))}) scales"
+        )
+
+class PerSymbolLayout(Layout):
+    """ One table per symbol, e.g. "BTCUSDT" or "BTCUSDT_FUTURE", indexed on timestamp once rollups or repairs need it """
+
+    name = "per-symbol"
+
+    def __init__(self, suffix="", encoding=None):
+        super().__init__(encoding)
+        self.suffix = suffix
+
+    def table(self, symbol):
+        return f"{symbol.replace('/', '')}{self.suffix}{self.encoding.suffix}"
+
+    def rollup_prefix(self):
+        return f"rollup{self.suffix.lower()}{self.encoding.suffix}"
+
+    def symbol_key(self, symbol):
+        # Table names drop the '/', so listed tables map back to e.g. "BTCUSDT:USDT", which table() accepts as well
+        return symbol.replace('/', '')
+
+    def symbols_sql(self):
+        # Per-symbol tables are recognised by their exact column set and name suffix
+        ending = f"{self.suffix}{self.encoding.suffix}"
+        return f"""
+            SELECT left(table_name, length(table_name) - {len(ending)}) FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name LIKE {sql_literal('%' + ending)}
+            GROUP BY table_name
+            HAVING array_agg(column_name::text ORDER BY column_name) = ARRAY['close', 'high', 'low', 'open', 'timestamp', 'volume']
+            ORDER BY 1;
+        """
+
+    async def ensure(self, conn, symbol, market=None):
+        sql_type = self.encoding.sql_type
+        await conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS "{self.table(symbol)}" (
+                timestamp BIGINT,
+                open {sql_type},
+                high {sql_type},
+                low {sql_type},
+                close {sql_type},
+                volume {sql_type}
+            );
+        """)
+        await self.prepare_codec(conn, symbol, market)
+        if self.rollups is not None:
+            # Every write refreshes its rollup buckets with a timestamp range scan
+            await self.ensure_index(conn, symbol)
+
+    async def exists(self, conn, symbol):
+        return await conn.fetchval("SELECT to_regclass($1) IS NOT NULL;", f'"{self.table(symbol)}"')
+
+    def index_sql(self, symbol):
+        # Repairs need ordered scans and ON CONFLICT, so drop duplicate rows and add a unique index
+        table = self.table(symbol)
+        return [
+            f"""
+                DELETE FROM "{table}" a USING "{table}" b
+                WHERE a.timestamp = b.timestamp AND a.ctid > b.ctid
+                AND NOT EXISTS (SELECT 1 FROM pg_indexes WHERE indexname = '{table}_timestamp_key');
+            """,
+            f'CREATE UNIQUE INDEX IF NOT EXISTS "{table}_timestamp_key" ON "{table}" (timestamp);',
+        ]
+
+    async def ensure_index(self, conn, symbol):
+        async with conn.transaction():
+            for sql in self.index_sql(symbol):
+                await conn.execute(sql)
+
+    async def ensure_read_index(self, conn, symbol):
+        # Readers never deduplicate: they add a plain index only when the table has no timestamp index at all
+        table = self.table(symbol)
+        indexed = await conn.fetchval(
+            "SELECT EXISTS (SELECT 1 FROM pg_indexes WHERE tablename = $1 AND indexname IN ($2, $3));",
+            table, f"{table}_timestamp_key", f"{table}_timestamp_idx"
+        )
+        if not indexed:
+            await conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}_timestamp_idx" ON "{table}" (timestamp);')
+
+    def watermark_sql(self, symbol):
+        return f"SELECT max(timestamp) FROM \"{self.table(symbol)}\";"
+
+    async def watermark(self, conn, symbol):
+        return await conn.fetchval(self.watermark_sql(symbol))
+
+    async def insert(self, conn, symbol, rows):
+        # Each page commits with its rollups, so the table's max(timestamp) is a consistent resume point
+        async with conn.transaction():
+            await conn.executemany(
+                f"INSERT INTO \"{self.table(symbol)}\" (timestamp, open, high, low, close, volume) VALUES ($1, $2, $3, $4, $5, $6);",
+                self.encode(symbol, rows)
+            )
+            await self.update_rollups(conn, symbol, *timestamp_bounds(rows))
+
+    async def upsert(self, conn, symbol, rows):
+        async with conn.transaction():
+            await conn.executemany(
+                f"INSERT INTO \"{self.table(symbol)}\" (timestamp, open, high, low, close, volume) "
+                f"VALUES ($1, $2, $3, $4, $5, $6) ON CONFLICT (timestamp) DO NOTHING;",
+                self.encode(symbol, rows)
+            )
+            await self.update_rollups(conn, symbol, *timestamp_bounds(rows))
+
+    async def copy(self, conn, symbol, rows):
+        # Binary COPY: one round-trip for the whole batch instead of one per row
+        async with conn.transaction():
+            await conn.copy_records_to_table(self.table(symbol), records=self.encode(symbol, rows), columns=COLUMNS)
+            await self.update_rollups(conn, symbol, *timestamp_bounds(rows))
+
+    async def copy_binary(self, conn, symbol, columns, values):
+        payload = binary_copy([columns.timestamp, *values])
+        async with conn.transaction():
+            await conn.copy_to_table(self.table(symbol), source=io.BytesIO(payload), columns=COLUMNS, format="binary")
+            await self.update_rollups(conn, symbol, int(columns.timestamp.min()), int(columns.timestamp.max()))
+
+    def select_sql(self, symbol):
+        # Decoded (timestamp, open, high, low, close, volume) rows; callers add the WHERE clause
+        columns = self.encoding.select_columns("t")
+        return f"SELECT {columns} FROM \"{self.table(symbol)}\" t{self.scales_join(symbol)}"
+
+class PartitionedLayout(Layout):
+    """ Single "ohlcv" table range-partitioned by month on timestamp, keyed by (symbol, timestamp) """
+
+    name = "partitioned"
+
+    def __init__(self, encoding=None):
+        super().__init__(encoding)
+        self.table_name = f"ohlcv{self.encoding.suffix}"
+        self.watermark_table = f"{self.table_name}_watermarks"
+        self.partitions = set()
+        self.partition_lock = asyncio.Lock()
+
+    def rollup_prefix(self):
+        return f"{self.table_name}_rollup"
+
+    def symbols_sql(self):
+        return f"SELECT symbol FROM {self.watermark_table} ORDER BY symbol;"
+
+    async def setup(self, conn):
+        await super().setup(conn)
+        sql_type = self.encoding.sql_type
+        await conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.table_name} (
+                symbol TEXT NOT NULL,
+                timestamp BIGINT NOT NULL,
+                open {sql_type} NOT NULL,
+                high {sql_type} NOT NULL,
+                low {sql_type} NOT NULL,
+                close {sql_type} NOT NULL,
+                volume {sql_type} NOT NULL,
+                PRIMARY KEY (symbol, timestamp)
+            ) PARTITION BY RANGE (timestamp);
+        """)
+        # Cross-symbol time scans use BRIN; per-symbol reads use the primary key
+        await conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table_name}_timestamp_brin ON {self.table_name} USING brin (timestamp);")
+        # Written in the same transaction as the candles, so the watermark is one primary-key lookup
+        await conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.watermark_table} (
+                symbol TEXT PRIMARY KEY,
+                timestamp BIGINT NOT NULL
+            );
+        """)
+        rows = await conn.fetch(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass($1);",
+            self.table_name
+        )
+        self.partitions.update(row['relname'] for row in rows)
+
+    async def ensure(self, conn, symbol, market=None):
+        await self.prepare_codec(conn, symbol, market)
+
+    async def ensure_partitions(self, conn, first_timestamp, last_timestamp):
+        for name, start, end in month_partitions(self.table_name, first_timestamp, last_timestamp):
+            if name in self.partitions:
+                continue
+            async with self.partition_lock:
+                if name in self.partitions:
+                    continue
+                try:
+                    await conn.execute(
+                        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {self.table_name} FOR VALUES FROM ({start}) TO ({end});"
+                    )
+                except (asyncpg.DuplicateTableError, asyncpg.UniqueViolationError):
+                    pass  # created concurrently by another process
+                self.partitions.add(name)
+
+    async def exists(self, conn, symbol):
+        return await self.watermark(conn, symbol) is not None
+
+    async def ensure_index(self, conn, symbol):
+        pass  # the (symbol, timestamp) primary key already covers ordered scans and upserts
+
+    async def ensure_read_index(self, conn, symbol):
+        pass
+
+    def watermark_sql(self, symbol):
+        return f"SELECT timestamp FROM {self.watermark_table} WHERE symbol = {sql_literal(symbol)};"
+
+    async def watermark(self, conn, symbol):
+        return await conn.fetchval(self.watermark_sql(symbol))
+
+    async def advance_watermark(self, conn, symbol, timestamp):
+        await conn.execute(f"""
+            INSERT INTO {self.watermark_table} (symbol, timestamp) VALUES ($1, $2)
+            ON CONFLICT (symbol) DO UPDATE SET timestamp = GREATEST({self.watermark_table}.timestamp, EXCLUDED.timestamp);
+        """, symbol, timestamp)
+
+    async def insert(self, conn, symbol, rows):
+        await self.ensure_partitions(conn, rows[0][0], rows[-1][0])
+        async with conn.transaction():
+            await conn.executemany(
+                f"INSERT INTO {self.table_name} (symbol, timestamp, open, high, low, close, volume) "
+                f"VALUES ($1, $2, $3, $4, $5, $6, $7) ON CONFLICT DO NOTHING;",
+                [(symbol, *row) for row in self.encode(symbol, rows)]
+            )
+            await self.advance_watermark(conn, symbol, rows[-1][0])
+            await self.update_rollups(conn, symbol, *timestamp_bounds(rows))
+
+    async def upsert(self, conn, symbol, rows):
+        await self.insert(conn, symbol, rows)
+
+    async def copy(self, conn, symbol, rows):
+        await self.ensure_partitions(conn, rows[0][0], rows[-1][0])
+        async with conn.transaction():
+            await conn.copy_records_to_table(
+                self.table_name, records=[(symbol, *row) for row in self.encode(symbol, rows)], columns=["symbol"] + COLUMNS
+            )
+            await self.advance_watermark(conn, symbol, rows[-1][0])
+            await self.update_rollups(conn, symbol, *timestamp_bounds(rows))
+
+    async def copy_binary(self, conn, symbol, columns, values):
+        first_timestamp, last_timestamp = int(columns.timestamp.min()), int(columns.timestamp.max())
+        await self.ensure_partitions(conn, first_timestamp, last_timestamp)
+        payload = binary_copy([symbol.encode(), columns.timestamp, *values])
+        async with conn.transaction():
+            await conn.copy_to_table(self.table_name, source=io.BytesIO(payload), columns=["symbol"] + COLUMNS, format="binary")
+            await self.advance_watermark(conn, symbol, last_timestamp)
+            await self.update_rollups(conn, symbol, first_timestamp, last_timestamp)
+
+    def select_sql(self, symbol):
+        columns = self.encoding.select_columns("t")
+        return f"SELECT {columns} FROM {self.table_name} t{self.scales_join(symbol)} WHERE t.symbol = {sql_literal(symbol)}"
+
+LAYOUTS = {
+    PerSymbolLayout.name: PerSymbolLayout,
+    PartitionedLayout.name: PartitionedLayout,
+}
+
+def make_layout(name, suffix="", encoding_name=NumericEncoding.name):
+    encoding = make_encoding(encoding_name)
+    if name == PerSymbolLayout.name:
+        return PerSymbolLayout(suffix, encoding)
+    return LAYOUTS[name](encoding)
+
+def month_partitions(table_name, first_timestamp, last_timestamp):
+    first = datetime.fromtimestamp(first_timestamp / 1000, tz=timezone.utc)
+    last = datetime.fromtimestamp(last_timestamp / 1000, tz=timezone.utc)
+    year, month = first.year, first.month
+    partitions = []
+    while (year, month) <= (last.year, last.month):
+        next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+        start = int(datetime(year, month, 1, tzinfo=timezone.utc).timestamp() * 1000)
+        end = int(datetime(next_year, next_month, 1, tzinfo=timezone.utc).timestamp() * 1000)
+        partitions.append((f"{table_name}_{year}{month:02d}", start, end))
+        year, month = next_year, next_month
+    return partitions
+
+async def migrate_table(conn, layout, table_name, symbol, market=None):
+    bounds = await conn.fetchrow(f"SELECT min(timestamp) AS first, max(timestamp) AS last FROM \"{table_name}\";")
+    if bounds['first'] is None:
+        return 0
+
+    await layout.ensure(conn, symbol, market)
+    columns = layout.encoding.convert_columns(layout.codec(symbol))
+
+    # One month per statement keeps transactions and partition routing small
+    migrated = 0
+    for name, start, end in month_partitions(layout.table_name, bounds['first'], bounds['last']):
+        await layout.ensure_partitions(conn, start, start)
+        async with conn.transaction():
+            status = await conn.execute(f"""
+                INSERT INTO {layout.table_name} (symbol, timestamp, open, high, low, close, volume)
+                SELECT $1, timestamp, {columns} FROM "{table_name}"
+                WHERE timestamp >= $2 AND timestamp < $3
+                ON CONFLICT DO NOTHING;
+            """, symbol, start, end)
+        migrated += int(status.split()[-1])
+
+    await layout.advance_watermark(conn, symbol, bounds['last'])
+    return migrated
+
+async def migrate(market, db_params, suffix="", encoding_name=NumericEncoding.name):
+    conn = await asyncpg.connect(**db_params, command_timeout=None)
+    binance = accxt.binance({'options': {'defaultType': market}})
+    try:
+        await binance.load_markets()
+        symbols = {f"{symbol.replace('/', '')}{suffix}": symbol for symbol in binance.markets}
+
+        layout = PartitionedLayout(make_encoding(encoding_name))
+        await layout.setup(conn)
+
+        # Per-symbol tables are recognised by their exact column set
+        tables = await conn.fetch("""
+            SELECT table_name FROM information_schema.columns
+            WHERE table_schema = 'public'
+            GROUP BY table_name
+            HAVING array_agg(column_name::text ORDER BY column_name) = ARRAY['close', 'high', 'low', 'open', 'timestamp', 'volume'];
+        """)
+        for row in tables:
+            table_name = row['table_name']
+            if table_name not in symbols:
+                print(f"Skipping {table_name}: no {market} market matches it")
+                continue
+            symbol = symbols[table_name]
+            migrated = await migrate_table(conn, layout, table_name, symbol, binance.markets[symbol])
+            print(f"Migrated {migrated} rows from {table_name} to {layout.table_name} as {symbol}")
+    finally:
+        await binance.close()
+        await conn.close()
+
+def load_config(filename='../database.ini', section='postgresql'):
+    parser = ConfigParser()
+    parser.read(filename)
+    db_params = {}
+    if parser.has_section(section):
+        items = parser.items(section)
+        for item in items:
+            db_params[item[0]] = item[1]
+    else:
+        raise Exception(f'Section {section} not found in the {filename} file')
+
+    return db_params
+
+if __name__ == "__main__":
+    db_params = load_config()
+
+    parser = argparse.ArgumentParser(description="Copy per-symbol OHLCV tables into the partitioned ohlcv table.")
+    parser.add_argument("--market", default="future", type=str, help="Market whose symbols the per-symbol tables were named after.")
+    parser.add_argument("--suffix", default="", type=str, help="Table name suffix of the source tables, e.g. _FUTURE.")
+    parser.add_argument("--encoding", default=NumericEncoding.name, choices=list(ENCODINGS), help="Column encoding of the target table.")
+
+    args = parser.parse_args()
+
+    asyncio.run(migrate(args.market, db_params, args.suffix, args.encoding))
@@ -0,0 +1,299 @@
+import asyncio
+import argparse
+import json
+import os
+import shutil
+from time import perf_counter
+import asyncpg
+import numpy as np
+from BinanceCodec import ENCODINGS, NumericEncoding
+from BinanceColumnar import DAY_MS, EXTENSIONS, day_files, read_columns, symbol_dir
+from BinanceKlines import MINUTE_MS, KlineColumns
+from BinanceStorage import LAYOUTS, PerSymbolLayout, load_config, make_layout
+
+CHUNK_ROWS = 100_000
+CHUNK_DAYS = 30
+WINDOWS = (15, 60, 240)
+FEATURE_DTYPE = np.float32
+
+def chunk_columns(values):
+    # Rows from the store (NUMERIC arrives as Decimal) converted in one pass; ms timestamps are exact in float64
+    table = np.array(values, dtype=np.float64).reshape(-1, 6)
+    return KlineColumns(table[:, 0].astype(np.int64), *(np.ascontiguousarray(table[:, i]) for i in range(1, 6)))
+
+async def postgres_chunks(conn, layout, symbol, start=None, end=None, chunk_rows=CHUNK_ROWS):
+    """ The stored 1m history in timestamp order, CHUNK_ROWS at a time by keyset on the timestamp index """
+    # Per-symbol tables only get the unique index from rollups or repairs; without any index every page is a
+    # full sort, so a plain one is added. The stored rows are left as they are.
+    await layout.ensure_read_index(conn, symbol)
+    query = f"""
+        SELECT timestamp, open, high, low, close, volume FROM ({layout.select_sql(symbol)}) AS candles
+        WHERE timestamp > $1 AND timestamp < $2 ORDER BY timestamp LIMIT $3;
+    """
+    last = start - 1 if start is not None else -1
+    end = end if end is not None else 2 ** 62
+    while True:
+        rows = await conn.fetch(query, last, end, chunk_rows)
+        if not rows:
+            return
+        columns = chunk_columns(rows)
+        yield columns
+        if len(rows) < chunk_rows:
+            return
+        last = int(columns.timestamp[-1])
+
+async def columnar_chunks(root, symbol, start=None, end=None, chunk_days=CHUNK_DAYS, file_format="parquet"):
+    """ Same stream from the per-day columnar files, CHUNK_DAYS files per read """
+    files = day_files(root, symbol, file_format)
+    if not files:
+        return
+    first = int(np.datetime64(os.path.basename(files[0])[:10], "ms").astype(np.int64))
+    last = int(np.datetime64(os.path.basename(files[-1])[:10], "ms").astype(np.int64)) + DAY_MS
+    first = max(first, start) if start is not None else first
+    last = min(last, end) if end is not None else last
+    for chunk_start in range(first, last, chunk_days * DAY_MS):
+        chunk_end = min(chunk_start + chunk_days * DAY_MS, last)
+        data = await asyncio.to_thread(read_columns, root, symbol, chunk_start, chunk_end, None, file_format)
+        if len(data["timestamp"]):
+            yield KlineColumns(*(data[name] for name in KlineColumns.fields))
+
+class RollingSum:
+    """ Sums over the last `window` rows of one or more series, carried across chunk boundaries """
+
+    def __init__(self, window, width=1):
+        self.window = window
+        self.tail = np.empty((0, width))
+
+    def update(self, values):
+        # NaN until a full window has been seen and while it holds a NaN/inf row, which would
+        # otherwise poison every later difference of the cumulative sum
+        joined = np.concatenate([self.tail, values])
+        finite = np.isfinite(joined)
+        cumulative = np.concatenate([np.zeros((1, joined.shape[1])), np.cumsum(np.where(finite, joined, 0), axis=0)])
+        invalid = np.concatenate([[0], np.cumsum(~finite.all(axis=1))])
+        ends = np.arange(len(self.tail) + 1, len(joined) + 1)
+        starts = ends - self.window
+        sums = np.full(values.shape, np.nan)
+        full = starts >= 0
+        full[full] = invalid[ends[full]] == invalid[starts[full]]
+        sums[full] = cumulative[ends[full]] - cumulative[starts[full]]
+        self.tail = joined[len(joined) - min(len(joined), self.window - 1):]
+        return sums
+
+class FeaturePipeline:
+    """ Per-candle features computed chunk by chunk with NumPy; carries the previous candle and window tails between chunks """
+
+    def __init__(self, windows=WINDOWS):
+        self.windows = tuple(windows)
+        self.previous_timestamp = None
+        self.previous_close = np.nan
+        # Per window: sums of (log return, squared log return) and of (price * volume, volume)
+        self.returns = {window: RollingSum(window, 2) for window in self.windows}
+        self.vwap = {window: RollingSum(window, 2) for window in self.windows}
+
+    @property
+    def names(self):
+        names = ["log_return", "hl_range", "log_volume"]
+        for window in self.windows:
+            names += [f"momentum_{window}", f"volatility_{window}", f"vwap_gap_{window}"]
+        return names
+
+    def update(self, columns):
+        close = columns.close
+        previous = np.concatenate([[self.previous_close], close[:-1]])
+        # A missing minute restarts every window: the candle after a hole has no return and no VWAP contribution
+        after_gap = np.concatenate([[True], np.diff(columns.timestamp) != MINUTE_MS])
+        if self.previous_timestamp is not None:
+            after_gap[0] = columns.timestamp[0] - self.previous_timestamp != MINUTE_MS
+        self.previous_close = close[-1]
+        self.previous_timestamp = int(columns.timestamp[-1])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_return = np.where(after_gap, np.nan, np.log(close / previous))
+            features = [log_return, np.log(columns.high / columns.low), np.log1p(columns.volume)]
+            typical = np.where(after_gap, np.nan, (columns.high + columns.low + close) / 3)
+            for window in self.windows:
+                returns = self.returns[window].update(np.column_stack([log_return, log_return * log_return]))
+                variance = (returns[:, 1] - returns[:, 0] ** 2 / window) / (window - 1) if window > 1 else np.zeros(len(close))
+                money = self.vwap[window].update(np.column_stack([typical * columns.volume, columns.volume]))
+                features += [returns[:, 0], np.sqrt(np.maximum(variance, 0)), close / (money[:, 0] / money[:, 1]) - 1]
+        return np.column_stack(features).astype(FEATURE_DTYPE)
+
+class FeatureWriter:
+    """ Appends feature chunks to raw files under <root>/<SYMBOL>/, published with meta.json once complete """
+
+    def __init__(self, root, symbol, names):
+        self.directory = symbol_dir(root, symbol)
+        self.building = f"{self.directory}.building"
+        self.symbol = symbol
+        self.names = names
+        self.rows = 0
+        # Running moments for standardising features when batches are drawn
+        self.count = np.zeros(len(names))
+        self.total = np.zeros(len(names))
+        self.squares = np.zeros(len(names))
+        shutil.rmtree(self.building, ignore_errors=True)
+        os.makedirs(self.building)
+        self.features = open(os.path.join(self.building, "features.bin"), "wb")
+        self.timestamps = open(os.path.join(self.building, "timestamp.bin"), "wb")
+
+    def write(self, timestamp, features):
+        self.features.write(np.ascontiguousarray(features, FEATURE_DTYPE).tobytes())
+        self.timestamps.write(np.ascontiguousarray(timestamp, np.int64).tobytes())
+        finite = np.isfinite(features)
+        values = np.where(finite, features, 0).astype(np.float64)
+        self.count += finite.sum(axis=0)
+        self.total += values.sum(axis=0)
+        self.squares += (values * values).sum(axis=0)
+        self.rows += len(timestamp)
+
+    def close(self):
+        self.features.close()
+        self.timestamps.close()
+        count = np.maximum(self.count, 1)
+        mean = self.total / count
+        std = np.sqrt(np.maximum(self.squares / count - mean * mean, 0))
+        with open(os.path.join(self.building, "meta.json"), "w") as file:
+            json.dump({
+                'symbol': self.symbol, 'rows': self.rows, 'features': self.names,
+                'dtype': np.dtype(FEATURE_DTYPE).name, 'mean': mean.tolist(), 'std': std.tolist(),
+            }, file)
+        # Readers only ever see a complete dataset
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.replace(self.building, self.directory)
+
+    def abort(self):
+        self.features.close()
+        self.timestamps.close()
+        shutil.rmtree(self.building, ignore_errors=True)
+
+async def build_features(chunks, root, symbol, windows=WINDOWS):
+    """ Streams a symbol's chunks through the features into memory-mapped files; memory stays at one chunk """
+    pipeline = FeaturePipeline(windows)
+    writer = FeatureWriter(root, symbol, pipeline.names)
+    try:
+        async for columns in chunks:
+            writer.write(columns.timestamp, pipeline.update(columns))
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    return writer.rows
+
+class FeatureSet:
+    """ A symbol's features and timestamps as read-only memory maps """
+
+    def __init__(self, root, symbol):
+        directory = symbol_dir(root, symbol)
+        with open(os.path.join(directory, "meta.json")) as file:
+            self.meta = json.load(file)
+        self.symbol = symbol
+        self.names = self.meta['features']
+        rows = self.meta['rows']
+        shape = (rows, len(self.names))
+        self.features = np.memmap(os.path.join(directory, "features.bin"), self.meta['dtype'], "r", shape=shape) if rows else np.empty(shape, FEATURE_DTYPE)
+        self.timestamp = np.memmap(os.path.join(directory, "timestamp.bin"), np.int64, "r", shape=(rows,)) if rows else np.empty(0, np.int64)
+        self.mean = np.array(self.meta['mean'], FEATURE_DTYPE)
+        self.std = np.array(self.meta['std'], FEATURE_DTYPE)
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def invalid_rows(self, chunk_rows=CHUNK_ROWS):
+        # Running count of rows with a NaN/inf feature (window warm-up, zero volume), scanned chunk by chunk
+        invalid = np.zeros(len(self) + 1, np.int64)
+        for start in range(0, len(self), chunk_rows):
+            rows = self.features[start:start + chunk_rows]
+            invalid[start + 1:start + 1 + len(rows)] = ~np.isfinite(rows).all(axis=1)
+        return np.cumsum(invalid)
+
+    def window_ends(self, lookback, horizon):
+        # Last row of every window whose lookback and target minutes are all stored, without gaps or invalid features
+        if len(self) < lookback + horizon:
+            return np.empty(0, np.int64)
+        ends = np.arange(lookback - 1, len(self) - horizon)
+        first, last = ends - lookback + 1, ends + horizon
+        contiguous = self.timestamp[last] - self.timestamp[first] == (lookback - 1 + horizon) * MINUTE_MS
+        invalid = self.invalid_rows()
+        return ends[contiguous & (invalid[last + 1] == invalid[first])]
+
+def window_batches(root, symbols, lookback=60, horizon=1, batch_size=256, shuffle=True, seed=0, normalize=True):
+    """ (X, y, symbols) batches: X is (batch, lookback, features), y the log return over the next horizon minutes """
+    # Symbols are visited one at a time, so only one symbol's window index and one batch are ever in memory
+    rng = np.random.default_rng(seed)
+    symbols = list(symbols)
+    if shuffle:
+        rng.shuffle(symbols)
+    for symbol in symbols:
+        dataset = FeatureSet(root, symbol)
+        ends = dataset.window_ends(lookback, horizon)
+        if shuffle:
+            rng.shuffle(ends)
+        log_return = dataset.features[:, dataset.names.index("log_return")]
+        for start in range(0, len(ends), batch_size):
+            batch = np.sort(ends[start:start + batch_size])  # ascending rows keep the page faults sequential
+            offsets = batch[:, None] + np.arange(-lookback + 1, 1)
+            x = np.asarray(dataset.features[offsets])
+            if normalize:
+                x = (x - dataset.mean) / np.where(dataset.std > 0, dataset.std, 1)
+            y = np.asarray(log_return[batch[:, None] + np.arange(1, horizon + 1)].sum(axis=1))
+            yield x, y, np.full(len(batch), symbol)
+
+async def build(db_params, root, symbols="all", source="postgres", layout_name=PerSymbolLayout.name, suffix="",
+                encoding_name=NumericEncoding.name, columnar_root="columnar", columnar_format="parquet", windows=WINDOWS,
+                chunk_rows=CHUNK_ROWS, concurrency=4):
+    layout = make_layout(layout_name, suffix, encoding_name)
+    pool = await asyncpg.create_pool(**db_params, command_timeout=None, min_size=1, max_size=concurrency) if source == "postgres" else None
+
+    try:
+        if symbols == "all":
+            if pool is not None:
+                async with pool.acquire() as conn:
+                    symbols = [row[0] for row in await conn.fetch(layout.symbols_sql())]
+            else:
+                symbols = sorted(os.listdir(columnar_root)) if os.path.isdir(columnar_root) else []
+        else:
+            symbols = symbols.split(",")
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded(symbol):
+            async with semaphore:
+                started = perf_counter()
+                try:
+                    if pool is not None:
+                        async with pool.acquire() as conn:
+                            rows = await build_features(postgres_chunks(conn, layout, symbol, chunk_rows=chunk_rows), root, symbol, windows)
+                    else:
+                        rows = await build_features(columnar_chunks(columnar_root, symbol, file_format=columnar_format), root, symbol, windows)
+                    print(f"{symbol}: {rows} rows of features in {perf_counter() - started:.1f}s")
+                except asyncio.CancelledError:
+                    print(f"Task for {symbol} was cancelled.")
+                except Exception as e:
+                    print(f"An unexpected error occurred with {symbol}: {e}")
+
+        await asyncio.gather(*(bounded(symbol) for symbol in symbols))
+    finally:
+        if pool is not None:
+            await pool.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build memory-mapped training features from the stored 1m history.")
+    parser.add_argument("--output", default="features", type=str, help="Root directory of the per-symbol feature files.")
+    parser.add_argument("--symbols", default="all", type=str)
+    parser.add_argument("--source", default="postgres", choices=["postgres", "columnar"])
+    parser.add_argument("--layout", default=PerSymbolLayout.name, choices=list(LAYOUTS))
+    parser.add_argument("--suffix", default="", type=str, help="Per-symbol table suffix, e.g. _FUTURE.")
+    parser.add_argument("--encoding", default=NumericEncoding.name, choices=list(ENCODINGS))
+    parser.add_argument("--columnar-root", default="columnar", type=str)
+    parser.add_argument("--columnar-format", default="parquet", choices=list(EXTENSIONS))
+    parser.add_argument("--windows", default=",".join(map(str, WINDOWS)), type=str, help="Rolling windows in minutes.")
+    parser.add_argument("--chunk-rows", default=CHUNK_ROWS, type=int, help="Candles read and transformed per step.")
+    parser.add_argument("--concurrency", default=4, type=int, help="Symbols built in parallel.")
+
+    args = parser.parse_args()
+    db_params = load_config() if args.source == "postgres" else None
+
+    asyncio.run(build(
+        db_params, args.output, args.symbols, args.source, args.layout, args.suffix, args.encoding, args.columnar_root,
+        args.columnar_format, tuple(int(window) for window in args.windows.split(",")), args.chunk_rows, args.concurrency
+    ))
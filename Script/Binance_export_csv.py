@@ -1,67 +1,79 @@
 import asyncio
 import ccxt.async_support as accxt
 import argparse
-import csv
-from datetime import datetime
+from BinanceColumnar import EXTENSIONS, ColumnarSink
+from BinanceCsv import COMPRESSIONS, CsvSink, compression_argument
+from BinanceListing import ListingCache
+from BinanceMarkets import MarketCache, load_markets
+from BinanceSinks import ColumnarFileSink, CsvFileSink, export_symbol
+from BinanceScheduler import DEFAULT_WEIGHT_LIMIT, WeightScheduler
+from BinanceMetrics import add_metrics_arguments, metrics
+from BinanceRetry import add_retry_arguments, make_retry_policy
 
 SYMBOLS_TO_DOWNLOAD = ["BTC/USDT", "SOL/USDT", "ETH/USDT"]
 
-async def download_binance_futures_data(market, symbols="all"):
+async def download_binance_futures_data(market, symbols="all", queue_size=4, weight_limit=DEFAULT_WEIGHT_LIMIT,
+                                        formats="csv", output_dir="columnar", compression=None,
+                                        raw_klines=False, retries=8):
     print("Start")
+    # The scheduler owns the request-weight budget, so ccxt's own throttle is disabled
     binance = accxt.binance({
         'options': {'defaultType': market},
-        'enableRateLimit': True
+        'enableRateLimit': False
     })
+    scheduler = WeightScheduler(weight_limit)
+    listing_cache = ListingCache()
+    market_cache = MarketCache()
+    retry = make_retry_policy(retries)
 
     try:
-        await binance.load_markets()
+        await load_markets(binance, market_cache)
 
         if symbols == "all":
             symbols = SYMBOLS_TO_DOWNLOAD
         else:
             symbols = symbols.split(",")
 
-        tasks = [process_symbol(symbol, binance) for symbol in symbols]
+        formats = formats.split(",")
+        columnar = {file_format: ColumnarSink(output_dir, file_format) for file_format in formats if file_format != "csv"}
+        tasks = [
+            process_symbol(symbol, binance, queue_size, scheduler, listing_cache, compression, "csv" in formats, columnar, raw_klines, retry)
+            for symbol in symbols
+        ]
         await asyncio.gather(*tasks)
+        print(f"Scheduler: {scheduler.summary()}")
     finally:
+        await market_cache.wait()
         await binance.close()
 
-async def process_symbol(symbol, binance):
-    try:
-        timestamp = 0
-        filename = f"{symbol.replace('/', '_')}_ohlcv.csv"
-        with open(filename, mode='w', newline='') as csvfile:
-            csvwriter = csv.writer(csvfile)
-            csvwriter.writerow(['timestamp', 'open', 'high', 'low', 'close', 'volume', 'date'])
-
-            downloaded = 0
-            while True:
-                tohlcv = await binance.fetch_ohlcv(symbol, timeframe="1m", since=timestamp, limit=1500)
-                if not tohlcv:
-                    break
-
-                for row in tohlcv:
-                    timestamp_ms = row[0]
-                    date_time = datetime.utcfromtimestamp(timestamp_ms / 1000).strftime('%Y-%m-%d %H:%M:%S')
-                    csvwriter.writerow([timestamp_ms, row[1], row[2], row[3], row[4], row[5], date_time])
-
-                timestamp = tohlcv[-1][0] + 1
-                downloaded += len(tohlcv)
-                print(f"Downloaded {downloaded} rows for {symbol}...")
-
-                await asyncio.sleep(1)
-
-    except asyncio.CancelledError:
-        print(f"Task for {symbol} was cancelled.")
-    except Exception as e:
-        print(f"An unexpected error occurred with {symbol}: {e}")
+async def process_symbol(symbol, binance, queue_size=4, scheduler=None, listing_cache=None, compression=None,
+                         write_csv=True, columnar=None, raw_klines=False, retry=None):
+    # Every requested format is fed from the same download; each resumes after its own last candle
+    sinks = []
+    if write_csv:
+        sinks.append(CsvFileSink(symbol, CsvSink(f"{symbol.replace('/', '_')}_ohlcv.csv", compression), queue_size=queue_size))
+    for sink in (columnar or {}).values():
+        sinks.append(ColumnarFileSink(symbol, sink, queue_size=queue_size))
+    await export_symbol(symbol, binance, sinks, queue_size, scheduler, listing_cache, raw_klines, retry=retry)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--market", default="future", type=str)
     parser.add_argument("--symbols", default="all", type=str)
+    parser.add_argument("--queue-size", default=4, type=int, help="Pages the fetch stage may run ahead of the file writer.")
+    parser.add_argument("--weight-limit", default=DEFAULT_WEIGHT_LIMIT, type=int, help="Exchange request-weight limit per minute shared by all symbols.")
+    parser.add_argument("--format", default="csv", type=str, help=f"Comma-separated outputs written from one download: csv and/or {', '.join(EXTENSIONS)}.")
+    parser.add_argument("--output-dir", default="columnar", type=str, help="Root directory of the columnar partitions.")
+    parser.add_argument("--raw-klines", action="store_true", help="Fetch from the raw klines endpoint straight into NumPy columns.")
+    parser.add_argument("--compression", default=None, type=compression_argument, choices=[c for c in COMPRESSIONS if c], help="Compress CSV output page by page.")
+    add_retry_arguments(parser)
+    add_metrics_arguments(parser)
 
     args = parser.parse_args()
+    metrics.start(args.metrics_port, args.metrics_interval)
 
-    asyncio.run(download_binance_futures_data(args.market, args.symbols))
+    asyncio.run(download_binance_futures_data(
+        args.market, args.symbols, args.queue_size, args.weight_limit, args.format, args.output_dir, args.compression,
+        args.raw_klines, args.retries
+    ))
@@ -3,11 +3,28 @@ from datetime import datetime as dt
 import pandas as pd
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
+import psycopg2.errors
 import dash
 from dash import dcc, html
 from dash.dependencies import Input, Output, State
 from dash.exceptions import PreventUpdate
 import plotly.graph_objs as go
+from BinanceDashboard import FrameCache, WatermarkCache, candles_query, last_closed_bucket, pick_timeframe
+from BinanceRollup import TIMEFRAME_MS, Rollups, aggregate_sql
+from BinanceStorage import make_layout
+
+DASHBOARD_DEFAULTS = {
+    'symbol': 'BTC/USDT:USDT',
+    'layout': 'per-symbol',
+    'suffix': '',
+    'encoding': 'numeric',
+    'pool_size': '4',
+    'cache_size': '32',
+    'max_candles': '5000',
+    'live_interval': '5',
+    'watermark_ttl': '2',
+}
 
 # Function to load database connection parameters
 def load_config(filename='database.ini', section='postgresql'):
@@ -22,79 +39,217 @@ def load_config(filename='database.ini', section='postgresql'):
         raise Exception(f'Section {section} not found in the {filename} file')
     return db_params
 
-# Function to connect to the PostgreSQL database server
-def fetch_data(start_date, end_date):
-    params = load_config()
-    conn = psycopg2.connect(**params)
-    
+# Optional [dashboard] section describing which table layout and encoding to read
+def load_dashboard_config(filename='database.ini', section='dashboard'):
+    try:
+        settings = load_config(filename, section)
+    except Exception:
+        settings = {}
+    return {**DASHBOARD_DEFAULTS, **settings}
+
+dashboard_config = load_dashboard_config()
+layout = make_layout(dashboard_config['layout'], dashboard_config['suffix'], dashboard_config['encoding'])
+rollups = Rollups(layout)
+connection_pool = None
+
+# Connections are opened once and shared by the callback threads
+def get_pool():
+    global connection_pool
+    if connection_pool is None:
+        connection_pool = psycopg2.pool.ThreadedConnectionPool(1, int(dashboard_config['pool_size']), **load_config())
+    return connection_pool
+
+frame_cache = FrameCache(int(dashboard_config['cache_size']))
+
+def current_watermark(conn, symbol):
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(layout.watermark_sql(symbol))
+            row = cursor.fetchone()
+    except psycopg2.errors.UndefinedTable:
+        conn.rollback()
+        return None
+    return row[0] if row else None
+
+# max(timestamp) is re-read at most every watermark_ttl seconds, not on every callback
+watermarks = WatermarkCache(current_watermark, float(dashboard_config['watermark_ttl']))
+
+# Rollup tables cover buckets from the symbol's coverage start; anything earlier is bucketed from 1m rows
+def rollup_since(conn, symbol, timeframe):
+    if timeframe not in rollups.timeframes:
+        return None
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT since FROM {rollups.coverage_table} WHERE symbol = %s", (symbol,))
+            row = cursor.fetchone()
+    except psycopg2.errors.UndefinedTable:
+        conn.rollback()
+        return None
+    return row[0] if row else None
+
+def ingested_symbols():
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(layout.symbols_sql())
+            return [row[0] for row in cursor.fetchall()]
+    except psycopg2.errors.UndefinedTable:
+        return []
+    finally:
+        conn.rollback()
+        pool.putconn(conn)
+
+def fetch_data(start_date, end_date, timeframe='1T', symbol=None):
     # Make sure the dates are Unix timestamps in milliseconds, as bigint
     start_timestamp = int(start_date.timestamp() * 1000)
     end_timestamp = int(end_date.timestamp() * 1000)
-    
-    query = """
-    SELECT
-        timestamp, open, high, low, close, volume
-    FROM
-        "BTCUSDT:USDT"
-    WHERE
-        timestamp >= %s AND timestamp <= %s
-    """
-    
-    df = pd.read_sql(query, conn, params=(start_timestamp, end_timestamp))
-    conn.close()
+
+    symbol = symbol or layout.symbol_key(dashboard_config['symbol'])
+    key = (symbol, start_timestamp, end_timestamp, timeframe)
+
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        watermark = watermarks.get(conn, symbol)
+        df = frame_cache.get(key, watermark)
+        if df is not None:
+            return df
+        query, params = candles_query(
+            layout, rollups, symbol, timeframe, start_timestamp, end_timestamp, rollup_since(conn, symbol, timeframe)
+        )
+        df = pd.read_sql(query, conn, params=params)
+    finally:
+        conn.rollback()
+        pool.putconn(conn)
     df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
     df.set_index('timestamp', inplace=True)
+    frame_cache.put(key, watermark, df)
     return df
 
-# Function to resample data according to the selected timeframe
-def resample_data(df, timeframe):
-    return df.resample(timeframe).agg({
-        'open': 'first',
-        'high': 'max',
-        'low': 'min',
-        'close': 'last',
-        'volume': 'sum'
-    })
+# Buckets after the last plotted one that have fully closed, i.e. end at or before the newest stored candle
+def fetch_new_candles(symbol, timeframe, last_bucket):
+    bucket_ms = TIMEFRAME_MS[timeframe]
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        watermark = watermarks.get(conn, symbol)
+        closed_until = watermark + 60_000 - bucket_ms if watermark is not None else None
+        if closed_until is None or closed_until <= last_bucket:
+            return None
+        query = aggregate_sql(layout.select_sql(symbol), bucket_ms, "timestamp >= %s AND timestamp <= %s")
+        df = pd.read_sql(query, conn, params=(last_bucket + bucket_ms, watermark))
+    finally:
+        conn.rollback()
+        pool.putconn(conn)
+    return df[df['timestamp'] <= closed_until]
+
+def symbol_watermark(symbol):
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        return watermarks.get(conn, symbol)
+    finally:
+        conn.rollback()
+        pool.putconn(conn)
 
 # Dash app layout and callback functions
 app = dash.Dash(__name__)
 
-app.layout = html.Div([
-    html.H1("Cryptocurrency Data Visualization"),
-    dcc.DatePickerRange(
-        id='date-picker-range',  # Ensure this ID matches the one used in the callback
-        start_date=dt.today().date() - pd.Timedelta(days=1),
-        end_date=dt.today().date(),
-        display_format='YYYY-MM-DD',
-        max_date_allowed=dt.today().date()
-    ),
-    dcc.RadioItems(
-        id='timeframe-selector',
-        options=[
-            {'label': '1 Minute', 'value': '1T'},
-            {'label': '5 Minutes', 'value': '5T'},
-            {'label': '10 Minutes', 'value': '10T'},
-            {'label': '1 Hour', 'value': '1H'},
-            {'label': '1 Day', 'value': '1D'}
-        ],
-        value='1T',
-        labelStyle={'display': 'inline-block'}
-    ),
-    dcc.Graph(id='crypto-chart'),
-    dcc.Loading(id="loading-icon", children=[html.Div(dcc.Graph(id='crypto-chart'))], type="circle"),
-])
+# A function so the symbol list is re-read on every page load
+def serve_layout():
+    symbols = ingested_symbols()
+    default_symbol = layout.symbol_key(dashboard_config['symbol'])
+    return html.Div([
+        html.H1("Cryptocurrency Data Visualization"),
+        dcc.Dropdown(
+            id='symbol-selector',
+            options=[{'label': symbol, 'value': symbol} for symbol in symbols],
+            value=default_symbol if default_symbol in symbols or not symbols else symbols[0],
+            clearable=False
+        ),
+        dcc.DatePickerRange(
+            id='date-picker-range',  # Ensure this ID matches the one used in the callback
+            start_date=dt.today().date() - pd.Timedelta(days=1),
+            end_date=dt.today().date(),
+            display_format='YYYY-MM-DD',
+            max_date_allowed=dt.today().date()
+        ),
+        dcc.RadioItems(
+            id='timeframe-selector',
+            options=[
+                {'label': '1 Minute', 'value': '1T'},
+                {'label': '5 Minutes', 'value': '5T'},
+                {'label': '10 Minutes', 'value': '10T'},
+                {'label': '1 Hour', 'value': '1H'},
+                {'label': '1 Day', 'value': '1D'}
+            ],
+            value='1T',
+            labelStyle={'display': 'inline-block'}
+        ),
+        dcc.Checklist(id='live-toggle', options=[{'label': 'Live', 'value': 'live'}], value=[]),
+        dcc.Interval(id='live-interval', interval=int(dashboard_config['live_interval']) * 1000, disabled=True),
+        # symbol, plotted timeframe and start of the last plotted bucket, for the live appends
+        dcc.Store(id='last-candle'),
+        dcc.Loading(id="loading-icon", children=[html.Div(dcc.Graph(id='crypto-chart'))], type="circle"),
+    ])
+
+app.layout = serve_layout
+
+@app.callback(
+    Output('live-interval', 'disabled'),
+    [Input('live-toggle', 'value')]
+)
+def toggle_live(live):
+    return 'live' not in (live or [])
+
+@app.callback(
+    [Output('crypto-chart', 'extendData'),
+     Output('last-candle', 'data', allow_duplicate=True)],
+    [Input('live-interval', 'n_intervals')],
+    [State('last-candle', 'data')],
+    prevent_initial_call=True
+)
+def extend_chart(n_intervals, last_candle):
+    if not last_candle or last_candle['last'] is None:
+        raise PreventUpdate
+    df = fetch_new_candles(last_candle['symbol'], last_candle['timeframe'], last_candle['last'])
+    if df is None or df.empty:
+        raise PreventUpdate
+
+    # Only the new candles travel to the browser; Plotly appends them to trace 0
+    x = pd.to_datetime(df['timestamp'], unit='ms')
+    extension = dict(
+        x=[list(x)],
+        open=[df['open'].tolist()],
+        high=[df['high'].tolist()],
+        low=[df['low'].tolist()],
+        close=[df['close'].tolist()]
+    )
+    return [extension, [0]], {**last_candle, 'last': int(df['timestamp'].iloc[-1])}
 
 @app.callback(
-    Output('crypto-chart', 'figure'),
-    [Input('timeframe-selector', 'value')],
+    [Output('crypto-chart', 'figure'),
+     Output('last-candle', 'data')],
+    [Input('timeframe-selector', 'value'),
+     Input('symbol-selector', 'value'),
+     Input('live-toggle', 'value')],
     [State('date-picker-range', 'start_date'),
      State('date-picker-range', 'end_date')]  # These should match the IDs in the layout
 )
-def update_chart(selected_timeframe, start_date, end_date):
+def update_chart(selected_timeframe, symbol, live, start_date, end_date):
+    if not symbol:
+        raise PreventUpdate
     start_date_obj = dt.strptime(start_date, '%Y-%m-%d')
     end_date_obj = dt.strptime(end_date, '%Y-%m-%d')
-    df = fetch_data(start_date_obj, end_date_obj)
-    resampled_df = resample_data(df, selected_timeframe)
+    timeframe = pick_timeframe(
+        selected_timeframe, int(start_date_obj.timestamp() * 1000), int(end_date_obj.timestamp() * 1000),
+        int(dashboard_config['max_candles'])
+    )
+    resampled_df = fetch_data(start_date_obj, end_date_obj, timeframe, symbol)
+    last_bucket = None
+    if 'live' in (live or []):
+        resampled_df, last_bucket = last_closed_bucket(resampled_df, timeframe, symbol_watermark(symbol))
     
     fig = go.Figure()
 
@@ -141,7 +296,7 @@ def update_chart(selected_timeframe, start_date, end_date):
     # Use full screen upon page load and resize
     fig.update_layout(height=1000)  # Adjust height to fit the screen or as required
 
-    return fig
+    return fig, {'symbol': symbol, 'timeframe': timeframe, 'last': last_bucket}
 
 if __name__ == '__main__':
     app.run_server(debug=True)
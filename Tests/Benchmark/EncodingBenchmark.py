@@ -0,0 +1,92 @@
+import asyncio
+import argparse
+import random
+from time import perf_counter
+import asyncpg
+
+from BinanceCodec import ENCODINGS, ScaledCodec, make_encoding
+from BinanceStorage import PerSymbolLayout, load_config
+
+SYMBOL = "BENCH/USDT"
+
+def synthetic_candles(count, price_digits=1, volume_digits=3, start=1577836800000):
+    # Random walk with prices and volumes on the market's tick/step grid
+    price = 30000.0
+    rows = []
+    for i in range(count):
+        price = max(1.0, price + random.gauss(0, 15))
+        open_ = round(price, price_digits)
+        close = round(price + random.gauss(0, 10), price_digits)
+        high = round(max(open_, close) + abs(random.gauss(0, 5)), price_digits)
+        low = round(min(open_, close) - abs(random.gauss(0, 5)), price_digits)
+        rows.append((start + i * 60_000, open_, high, low, close, round(random.expovariate(1 / 50), volume_digits)))
+    return rows
+
+async def best_of(runs, coroutine_factory):
+    best = None
+    for _ in range(runs):
+        started = perf_counter()
+        await coroutine_factory()
+        elapsed = perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+async def benchmark_encoding(conn, encoding_name, rows, codec, runs):
+    layout = PerSymbolLayout(suffix="_BENCH", encoding=make_encoding(encoding_name))
+    table = layout.table(SYMBOL)
+    await conn.execute(f'DROP TABLE IF EXISTS "{table}";')
+    await layout.setup(conn)
+    await layout.ensure(conn, SYMBOL, {'precision': {'price': codec.price_digits, 'amount': codec.volume_digits}})
+
+    started = perf_counter()
+    await layout.copy(conn, SYMBOL, rows)
+    load_time = perf_counter() - started
+    await conn.execute(f'VACUUM ANALYZE "{table}";')
+
+    size = await conn.fetchval("SELECT pg_total_relation_size($1::text::regclass);", f'"{table}"')
+    scan_time = await best_of(runs, lambda: conn.fetchrow(
+        f'SELECT sum(close), max(high), min(low), sum(volume) FROM "{table}";'
+    ))
+    # Client read includes wire transfer and value decoding (Decimal for NUMERIC)
+    read_time = await best_of(runs, lambda: conn.fetch(layout.select_sql(SYMBOL)))
+
+    decoded = await conn.fetch(layout.select_sql(SYMBOL) + " ORDER BY t.timestamp LIMIT 1000;")
+    lossless = all(tuple(float(v) for v in record) == tuple(float(v) for v in row) for record, row in zip(decoded, rows))
+
+    await conn.execute(f'DROP TABLE "{table}";')
+    return {
+        'encoding': encoding_name,
+        'size_mb': size / 1024 / 1024,
+        'load_rows_sec': len(rows) / load_time,
+        'scan_ms': scan_time * 1000,
+        'read_ms': read_time * 1000,
+        'lossless': lossless,
+    }
+
+async def main(db_params, count, runs):
+    codec = ScaledCodec(price_digits=1, volume_digits=3)
+    rows = synthetic_candles(count, codec.price_digits, codec.volume_digits)
+    conn = await asyncpg.connect(**db_params, command_timeout=None)
+    try:
+        results = [await benchmark_encoding(conn, name, rows, codec, runs) for name in ENCODINGS]
+        await conn.execute("DELETE FROM ohlcv_scales WHERE symbol = $1;", SYMBOL)
+    finally:
+        await conn.close()
+
+    print(f"{count} candles, best of {runs} runs")
+    print(f"{'encoding':<10}{'size MB':>10}{'load rows/s':>14}{'scan ms':>10}{'read ms':>10}{'lossless':>10}")
+    for result in results:
+        print(
+            f"{result['encoding']:<10}{result['size_mb']:>10.1f}{result['load_rows_sec']:>14.0f}"
+            f"{result['scan_ms']:>10.1f}{result['read_ms']:>10.1f}{str(result['lossless']):>10}"
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare table size and scan speed of the candle encodings.")
+    parser.add_argument("--rows", default=1_000_000, type=int)
+    parser.add_argument("--runs", default=3, type=int)
+    parser.add_argument("--config", default="database.ini", type=str)
+
+    args = parser.parse_args()
+
+    asyncio.run(main(load_config(args.config), args.rows, args.runs))
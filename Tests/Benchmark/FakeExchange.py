@@ -0,0 +1,216 @@
+import asyncio
+import json
+import math
+import random
+from time import perf_counter, sleep, time
+from ccxt.base.errors import BadSymbol, RateLimitExceeded
+
+from BinanceScheduler import USED_WEIGHT_HEADER, kline_weight
+
+MINUTE_MS = 60_000
+API_URL = "https://fake.binance.local"
+
+def simulated_symbols(count, quote="USDT"):
+    # Names that can never collide with real tables or rows
+    return [f"SIM{i:04d}/{quote}" for i in range(count)]
+
+def synthetic_rows(symbol_index, since, count):
+    # Deterministic per-minute candles, cheap enough that generation never dominates a run
+    rows = []
+    for minute in range(since // MINUTE_MS, since // MINUTE_MS + count):
+        base = 100.0 + symbol_index + 10 * math.sin(minute / 720)
+        open_ = round(base, 2)
+        close = round(base + 0.05 * math.sin(minute), 2)
+        rows.append([minute * MINUTE_MS, open_, round(max(open_, close) + 0.1, 2), round(min(open_, close) - 0.1, 2),
+                     close, round(10 + (minute * 7919 + symbol_index) % 1000 / 10, 3)])
+    return rows
+
+class ExchangeStats:
+    def __init__(self):
+        self.calls = 0
+        self.pages = 0
+        self.rows = 0
+        self.rate_limited = 0
+        self.latencies = []
+
+    def percentile(self, q):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self):
+        return (
+            f"{self.calls} API calls, {self.pages} pages, {self.rows} rows, {self.rate_limited} rate-limited | "
+            f"page latency p50 {self.percentile(0.5) * 1000:.1f}ms, p99 {self.percentile(0.99) * 1000:.1f}ms"
+        )
+
+class FakeExchange:
+    """ ccxt-compatible stand-in for binance USD-M futures serving synthetic 1m klines offline """
+
+    id = "binance"
+
+    def __init__(self, symbols=100, history_minutes=30 * 1440, latency=0.05, jitter=0.02, page_limit=1500,
+                 weight_limit=0, reject_rate=0.0, seed=0):
+        self.symbols = simulated_symbols(symbols) if isinstance(symbols, int) else list(symbols)
+        self.indexes = {symbol: index for index, symbol in enumerate(self.symbols)}
+        self.ids = {symbol.replace("/", ""): symbol for symbol in self.symbols}
+        # History ends at the current minute, so every served candle is already closed
+        self.end = int(time() * 1000) // MINUTE_MS * MINUTE_MS
+        self.listing = self.end - history_minutes * MINUTE_MS
+        self.latency = latency
+        self.jitter = jitter
+        self.page_limit = page_limit
+        self.weight_limit = weight_limit  # per one-minute window like Binance; 0 disables the limit
+        self.reject_rate = reject_rate    # share of requests answered with 429 regardless of weight
+        self.random = random.Random(seed)
+        self.window = None
+        self.window_weight = 0
+        self.markets = {}
+        self.last_response_headers = {}
+        self.stats = ExchangeStats()
+        self.timeout = 10_000
+        self.urls = {'api': {'fapiPublic': f"{API_URL}/fapi/v1", 'dapiPublic': f"{API_URL}/dapi/v1", 'public': f"{API_URL}/api/v3"}}
+        self.session = FakeSession(self)
+
+    def build_markets(self):
+        return {
+            symbol: {
+                'id': symbol.replace("/", ""),
+                'symbol': symbol,
+                'spot': False,
+                'linear': True,
+                'inverse': False,
+                'info': {'contractType': 'PERPETUAL', 'onboardDate': str(self.listing)},
+                'precision': {'price': 2, 'amount': 3},
+                'limits': {},
+            }
+            for symbol in self.symbols
+        }
+
+    def market(self, symbol):
+        if symbol not in self.markets:
+            raise BadSymbol(f"{self.id} does not have market symbol {symbol}")
+        return self.markets[symbol]
+
+    def open(self):
+        pass
+
+    def delay(self):
+        return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def admit(self, weight):
+        # Same fixed one-minute weight windows as Binance, reported in the same header
+        window = int(time() // 60)
+        if window != self.window:
+            self.window = window
+            self.window_weight = 0
+        self.stats.calls += 1
+        # Like Binance, a 429 says how long to back off: a second for a spurious one, the rest of the window otherwise
+        if self.reject_rate and self.random.random() < self.reject_rate:
+            self.stats.rate_limited += 1
+            self.last_response_headers = {USED_WEIGHT_HEADER: str(self.window_weight), "Retry-After": "1"}
+            return 429
+        if self.weight_limit and self.window_weight + weight > self.weight_limit:
+            self.stats.rate_limited += 1
+            self.last_response_headers = {USED_WEIGHT_HEADER: str(self.window_weight), "Retry-After": str(math.ceil(60 - time() % 60))}
+            return 429
+        self.window_weight += weight
+        self.last_response_headers = {USED_WEIGHT_HEADER: str(self.window_weight)}
+        return 200
+
+    def klines(self, symbol, since, limit):
+        limit = min(limit or 500, self.page_limit)
+        since = max(since or 0, self.listing)
+        since = (since + MINUTE_MS - 1) // MINUTE_MS * MINUTE_MS
+        count = max(0, min(limit, (self.end - since) // MINUTE_MS))
+        rows = synthetic_rows(self.indexes[symbol], since, count)
+        if limit > 1:
+            self.stats.pages += 1
+            self.stats.rows += len(rows)
+        return rows
+
+    def request(self, symbol, since, limit):
+        self.market(symbol)
+        status = self.admit(kline_weight(limit or 500))
+        if status != 200:
+            raise RateLimitExceeded(f"{self.id} {status} Too many requests")
+        return self.klines(symbol, since, limit)
+
+    async def load_markets(self, reload=False):
+        await asyncio.sleep(self.delay())
+        self.markets = self.build_markets()
+        return self.markets
+
+    async def fetch_ohlcv(self, symbol, timeframe="1m", since=None, limit=None, params={}):
+        started = perf_counter()
+        try:
+            await asyncio.sleep(self.delay())
+            return self.request(symbol, since, limit)
+        finally:
+            self.stats.latencies.append(perf_counter() - started)
+
+    async def close(self):
+        pass
+
+class FakeExchangeSync(FakeExchange):
+    """ Blocking variant for the ccxt (sync) exporter """
+
+    def load_markets(self, reload=False):
+        sleep(self.delay())
+        self.markets = self.build_markets()
+        return self.markets
+
+    def fetch_ohlcv(self, symbol, timeframe="1m", since=None, limit=None, params={}):
+        started = perf_counter()
+        try:
+            sleep(self.delay())
+            return self.request(symbol, since, limit)
+        finally:
+            self.stats.latencies.append(perf_counter() - started)
+
+    def close(self):
+        pass
+
+class FakeResponse:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    async def read(self):
+        return self.body
+
+class FakeSession:
+    """ Answers the raw /klines requests of BinanceKlines.fetch_klines with Binance's JSON payload """
+
+    def __init__(self, exchange):
+        self.exchange = exchange
+
+    def get(self, url, params=None, timeout=None):
+        return FakeRequest(self.exchange, params)
+
+class FakeRequest:
+    def __init__(self, exchange, params):
+        self.exchange = exchange
+        self.params = params
+
+    async def __aenter__(self):
+        exchange = self.exchange
+        started = perf_counter()
+        await asyncio.sleep(exchange.delay())
+        symbol = exchange.ids[self.params['symbol']]
+        status = exchange.admit(kline_weight(self.params['limit']))
+        if status != 200:
+            exchange.stats.latencies.append(perf_counter() - started)
+            return FakeResponse(status, dict(exchange.last_response_headers), b'{"code":-1003,"msg":"Too many requests"}')
+
+        klines = [
+            [row[0], *(f"{value}" for value in row[1:6]), row[0] + MINUTE_MS - 1, "0", 100, "0", "0", "0"]
+            for row in exchange.klines(symbol, self.params['startTime'], self.params['limit'])
+        ]
+        exchange.stats.latencies.append(perf_counter() - started)
+        return FakeResponse(200, dict(exchange.last_response_headers), json.dumps(klines).encode())
+
+    async def __aexit__(self, *exc):
+        return False
@@ -0,0 +1,274 @@
+import asyncio
+import argparse
+import contextlib
+import multiprocessing
+import os
+import resource
+import tempfile
+from time import perf_counter
+from sqlalchemy import text
+
+import BinanceExport, BinanceExport_BatchORM, BinanceExportSync, BinanceFutureExport, Binance_export_csv
+from BinanceCodec import ENCODINGS, NumericEncoding, ScaledEncoding
+from BinanceColumnar import ColumnarSink
+from BinanceCsv import compression_argument
+from BinanceListing import LISTING_CACHE_FILE, ListingCache
+from BinanceMetrics import metrics
+from BinanceRetry import make_retry_policy
+from BinanceRollup import enable_rollups
+from BinanceScheduler import WeightScheduler
+from BinanceStorage import PerSymbolLayout, load_config, make_layout
+from Tests.Benchmark.FakeExchange import FakeExchange, FakeExchangeSync
+
+EXPORTERS = ["export", "future", "orm", "sync", "csv"]
+DATABASE_EXPORTERS = {"export", "future", "orm", "sync"}
+SIMULATED = "SIM%"
+
+def benchmark_layout(suffix, options):
+    layout = make_layout(PerSymbolLayout.name, suffix, options['encoding'])
+    if options['rollups']:
+        enable_rollups(layout)
+    return layout
+
+async def clean_layout(conn, layout, symbols):
+    # Only the simulated symbols' tables and rows are touched
+    for symbol in symbols:
+        await conn.execute(f'DROP TABLE IF EXISTS "{layout.table(symbol)}";')
+    if layout.rollups is not None:
+        for timeframe in layout.rollups.timeframes:
+            await conn.execute(f"DELETE FROM {layout.rollups.table(timeframe)} WHERE symbol LIKE $1;", SIMULATED)
+        await conn.execute(f"DELETE FROM {layout.rollups.coverage_table} WHERE symbol LIKE $1;", SIMULATED)
+    if isinstance(layout.encoding, ScaledEncoding):
+        await conn.execute(f"DELETE FROM {ScaledEncoding.scales_table} WHERE symbol LIKE $1;", SIMULATED)
+
+async def run_pool_exporter(binance, db_params, options, module, suffix, process):
+    pool = await module.create_pool(**db_params)
+    layout = benchmark_layout(suffix, options)
+    scheduler = WeightScheduler(options['weight_limit'])
+    listing_cache = ListingCache(options['listing_cache'])
+    try:
+        async with pool.acquire() as conn:
+            await layout.setup(conn)
+            await clean_layout(conn, layout, binance.symbols)
+
+        started = perf_counter()
+        await asyncio.gather(*(process(symbol, pool, layout, scheduler, listing_cache) for symbol in binance.symbols))
+        elapsed = perf_counter() - started
+
+        async with pool.acquire() as conn:
+            await clean_layout(conn, layout, binance.symbols)
+        return elapsed
+    finally:
+        await pool.close()
+
+async def run_export(binance, db_params, options):
+    return await run_pool_exporter(binance, db_params, options, BinanceExport, "", lambda symbol, pool, layout, scheduler, listing_cache: (
+        BinanceExport.process_symbol(symbol, binance, pool, options['write_mode'], options['copy_pages'], options['queue_size'],
+                                     scheduler, listing_cache=listing_cache, layout=layout, raw_klines=options['raw_klines'],
+                                     retry=make_retry_policy(options['retries']))
+    ))
+
+async def run_future(binance, db_params, options):
+    return await run_pool_exporter(binance, db_params, options, BinanceFutureExport, "_FUTURE", lambda symbol, pool, layout, scheduler, listing_cache: (
+        BinanceFutureExport.process_symbol(symbol, binance, pool, "csv" in options['formats'], options['queue_size'],
+                                           scheduler, listing_cache, layout, retry=make_retry_policy(options['retries']))
+    ))
+
+async def run_orm(binance, db_params, options):
+    engine, session_factory = await BinanceExport_BatchORM.create_engine_and_session(db_params)
+    model = BinanceExport_BatchORM.MODELS.get(options['encoding'], BinanceExport_BatchORM.OHLCV)
+    scheduler = WeightScheduler(options['weight_limit'])
+    listing_cache = ListingCache(options['listing_cache'])
+    clean = text(f"DELETE FROM {model.__tablename__} WHERE symbol LIKE :pattern")
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(clean, {'pattern': SIMULATED})
+
+        started = perf_counter()
+        await asyncio.gather(*(
+            BinanceExport_BatchORM.process_symbol(symbol, binance, session_factory, options['queue_size'], scheduler, listing_cache,
+                                                  model, options['orm_write_mode'], make_retry_policy(options['retries']))
+            for symbol in binance.symbols
+        ))
+        elapsed = perf_counter() - started
+
+        async with engine.begin() as conn:
+            await conn.execute(clean, {'pattern': SIMULATED})
+        return elapsed
+    finally:
+        await engine.dispose()
+
+def sync_pass(binance, db_params, options):
+    conn = BinanceExportSync.create_connection(db_params)
+    # The polling loop only writes the numeric per-symbol tables
+    layout = benchmark_layout("", {**options, 'encoding': NumericEncoding.name})
+    drop = "".join(f'DROP TABLE IF EXISTS "{symbol.replace("/", "")}";' for symbol in binance.symbols)
+    if layout.rollups is not None:
+        tables = [*map(layout.rollups.table, layout.rollups.timeframes), layout.rollups.coverage_table]
+        drop += "".join(layout.rollups.setup_sql())
+        drop += "".join(f"DELETE FROM {table} WHERE symbol LIKE '{SIMULATED}';" for table in tables)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(drop)
+        conn.commit()
+
+        # One pass of the exporter's endless loop, with the watermarks loaded as in production
+        started = perf_counter()
+        listing_cache = ListingCache(options['listing_cache'])
+        watermarks = BinanceExportSync.WatermarkCache()
+        watermarks.load(conn, binance.symbols, layout)
+        for symbol in binance.symbols:
+            BinanceExportSync.process_symbol(symbol, binance, conn, options['queue_size'], listing_cache, watermarks,
+                                             make_retry_policy(options['retries']), layout)
+        elapsed = perf_counter() - started
+
+        with conn.cursor() as cursor:
+            cursor.execute(drop)
+        conn.commit()
+        return elapsed
+    finally:
+        conn.close()
+
+async def run_sync(binance, db_params, options):
+    return await asyncio.to_thread(sync_pass, binance, db_params, options)
+
+async def run_csv(binance, db_params, options):
+    # Files land in the run's temporary working directory
+    scheduler = WeightScheduler(options['weight_limit'])
+    listing_cache = ListingCache(options['listing_cache'])
+    columnar = {file_format: ColumnarSink("columnar", file_format) for file_format in options['formats'] if file_format != "csv"}
+
+    started = perf_counter()
+    await asyncio.gather(*(
+        Binance_export_csv.process_symbol(symbol, binance, options['queue_size'], scheduler, listing_cache, options['compression'],
+                                          "csv" in options['formats'], columnar, options['raw_klines'],
+                                          make_retry_policy(options['retries']))
+        for symbol in binance.symbols
+    ))
+    return perf_counter() - started
+
+RUNNERS = {
+    'export': run_export,
+    'future': run_future,
+    'orm': run_orm,
+    'sync': run_sync,
+    'csv': run_csv,
+}
+
+async def load_markets(binance):
+    markets = binance.load_markets()
+    if asyncio.iscoroutine(markets):
+        await markets
+
+def run_variant(exporter, db_params, options, connection):
+    # Runs in its own process, so ru_maxrss is this exporter's peak alone
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        # Simulated listings never reach the listing cache real exports read
+        options = {**options, 'listing_cache': os.path.join(workdir, LISTING_CACHE_FILE)}
+        exchange = FakeExchangeSync if exporter == "sync" else FakeExchange
+        binance = exchange(options['symbols'], options['minutes'], options['latency'], options['jitter'], options['page_limit'],
+                           options['exchange_weight_limit'], options['reject_rate'])
+        asyncio.run(load_markets(binance))
+        metrics.enabled = options['metrics']
+
+        with contextlib.ExitStack() as stack:
+            if not options['verbose']:
+                # The exporters print every page; the output would drown the results
+                stack.enter_context(contextlib.redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+            elapsed = asyncio.run(RUNNERS[exporter](binance, db_params, options))
+
+    stats = binance.stats
+    connection.send({
+        'exporter': exporter,
+        'seconds': elapsed,
+        'rows': stats.rows,
+        'expected': len(binance.symbols) * options['minutes'],
+        'calls': stats.calls,
+        'rate_limited': stats.rate_limited,
+        'p50_ms': stats.percentile(0.5) * 1000,
+        'p99_ms': stats.percentile(0.99) * 1000,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    })
+    connection.close()
+
+def benchmark(exporter, db_params, options):
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=run_variant, args=(exporter, db_params, options, sender), name=f"bench-{exporter}")
+    process.start()
+    sender.close()
+    try:
+        return receiver.recv()
+    except EOFError:
+        return None
+    finally:
+        process.join()
+
+def main(exporters, db_config, options):
+    db_params = load_config(db_config) if DATABASE_EXPORTERS.intersection(exporters) else None
+    print(
+        f"{options['symbols']} simulated symbols x {options['minutes']} minutes, latency {options['latency'] * 1000:.0f}"
+        f"+-{options['jitter'] * 1000:.0f}ms, weight limit {options['weight_limit']}, reject rate {options['reject_rate']:.2%}"
+    )
+    print(f"{'exporter':<10}{'seconds':>9}{'rows/s':>11}{'complete':>10}{'calls':>8}{'429s':>6}{'p50 ms':>9}{'p99 ms':>9}{'RSS MB':>9}")
+    for exporter in exporters:
+        result = benchmark(exporter, db_params, options)
+        if result is None:
+            print(f"{exporter:<10}  failed, see the traceback above")
+            continue
+        print(
+            f"{exporter:<10}{result['seconds']:>9.1f}{result['rows'] / result['seconds']:>11.0f}"
+            f"{result['rows'] / result['expected']:>10.1%}{result['calls']:>8}{result['rate_limited']:>6}"
+            f"{result['p50_ms']:>9.1f}{result['p99_ms']:>9.1f}{result['peak_rss_mb']:>9.0f}"
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure exporter throughput offline against a simulated exchange.")
+    parser.add_argument("--exporters", default=",".join(EXPORTERS), type=str, help=f"Comma-separated subset of {', '.join(EXPORTERS)}.")
+    parser.add_argument("--symbols", default=100, type=int)
+    parser.add_argument("--minutes", default=3 * 1440, type=int, help="History served per symbol.")
+    parser.add_argument("--latency", default=0.05, type=float, help="Mean seconds per exchange request.")
+    parser.add_argument("--jitter", default=0.02, type=float)
+    parser.add_argument("--page-limit", default=1500, type=int, help="Most candles the exchange returns per request.")
+    parser.add_argument("--weight-limit", default=1_000_000, type=int, help="Client scheduler weight per minute; 2400 mirrors production.")
+    parser.add_argument("--exchange-weight-limit", default=None, type=int, help="Weight per minute before the exchange answers 429; defaults to --weight-limit.")
+    parser.add_argument("--reject-rate", default=0.0, type=float, help="Share of requests answered with 429 regardless of weight.")
+    parser.add_argument("--queue-size", default=4, type=int)
+    parser.add_argument("--retries", default=8, type=int, help="Retry policy of the exporters; 0 lets a 429 end the symbol as before.")
+    parser.add_argument("--write-mode", default="insert", choices=["insert", "copy"])
+    parser.add_argument("--copy-pages", default=10, type=int)
+    parser.add_argument("--orm-write-mode", default="core", choices=["core", "copy", "orm"])
+    parser.add_argument("--encoding", default=NumericEncoding.name, choices=list(ENCODINGS))
+    parser.add_argument("--rollups", action="store_true", help="Refresh rollup tables as the exporters do in production.")
+    parser.add_argument("--raw-klines", action="store_true")
+    parser.add_argument("--formats", default="csv", type=str, help="File outputs of the csv and future exporters, e.g. csv,parquet.")
+    parser.add_argument("--compression", default=None, type=compression_argument, choices=["gzip", "zstd"])
+    parser.add_argument("--config", default="database.ini", type=str)
+    parser.add_argument("--metrics", action="store_true", help="Record hot-path metrics, to measure their overhead.")
+    parser.add_argument("--verbose", action="store_true", help="Keep the exporters' own output.")
+
+    args = parser.parse_args()
+
+    main(args.exporters.split(","), os.path.abspath(args.config), {
+        'symbols': args.symbols,
+        'minutes': args.minutes,
+        'latency': args.latency,
+        'jitter': args.jitter,
+        'page_limit': args.page_limit,
+        'weight_limit': args.weight_limit,
+        'exchange_weight_limit': args.exchange_weight_limit if args.exchange_weight_limit is not None else args.weight_limit,
+        'reject_rate': args.reject_rate,
+        'queue_size': args.queue_size,
+        'retries': args.retries,
+        'write_mode': args.write_mode,
+        'copy_pages': args.copy_pages,
+        'orm_write_mode': args.orm_write_mode,
+        'encoding': args.encoding,
+        'rollups': args.rollups,
+        'raw_klines': args.raw_klines,
+        'formats': args.formats.split(","),
+        'compression': args.compression,
+        'metrics': args.metrics,
+        'verbose': args.verbose,
+    })
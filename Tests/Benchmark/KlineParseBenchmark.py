@@ -0,0 +1,61 @@
+import argparse
+import json
+import random
+from time import perf_counter
+import ccxt
+
+from BinanceKlines import KlineColumns, loads
+
+def synthetic_klines(count, start=1577836800000):
+    # Binance /klines payload: prices and volumes as strings, as the exchange sends them
+    price = 30000.0
+    klines = []
+    for i in range(count):
+        price = max(1.0, price + random.gauss(0, 15))
+        close = price + random.gauss(0, 10)
+        klines.append([
+            start + i * 60_000, f"{price:.2f}", f"{max(price, close) + 3:.2f}", f"{min(price, close) - 3:.2f}",
+            f"{close:.2f}", f"{random.expovariate(1 / 50):.3f}", start + i * 60_000 + 59_999, "0", 100, "0", "0", "0"
+        ])
+    return json.dumps(klines).encode()
+
+def ccxt_path(binance, body):
+    # What fetch_ohlcv does after the HTTP round-trip, plus the exporters' tuple rebuild
+    tohlcv = binance.parse_ohlcvs(json.loads(body), None, "1m")
+    return [(x[0], x[1], x[2], x[3], x[4], x[5]) for x in tohlcv]
+
+def fast_path(body):
+    return KlineColumns.from_raw(loads(body))
+
+def best_of(runs, function):
+    best = None
+    for _ in range(runs):
+        started = perf_counter()
+        function()
+        elapsed = perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main(pages, page_size, runs):
+    binance = ccxt.binance()
+    bodies = [synthetic_klines(page_size, 1577836800000 + i * page_size * 60_000) for i in range(pages)]
+    rows = pages * page_size
+
+    ccxt_time = best_of(runs, lambda: [ccxt_path(binance, body) for body in bodies])
+    fast_time = best_of(runs, lambda: [fast_path(body) for body in bodies])
+
+    print(f"{pages} pages of {page_size} klines, best of {runs} runs (decoder: {loads.__module__})")
+    print(f"{'path':<14}{'seconds':>10}{'rows/s':>14}")
+    print(f"{'ccxt':<14}{ccxt_time:>10.3f}{rows / ccxt_time:>14.0f}")
+    print(f"{'raw columns':<14}{fast_time:>10.3f}{rows / fast_time:>14.0f}")
+    print(f"speed-up x{ccxt_time / fast_time:.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare kline parsing through ccxt with the raw NumPy column path.")
+    parser.add_argument("--pages", default=200, type=int)
+    parser.add_argument("--page-size", default=1500, type=int)
+    parser.add_argument("--runs", default=3, type=int)
+
+    args = parser.parse_args()
+
+    main(args.pages, args.page_size, args.runs)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Benchmarks run from the repository root (python -m Tests.Benchmark.X) but import the
+# scripts the way the scripts import each other: by plain module name from Script/.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "Script"))
@@ -0,0 +1,69 @@
+import pytest
+from ccxt.base.errors import NetworkError
+
+from BinanceBackfill import MINUTE_MS, backfill_pages, split_windows
+from BinanceRetry import RetryPolicy
+from BinanceScheduler import WeightScheduler
+
+def test_split_windows_covers_range_without_overlap():
+    windows = split_windows(90_000, 10 * MINUTE_MS, 3 * MINUTE_MS)
+
+    assert windows[0] == (90_000, 4 * MINUTE_MS)
+    assert windows[-1] == (7 * MINUTE_MS, None)
+    for (_, end), (start, _) in zip(windows, windows[1:]):
+        assert end == start
+
+class FakeExchange:
+    """ Serves a contiguous 1m series and pages it like fetch_ohlcv """
+
+    def __init__(self, first, count, failures=0):
+        self.candles = [[first + i * MINUTE_MS, 1, 2, 0.5, 1.5, 10] for i in range(count)]
+        self.last_response_headers = {}
+        self.failures = failures
+        self.probes = 0
+
+    async def fetch_ohlcv(self, symbol, timeframe, since, limit):
+        if self.failures:
+            self.failures -= 1
+            raise NetworkError("connection reset")
+        if limit == 1:
+            self.probes += 1
+        return [x for x in self.candles if x[0] >= since][:limit]
+
+    def milliseconds(self):
+        return self.candles[-1][0] + MINUTE_MS
+
+@pytest.mark.asyncio
+async def test_backfill_pages_stitches_windows_in_order(mocker):
+    mocker.patch('BinanceBackfill.PAGE_LIMIT', 7)
+    exchange = FakeExchange(first=5 * MINUTE_MS, count=100)
+    scheduler = WeightScheduler(weight_limit=10**9)
+
+    timestamps = []
+    async for page in backfill_pages(exchange, 'BTC/USDT', 0, shards=3, window_pages=2, scheduler=scheduler):
+        timestamps.extend(x[0] for x in page)
+
+    assert timestamps == [x[0] for x in exchange.candles]
+
+@pytest.mark.asyncio
+async def test_backfill_pages_skips_probe_for_known_start(mocker):
+    mocker.patch('BinanceBackfill.PAGE_LIMIT', 7)
+    exchange = FakeExchange(first=5 * MINUTE_MS, count=50)
+    since = exchange.candles[10][0]
+
+    timestamps = [x[0] async for page in backfill_pages(exchange, 'BTC/USDT', since, shards=2, window_pages=2,
+                                                                           scheduler=WeightScheduler(weight_limit=10**9)) for x in page]
+
+    assert exchange.probes == 0
+    assert timestamps == [x[0] for x in exchange.candles[10:]]
+
+@pytest.mark.asyncio
+async def test_backfill_probe_is_retried(mocker):
+    mocker.patch('BinanceBackfill.PAGE_LIMIT', 7)
+    exchange = FakeExchange(first=5 * MINUTE_MS, count=20, failures=1)
+
+    pages = [page async for page in backfill_pages(exchange, 'BTC/USDT', 0, scheduler=WeightScheduler(weight_limit=10**9),
+                                                 retry=RetryPolicy(base=0.001))]
+
+    assert exchange.probes == 1
+    assert sum(len(page) for page in pages) == 20
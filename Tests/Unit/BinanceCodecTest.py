@@ -0,0 +1,55 @@
+import random
+import numpy as np
+import pytest
+
+from BinanceCodec import ScaledCodec, ScaledEncoding, precision_digits
+from BinanceKlines import KlineColumns
+
+@pytest.mark.parametrize("precision,digits", [
+    (2, 2),
+    (0.1, 1),
+    (0.001, 3),
+    (1e-8, 8),
+    (1.0, 0),
+    (None, 8),
+])
+def test_precision_digits(precision, digits):
+    assert precision_digits(precision) == digits
+
+def test_from_market_uses_price_and_amount_precision():
+    codec = ScaledCodec.from_market({'precision': {'price': 0.01, 'amount': 0.001}})
+    assert (codec.price_digits, codec.volume_digits) == (2, 3)
+
+@pytest.mark.parametrize("price_digits,volume_digits", [(1, 3), (4, 0), (8, 8)])
+def test_scaled_codec_round_trips_losslessly(price_digits, volume_digits):
+    codec = ScaledCodec(price_digits, volume_digits)
+    rng = random.Random(price_digits * 10 + volume_digits)
+    rows = [
+        (1609459200000 + i * 60_000,
+         round(rng.uniform(0.0001, 90000), price_digits),
+         round(rng.uniform(0.0001, 90000), price_digits),
+         round(rng.uniform(0.0001, 90000), price_digits),
+         round(rng.uniform(0.0001, 90000), price_digits),
+         round(rng.uniform(0, 1e6), volume_digits))
+        for i in range(10000)
+    ]
+
+    encoded = codec.encode(rows)
+    assert all(isinstance(value, int) for row in encoded for value in row)
+    assert codec.decode(encoded) == rows
+
+def test_scaled_select_decodes_in_sql():
+    columns = ScaledEncoding().select_columns("t")
+    assert "t.open / power(10::float8, scales.price_digits) AS open" in columns
+    assert "t.volume / power(10::float8, scales.volume_digits) AS volume" in columns
+
+def test_scaled_columns_refuse_to_wrap():
+    codec = ScaledCodec(2, 8)
+    prices = np.array([1.5, 2.5])
+
+    encoded = codec.encode_columns(KlineColumns(np.array([0, 60_000]), prices, prices, prices, prices, np.array([1.0, 2.0])))
+    assert encoded[-1].tolist() == [100_000_000, 200_000_000]
+
+    # 1e11 units of volume at 8 digits is past 2**63
+    with pytest.raises(OverflowError, match="volume"):
+        codec.encode_columns(KlineColumns(np.array([0, 60_000]), prices, prices, prices, prices, np.array([1.0, 1e11])))
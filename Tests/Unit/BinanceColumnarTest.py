@@ -0,0 +1,29 @@
+import pytest
+
+from BinanceColumnar import DAY_MS, ColumnarSink, day_files, read_columns
+
+def candles(start, count):
+    return [[start + i * 60_000, 1.0 + i, 2.0 + i, 0.5 + i, 1.5 + i, 10.0 * i] for i in range(count)]
+
+@pytest.mark.parametrize("file_format", ["parquet", "arrow"])
+def test_write_splits_by_utc_day_and_reads_back(tmp_path, file_format):
+    sink = ColumnarSink(str(tmp_path), file_format)
+    start = 20000 * DAY_MS - 5 * 60_000
+    sink.write("BTC/USDT:USDT", candles(start, 10))
+
+    assert len(day_files(str(tmp_path), "BTC/USDT:USDT", file_format)) == 2
+    data = read_columns(str(tmp_path), "BTC/USDT:USDT", columns=["timestamp", "close"], file_format=file_format)
+    assert list(data) == ["timestamp", "close"]
+    assert data["timestamp"].tolist() == [start + i * 60_000 for i in range(10)]
+    assert sink.last_timestamp("BTC/USDT:USDT") == start + 9 * 60_000
+
+def test_overlapping_append_keeps_rows_unique(tmp_path):
+    sink = ColumnarSink(str(tmp_path))
+    start = 20000 * DAY_MS
+    sink.write("ETH/USDT", candles(start, 5))
+    sink.write("ETH/USDT", candles(start + 3 * 60_000, 5))
+
+    # A fresh sink must resume from the files rather than its in-memory day
+    data = read_columns(str(tmp_path), "ETH/USDT", start=start + 60_000, end=start + 7 * 60_000)
+    assert data["timestamp"].tolist() == [start + i * 60_000 for i in range(1, 7)]
+    assert ColumnarSink(str(tmp_path)).last_timestamp("ETH/USDT") == start + 7 * 60_000
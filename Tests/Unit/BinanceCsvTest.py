@@ -0,0 +1,66 @@
+import argparse
+import csv
+import gzip
+import pytest
+
+from BinanceCsv import CsvSink, compression_argument, format_dates, read_tail_timestamp
+
+def candles(start, count):
+    return [[start + i * 60_000, 1.0, 2.0, 0.5, 1.5, 10.0] for i in range(count)]
+
+def test_format_dates_matches_utc_strings():
+    assert format_dates([0, 1609459261000]).tolist() == ["1970-01-01 00:00:00", "2021-01-01 00:01:01"]
+
+def test_plain_csv_resumes_from_file_tail(tmp_path):
+    path = str(tmp_path / "BTC_USDT_ohlcv.csv")
+    CsvSink(path).write(candles(0, 3))
+
+    sink = CsvSink(path)
+    assert sink.last_timestamp() == 120_000
+    assert sink.write(candles(60_000, 4)) == 2
+
+    with open(path, newline="") as file:
+        rows = list(csv.reader(file))
+    assert rows[0][-1] == "date"
+    assert [int(row[0]) for row in rows[1:]] == [0, 60_000, 120_000, 180_000, 240_000]
+    assert read_tail_timestamp(path) == 240_000
+
+def test_gzip_pages_are_independent_members(tmp_path):
+    path = str(tmp_path / "ETH_USDT_ohlcv.csv")
+    CsvSink(path, "gzip", include_date=False).write(candles(0, 2))
+
+    sink = CsvSink(path, "gzip", include_date=False)
+    assert sink.last_timestamp() == 60_000
+    sink.write(candles(60_000, 2))
+
+    with gzip.open(sink.path, "rt", newline="") as file:
+        rows = list(csv.reader(file))
+    assert rows[0] == ["timestamp", "open", "high", "low", "close", "volume"]
+    assert [int(row[0]) for row in rows[1:]] == [0, 60_000, 120_000]
+
+def test_missing_zstandard_is_refused_up_front(tmp_path, mocker):
+    mocker.patch('BinanceCsv.zstandard', None)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--compression", type=compression_argument, choices=["gzip", "zstd"])
+
+    with pytest.raises(ValueError, match="zstandard"):
+        CsvSink(str(tmp_path / "BTC_USDT.csv"), "zstd")
+    with pytest.raises(SystemExit):
+        parser.parse_args(["--compression", "zstd"])
+    assert parser.parse_args(["--compression", "gzip"]).compression == "gzip"
+
+def test_torn_tail_is_cut_before_resuming(tmp_path):
+    path = str(tmp_path / "BTC_USDT_ohlcv.csv")
+    CsvSink(path, include_date=False).write(candles(0, 3))
+    with open(path, "ab") as file:
+        file.write(b"180000,1.0,2.")  # interrupted mid-row
+
+    assert read_tail_timestamp(path) == 120_000
+    sink = CsvSink(path, include_date=False)
+    assert sink.last_timestamp() == 120_000
+    sink.write(candles(180_000, 2))
+
+    with open(path, newline="") as file:
+        rows = list(csv.reader(file))
+    assert [int(row[0]) for row in rows[1:]] == [0, 60_000, 120_000, 180_000, 240_000]
+    assert all(len(row) == 6 for row in rows)
@@ -0,0 +1,68 @@
+from unittest.mock import MagicMock
+import pandas as pd
+
+from BinanceDashboard import FrameCache, WatermarkCache, candles_query, last_closed_bucket, pick_timeframe
+from BinanceRollup import Rollups
+from BinanceStorage import PerSymbolLayout
+
+MINUTE = 60_000
+DAY = 1440 * MINUTE
+
+def frame(timestamps):
+    index = pd.to_datetime(timestamps, unit='ms')
+    return pd.DataFrame({'close': range(len(timestamps))}, index=index)
+
+def test_frame_cache_serves_only_the_current_watermark_and_evicts_lru():
+    cache = FrameCache(maxsize=2)
+    cache.put("a", 1, "frame a")
+    cache.put("b", 1, "frame b")
+
+    assert cache.get("a", 1) == "frame a"
+    assert cache.get("a", 2) is None  # new candles were ingested since
+    cache.put("c", 1, "frame c")
+
+    assert cache.get("b", 1) is None  # least recently used
+    assert cache.get("c", 1) == "frame c"
+    assert (cache.hits, cache.misses) == (2, 2)
+
+def test_watermark_cache_rereads_after_ttl():
+    now = [0.0]
+    read = MagicMock(side_effect=[10, 20])
+    watermarks = WatermarkCache(read, ttl=2.0, clock=lambda: now[0])
+
+    assert watermarks.get("conn", "BTCUSDT") == 10
+    now[0] = 1.5
+    assert watermarks.get("conn", "BTCUSDT") == 10
+    now[0] = 2.5
+    assert watermarks.get("conn", "BTCUSDT") == 20
+    assert read.call_count == 2
+
+def test_pick_timeframe_keeps_candle_budget():
+    assert pick_timeframe('1T', 0, DAY, 5000) == '1T'
+    assert pick_timeframe('1T', 0, 30 * DAY, 5000) == '10T'
+    assert pick_timeframe('1H', 0, DAY, 5000) == '1H'  # never finer than selected
+    assert pick_timeframe('1T', 0, 100_000 * DAY, 5000) == '1D'
+
+def test_candles_query_reads_raw_buckets_before_rollup_coverage():
+    layout = PerSymbolLayout()
+    rollups = Rollups(layout)
+
+    raw, params = candles_query(layout, rollups, "BTCUSDT", '1H', 0, DAY)
+    assert params == (0, DAY)
+    assert rollups.table('1H') not in raw
+
+    # Coverage starts mid-bucket: that whole bucket is served from the rollup table
+    query, params = candles_query(layout, rollups, "BTCUSDT", '1H', 0, DAY, since=5 * 3_600_000 + 7 * MINUTE)
+    assert rollups.table('1H') in query
+    assert params == (0, 5 * 3_600_000 - 1, "BTCUSDT", 5 * 3_600_000, DAY)
+
+def test_last_closed_bucket_drops_the_open_bucket():
+    df = frame([0, 5 * MINUTE, 10 * MINUTE])
+
+    trimmed, last = last_closed_bucket(df, '5T', watermark=12 * MINUTE)
+    assert len(trimmed) == 2 and last == 5 * MINUTE
+
+    closed, last = last_closed_bucket(df, '5T', watermark=14 * MINUTE)
+    assert len(closed) == 3 and last == 10 * MINUTE
+
+    assert last_closed_bucket(df.iloc[:0], '5T', 14 * MINUTE)[1] is None
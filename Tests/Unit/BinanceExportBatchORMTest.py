@@ -0,0 +1,64 @@
+import contextlib
+from unittest.mock import AsyncMock, MagicMock
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from BinanceExport_BatchORM import MODELS, bulk_insert_statement, copy_rows
+
+def test_bulk_insert_skips_existing_candles():
+    sql = str(bulk_insert_statement(MODELS['float8']).compile(dialect=postgresql.dialect()))
+    assert sql.startswith("INSERT INTO ohlcv_data_f8")
+    assert sql.endswith("ON CONFLICT (symbol, timestamp) DO NOTHING")
+
+def test_models_have_unique_symbol_timestamp_index():
+    for model in MODELS.values():
+        (index,) = model.__table__.indexes
+        assert index.unique
+        assert [column.name for column in index.columns] == ['symbol', 'timestamp']
+
+class FakeDriver:
+    """ asyncpg connection stand-in with autocommit and ON COMMIT DELETE ROWS semantics for the staging table """
+
+    def __init__(self):
+        self.staging = []
+        self.target = {}
+        self.in_transaction = False
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        self.in_transaction = True
+        try:
+            yield
+        finally:
+            self.in_transaction = False
+            self.commit()
+
+    def commit(self):
+        self.staging = []
+
+    def autocommit(self):
+        if not self.in_transaction:
+            self.commit()
+
+    async def execute(self, sql):
+        if sql.strip().startswith("INSERT"):
+            for row in self.staging:
+                self.target.setdefault(row[:2], row)
+        self.autocommit()
+
+    async def copy_records_to_table(self, table, records, columns):
+        self.staging.extend(records)
+        self.autocommit()
+
+@pytest.mark.asyncio
+async def test_copy_rows_lands_in_the_target_table():
+    driver = FakeDriver()
+    raw = MagicMock(driver_connection=driver)
+    connection = MagicMock(get_raw_connection=AsyncMock(return_value=raw))
+    session = MagicMock(connection=AsyncMock(return_value=connection))
+    rows = [("BTC/USDT", i * 60_000, 1.0, 2.0, 0.5, 1.5, 10.0) for i in range(3)]
+
+    await copy_rows(session, MODELS['float8'], rows)
+    await copy_rows(session, MODELS['float8'], rows[1:])  # already stored candles are skipped
+
+    assert sorted(driver.target) == [("BTC/USDT", i * 60_000) for i in range(3)]
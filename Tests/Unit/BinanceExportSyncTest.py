@@ -0,0 +1,59 @@
+from unittest.mock import MagicMock
+
+import BinanceExportSync
+from BinanceExportSync import WatermarkCache, process_symbol
+from BinanceRollup import enable_rollups
+from BinanceStorage import PerSymbolLayout
+
+MINUTE = 60_000
+
+def fake_conn(watermarks):
+    conn = MagicMock()
+    cursor = conn.cursor.return_value
+    cursor.fetchall.return_value = list(watermarks.items())
+    return conn, cursor
+
+def statements(cursor):
+    return [call.args[0] for call in cursor.execute.call_args_list]
+
+def test_load_reads_every_watermark_in_one_round_trip():
+    conn, cursor = fake_conn({'BTC/USDT': 5 * MINUTE, 'ETH/USDT': None})
+    layout = enable_rollups(PerSymbolLayout())
+    watermarks = WatermarkCache()
+
+    watermarks.load(conn, ['BTC/USDT', 'ETH/USDT'], layout)
+
+    ddl, query = statements(cursor)
+    assert ddl.count("CREATE TABLE IF NOT EXISTS") >= 2 and '"BTCUSDT_timestamp_key"' in ddl
+    assert query.count("max(timestamp)") == 2
+    assert cursor.execute.call_args_list[1].args[1] == ['BTC/USDT', 'ETH/USDT']
+    assert watermarks.get('BTC/USDT') == 5 * MINUTE and watermarks.get('ETH/USDT') is None
+
+def test_writes_advance_the_cache_without_querying_the_table(mocker):
+    conn, cursor = fake_conn({'BTC/USDT': 5 * MINUTE})
+    watermarks = WatermarkCache()
+    watermarks.load(conn, ['BTC/USDT'], None)
+    cursor.execute.reset_mock()
+    conn.commit.reset_mock()
+
+    requested = []
+    def fetch_pages_sync(binance, symbol, since, stats=None, retry=None):
+        requested.append(since)
+        yield [[since + i * MINUTE, 1, 2, 0.5, 1.5, 10] for i in range(3)]
+    mocker.patch.object(BinanceExportSync, 'fetch_pages_sync', fetch_pages_sync)
+
+    process_symbol('BTC/USDT', MagicMock(), conn, watermarks=watermarks)
+    process_symbol('BTC/USDT', MagicMock(), conn, watermarks=watermarks)
+
+    # The second cycle resumes right after the rows the first one committed
+    assert requested == [5 * MINUTE + 1, 7 * MINUTE + 2]
+    assert watermarks.get('BTC/USDT') == 9 * MINUTE + 2
+    assert not any("max(timestamp)" in sql or "CREATE" in sql for sql in statements(cursor))
+    assert cursor.executemany.call_count == 2 and conn.commit.call_count == 2
+
+def test_advance_never_moves_a_watermark_back():
+    watermarks = WatermarkCache()
+    watermarks.advance('BTC/USDT', 10 * MINUTE)
+    watermarks.advance('BTC/USDT', 4 * MINUTE)
+
+    assert watermarks.get('BTC/USDT') == 10 * MINUTE
@@ -1,8 +1,9 @@
 import asyncio
-from unittest.mock import patch, AsyncMock
+from unittest.mock import patch, AsyncMock, MagicMock
 import pytest
 
-from Script.BinanceExport import create_pool, download_binance_futures_data, process_symbol, load_config
+from BinanceExport import create_pool, download_binance_futures_data, process_symbol, load_config
+from BinanceScheduler import WeightScheduler
 
 @pytest.fixture
 def binance_market():
@@ -29,9 +30,18 @@ def db_params():
     }
 
 @pytest.fixture
-async def pool(mocker):
-    mock_pool = AsyncMock()
-    mocker.patch('asyncpg.create_pool', return_value=mock_pool)
+def conn():
+    mock_conn = AsyncMock()
+    mock_conn.fetchval.return_value = None  # empty table, no watermark yet
+    mock_conn.transaction = MagicMock()  # asyncpg returns the transaction context manager synchronously
+    return mock_conn
+
+@pytest.fixture
+def pool(mocker, conn):
+    mock_pool = MagicMock()
+    mock_pool.acquire.return_value.__aenter__.return_value = conn
+    mock_pool.close = AsyncMock()
+    mocker.patch('asyncpg.create_pool', AsyncMock(return_value=mock_pool))
     return mock_pool
 
 @pytest.mark.asyncio
@@ -39,7 +49,8 @@ async def test_create_pool(db_params):
     with patch('asyncpg.create_pool', AsyncMock()) as mocked_pool:
         pool = await create_pool(**db_params)
         assert mocked_pool.called
-        mocked_pool.assert_called_with(host='localhost', database='test_db', user='user', password='password', command_timeout=60)
+        mocked_pool.assert_called_with(host='localhost', database='test_db', user='user', password='password', command_timeout=60,
+                                       min_size=5, max_size=20)
 
 @pytest.mark.asyncio
 async def test_download_binance_futures_data(mocker, binance_market, db_params, pool):
@@ -48,31 +59,30 @@ async def test_download_binance_futures_data(mocker, binance_market, db_params,
     mock_binance.markets = binance_market
 
     mocker.patch('ccxt.async_support.binance', return_value=mock_binance)
+    mocker.patch('BinanceExport.load_markets', AsyncMock(return_value=binance_market))
 
-    with patch('data_downloader.process_symbol', new_callable=AsyncMock) as mock_process_symbol:
+    with patch('BinanceExport.process_symbol', new_callable=AsyncMock) as mock_process_symbol:
         await download_binance_futures_data('future', db_params, 'BTC/USDT,ETH/USDT')
         assert mock_process_symbol.call_count == 2
 
 @pytest.mark.asyncio
-async def test_process_symbol(mocker, pool):
+async def test_process_symbol(binance_market, pool, conn):
     symbol = 'BTC/USDT'
     mock_binance = AsyncMock()
-    mock_binance.market.return_value = binance_market['BTC/USDT']
-
-    mock_conn = mocker.MagicMock()
-    pool.acquire.return_value.__aenter__.return_value = mock_conn
+    mock_binance.market = MagicMock(return_value=binance_market['BTC/USDT'])
+    mock_binance.last_response_headers = {}
 
     ohlcv_data = [
         [1609459200000, 29000, 29500, 28900, 29400, 100],  # timestamp, open, high, low, close, volume
         [1609459260000, 29400, 29600, 29300, 29500, 150]
     ]
 
-    mock_binance.fetch_ohlcv.return_value = ohlcv_data
+    mock_binance.fetch_ohlcv.side_effect = [ohlcv_data, []]
 
-    await process_symbol(symbol, mock_binance, pool)
-    mock_conn.executemany.assert_called_once()
-    assert mock_conn.executemany.call_args[0][0] == f'INSERT INTO "BTCUSDT" (timestamp, open, high, low, close, volume) VALUES ($1, $2, $3, $4, $5, $6);'
-    assert mock_conn.executemany.call_args[0][1] == ohlcv_data
+    await process_symbol(symbol, mock_binance, pool, scheduler=WeightScheduler())
+    conn.executemany.assert_called_once()
+    assert conn.executemany.call_args[0][0] == f'INSERT INTO "BTCUSDT" (timestamp, open, high, low, close, volume) VALUES ($1, $2, $3, $4, $5, $6);'
+    assert conn.executemany.call_args[0][1] == [tuple(row) for row in ohlcv_data]
 
 def test_load_config():
     with patch('configparser.ConfigParser.read', return_value=None), \
@@ -80,3 +90,39 @@ def test_load_config():
          patch('configparser.ConfigParser.items', return_value=[('host', 'localhost'), ('database', 'test_db')]):
         config = load_config('database.ini', 'postgresql')
         assert config == {'host': 'localhost', 'database': 'test_db'}
+
+def ohlcv_pages(count, rows=3):
+    return [
+        [[1609459200000 + (page * rows + i) * 60_000, 29000, 29500, 28900, 29400, 100] for i in range(rows)]
+        for page in range(count)
+    ]
+
+@pytest.mark.asyncio
+async def test_process_symbol_copy_batches_pages(binance_market, pool, conn):
+    mock_binance = AsyncMock()
+    mock_binance.market = MagicMock(return_value=binance_market['BTC/USDT'])
+    mock_binance.last_response_headers = {}
+    pages = ohlcv_pages(5)
+    mock_binance.fetch_ohlcv.side_effect = pages + [[]]
+
+    await process_symbol('BTC/USDT', mock_binance, pool, write_mode="copy", copy_pages=2, scheduler=WeightScheduler())
+
+    # Two full batches of two pages, then the last page from the final flush
+    batches = [call.kwargs['records'] for call in conn.copy_records_to_table.await_args_list]
+    assert [len(records) for records in batches] == [6, 6, 3]
+    assert [row for records in batches for row in records] == [tuple(row) for page in pages for row in page]
+    conn.executemany.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_process_symbol_copy_flushes_buffered_pages_on_error(binance_market, pool, conn):
+    mock_binance = AsyncMock()
+    mock_binance.market = MagicMock(return_value=binance_market['BTC/USDT'])
+    mock_binance.last_response_headers = {}
+    pages = ohlcv_pages(3)
+    mock_binance.fetch_ohlcv.side_effect = pages + [ValueError("bad page")]
+
+    await process_symbol('BTC/USDT', mock_binance, pool, write_mode="copy", copy_pages=10, scheduler=WeightScheduler())
+
+    # Nothing reached the batch size; the buffered pages are still written before the error ends the symbol
+    conn.copy_records_to_table.assert_awaited_once()
+    assert len(conn.copy_records_to_table.await_args.kwargs['records']) == 9
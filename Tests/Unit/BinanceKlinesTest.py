@@ -0,0 +1,42 @@
+import json
+import struct
+
+from BinanceCodec import ScaledCodec
+from BinanceKlines import KlineColumns, kline_api, loads
+from BinanceStorage import PGCOPY_HEADER, binary_copy
+
+RAW = json.dumps([
+    [1609459200000, "28923.63", "28961.66", "28913.12", "28961.66", "27.457032", 1609459259999, "794382.6", 1292, "0", "0", "0"],
+    [1609459260000, "28961.67", "29017.50", "28961.01", "29009.91", "58.477501", 1609459319999, "1695802.7", 1651, "0", "0", "0"],
+]).encode()
+
+def test_from_raw_decodes_typed_columns():
+    columns = KlineColumns.from_raw(loads(RAW))
+    assert len(columns) == 2
+    assert columns.timestamp.dtype.kind == "i" and columns.close.dtype.kind == "f"
+    assert columns.rows()[1] == (1609459260000, 28961.67, 29017.5, 28961.01, 29009.91, 58.477501)
+    assert columns[-1][0] == 1609459260000
+
+def test_concat_and_empty_pages():
+    columns = KlineColumns.from_raw(loads(RAW))
+    assert len(KlineColumns.from_raw([])) == 0
+    assert KlineColumns.concat([columns, columns]).timestamp.tolist() == [1609459200000, 1609459260000] * 2
+
+def test_kline_api_follows_market_kind():
+    assert kline_api({'spot': True}) == 'public'
+    assert kline_api({'linear': True}) == 'fapiPublic'
+    assert kline_api({'inverse': True}) == 'dapiPublic'
+
+def test_binary_copy_encodes_fixed_width_tuples():
+    columns = KlineColumns.from_raw(loads(RAW))
+    values = ScaledCodec(2, 6).encode_columns(columns)
+    payload = binary_copy([b"BTC/USDT", columns.timestamp, *values])
+
+    assert payload.startswith(PGCOPY_HEADER) and payload.endswith(struct.pack("!h", -1))
+    body = payload[len(PGCOPY_HEADER):-2]
+    tuple_size = 2 + (4 + 8) + 6 * (4 + 8)
+    assert len(body) == 2 * tuple_size
+
+    count, size, symbol, ts_size, timestamp, price_size, open_ = struct.unpack_from("!hi8sIqIq", body)
+    assert (count, size, symbol, ts_size, price_size) == (7, 8, b"BTC/USDT", 8, 8)
+    assert (timestamp, open_) == (1609459200000, 2892363)
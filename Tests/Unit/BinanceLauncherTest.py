@@ -0,0 +1,59 @@
+import pytest
+
+from BinanceLauncher import ShardWorker, lock_key, shard_of
+
+class FakeLocks:
+    """ Session-level advisory locks shared by several fake connections """
+
+    def __init__(self):
+        self.owners = {}
+
+class FakeLockConn:
+    def __init__(self, locks):
+        self.locks = locks
+
+    async def fetchval(self, query, key):
+        if "pg_try_advisory_lock" in query:
+            if self.locks.owners.setdefault(key, self) is self:
+                return True
+            return False
+        if self.locks.owners.get(key) is self:
+            del self.locks.owners[key]
+            return True
+        return False
+
+    async def fetch(self, query):
+        return [{'key': key} for key in self.locks.owners]
+
+    def close(self):
+        for key in [key for key, owner in self.locks.owners.items() if owner is self]:
+            del self.locks.owners[key]
+
+SYMBOLS = [f"SYM{i}/USDT:USDT" for i in range(40)]
+
+def test_lock_keys_are_stable_and_non_negative():
+    assert lock_key("BTC/USDT:USDT") == lock_key("BTC/USDT:USDT")
+    assert 0 <= lock_key("BTC/USDT:USDT") < 2 ** 63
+    assert {shard_of(symbol, 4) for symbol in SYMBOLS} == {0, 1, 2, 3}
+
+@pytest.mark.asyncio
+async def test_workers_split_symbols_and_adopt_then_return_orphans():
+    locks = FakeLocks()
+    first, second = (ShardWorker(FakeLockConn(locks), SYMBOLS, 2, slot_hint=i) for i in range(2))
+    assert await first.claim_slot() == 0
+    assert await second.claim_slot() == 1
+
+    owned_first = set(await first.rebalance())
+    owned_second = set(await second.rebalance())
+    assert owned_first | owned_second == set(SYMBOLS)
+    assert not owned_first & owned_second
+
+    # The second worker dies: its slot and symbols are released and the first adopts them
+    second.lock_conn.close()
+    assert set(await first.rebalance()) == set(SYMBOLS)
+
+    # A replacement takes the slot back; the first hands the symbols over on its next pass
+    replacement = ShardWorker(FakeLockConn(locks), SYMBOLS, 2, slot_hint=1)
+    assert await replacement.claim_slot() == 1
+    assert set(await first.rebalance()) == owned_first
+    assert set(await replacement.rebalance()) == owned_second
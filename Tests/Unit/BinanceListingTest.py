@@ -0,0 +1,57 @@
+import json
+from unittest.mock import AsyncMock, MagicMock
+import pytest
+
+from BinanceListing import ListingCache, first_candle, onboard_date, start_timestamp, start_timestamp_sync
+
+def test_onboard_date():
+    assert onboard_date({'info': {'onboardDate': '1569398400000'}}) == 1569398400000
+    assert onboard_date({'info': {}, 'created': 1569398400000}) == 1569398400000
+    assert onboard_date({'info': {'onboardDate': 'soon'}}) is None
+    assert onboard_date({'info': None}) is None
+
+def test_listing_cache_round_trips_and_keeps_other_writers(tmp_path):
+    path = tmp_path / "listings.json"
+    first, second = ListingCache(path), ListingCache(path)
+
+    first.set('BTC/USDT', 1)
+    second.set('ETH/USDT', 2)
+
+    assert json.loads(path.read_text()) == {'BTC/USDT': 1, 'ETH/USDT': 2}
+    assert ListingCache(path).get('BTC/USDT') == 1
+    assert [p.name for p in tmp_path.iterdir()] == ["listings.json"]
+
+@pytest.mark.asyncio
+async def test_first_candle():
+    binance = AsyncMock()
+    binance.fetch_ohlcv.side_effect = [[[120_000, 1, 1, 1, 1, 1]], []]
+
+    assert await first_candle(binance, 'BTC/USDT', 60_000) == 120_000
+    assert await first_candle(binance, 'BTC/USDT', 60_000) is None
+    assert binance.fetch_ohlcv.await_args.kwargs == {'timeframe': "1m", 'since': 60_000, 'limit': 1}
+
+@pytest.mark.asyncio
+async def test_start_timestamp_prefers_watermark_then_cached_listing(tmp_path):
+    binance = AsyncMock()
+    binance.market = MagicMock(return_value={'info': {'onboardDate': 60_000}})
+    binance.fetch_ohlcv.return_value = [[180_000, 1, 1, 1, 1, 1]]
+    cache = ListingCache(tmp_path / "listings.json")
+
+    assert await start_timestamp(binance, 'BTC/USDT', 600_000, cache) == 600_001
+    assert await start_timestamp(binance, 'BTC/USDT', None) == 0
+    assert await start_timestamp(binance, 'BTC/USDT', None, cache) == 180_000
+    assert await start_timestamp(binance, 'BTC/USDT', None, cache) == 180_000
+
+    # The probe starts at the onboard date and runs once; later calls are answered from the cache
+    binance.fetch_ohlcv.assert_awaited_once_with('BTC/USDT', timeframe="1m", since=60_000, limit=1)
+    assert cache.get('BTC/USDT') == 180_000
+
+def test_start_timestamp_sync(tmp_path):
+    binance = MagicMock()
+    binance.market.return_value = {'info': {}}
+    binance.fetch_ohlcv.return_value = []
+    cache = ListingCache(tmp_path / "listings.json")
+
+    assert start_timestamp_sync(binance, 'BTC/USDT', 5, cache) == 6
+    assert start_timestamp_sync(binance, 'BTC/USDT', None, cache) == 0
+    assert cache.get('BTC/USDT') is None
@@ -0,0 +1,165 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock, MagicMock
+import pytest
+import pytest_asyncio
+from aiohttp import web
+
+from BinanceLive import LiveIngest, kline_row
+
+MINUTE = 60_000
+
+def kline_message(market_id, start, closed=True):
+    return {
+        'stream': f"{market_id.lower()}@kline_1m",
+        'data': {
+            'e': 'kline',
+            's': market_id,
+            'k': {
+                't': start, 'T': start + MINUTE - 1, 's': market_id, 'i': '1m',
+                'o': '100.5', 'h': '101.0', 'l': '99.5', 'c': '100.0', 'v': '12.345', 'x': closed,
+            },
+        },
+    }
+
+@pytest.fixture
+def binance():
+    markets = {'BTC/USDT': {'id': 'BTCUSDT'}, 'ETH/USDT': {'id': 'ETHUSDT'}}
+    mock_binance = MagicMock()
+    mock_binance.market.side_effect = markets.__getitem__
+    mock_binance.fetch_ohlcv = AsyncMock(return_value=[])
+    mock_binance.last_response_headers = {}
+    return mock_binance
+
+@pytest_asyncio.fixture
+async def stream_server(aiohttp_server):
+    """ Local stand-in for the combined-stream endpoint; each connection replays `messages` then closes """
+    state = {'messages': [], 'connections': 0, 'streams': [], 'changed': asyncio.Condition()}
+
+    async def handler(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        async with state['changed']:
+            state['connections'] += 1
+            state['streams'].append(request.query['streams'])
+            state['changed'].notify_all()
+        for message in state['messages']:
+            await ws.send_str(json.dumps(message))
+        await ws.close()
+        return ws
+
+    app = web.Application()
+    app.router.add_get('/stream', handler)
+    server = await aiohttp_server(app)
+    state['url'] = str(server.make_url('/stream'))
+    return state
+
+async def wait_for(condition, predicate):
+    async with condition:
+        await asyncio.wait_for(condition.wait_for(predicate), 5)
+
+def test_kline_row():
+    assert kline_row(kline_message('BTCUSDT', 0)['data']['k']) == (0, 100.5, 101.0, 99.5, 100.0, 12.345)
+
+@pytest.mark.asyncio
+async def test_live_ingest_writes_closed_candles(binance, stream_server):
+    stream_server['messages'] = [
+        kline_message('BTCUSDT', 10 * MINUTE),
+        kline_message('ETHUSDT', 10 * MINUTE),
+        kline_message('BTCUSDT', 11 * MINUTE, closed=False),
+        kline_message('BTCUSDT', 9 * MINUTE),  # already stored
+    ]
+    written = {}
+
+    async def write(symbol, rows):
+        written.setdefault(symbol, []).extend(rows)
+
+    ingest = LiveIngest(
+        binance, ['BTC/USDT', 'ETH/USDT'], write, {'BTC/USDT': 9 * MINUTE, 'ETH/USDT': None},
+        url=stream_server['url'], batch_size=2, flush_interval=0.05, reconnect_delay=0.01
+    )
+    runner = asyncio.create_task(ingest.run())
+    # A reconnect means every message of the first connection was handled; stop() flushes the rest
+    await wait_for(stream_server['changed'], lambda: stream_server['connections'] >= 2)
+    ingest.stop()
+    await runner
+
+    assert stream_server['streams'][0] == 'btcusdt@kline_1m/ethusdt@kline_1m'
+    assert [row[0] for row in written['BTC/USDT']] == [10 * MINUTE]
+    assert [row[0] for row in written['ETH/USDT']] == [10 * MINUTE]
+
+@pytest.mark.asyncio
+async def test_live_ingest_fills_gap_over_rest_on_reconnect(binance, stream_server):
+    binance.fetch_ohlcv.side_effect = [
+        [[5 * MINUTE, 1, 2, 0.5, 1.5, 10], [6 * MINUTE, 1, 2, 0.5, 1.5, 10]],
+        [],
+    ] + [[]] * 1000
+    written = []
+    filled = asyncio.Event()
+
+    async def write(symbol, rows):
+        written.extend(rows)
+        filled.set()
+
+    ingest = LiveIngest(
+        binance, ['BTC/USDT'], write, {'BTC/USDT': 4 * MINUTE}, url=stream_server['url'], flush_interval=0.05,
+        reconnect_delay=0.01
+    )
+    runner = asyncio.create_task(ingest.run())
+    await asyncio.wait_for(filled.wait(), 5)
+    await wait_for(stream_server['changed'], lambda: stream_server['connections'] >= 2)
+    ingest.stop()
+    await runner
+
+    assert stream_server['connections'] >= 2
+    assert binance.fetch_ohlcv.call_args_list[0].kwargs['since'] == 4 * MINUTE + 1
+    assert [row[0] for row in written] == [5 * MINUTE, 6 * MINUTE]
+
+@pytest.mark.asyncio
+async def test_live_ingest_splits_streams_across_connections(binance, stream_server):
+    ingest = LiveIngest(
+        binance, ['BTC/USDT', 'ETH/USDT'], AsyncMock(), {}, url=stream_server['url'], streams_per_connection=1
+    )
+    runner = asyncio.create_task(ingest.run())
+    await wait_for(stream_server['changed'], lambda: len(set(stream_server['streams'])) >= 2)
+    ingest.stop()
+    await runner
+
+    assert {'btcusdt@kline_1m', 'ethusdt@kline_1m'} <= set(stream_server['streams'])
+
+@pytest.mark.asyncio
+async def test_catch_up_fills_from_connect_time_watermarks(binance, stream_server):
+    # Both symbols stream minute 100 while BTC's fill is still running, which moves ETH's live watermark
+    stream_server['messages'] = [kline_message('BTCUSDT', 100 * MINUTE), kline_message('ETHUSDT', 100 * MINUTE)]
+    streamed = asyncio.Event()
+    filled = asyncio.Event()
+    requests = []
+    written = {}
+
+    async def fetch_ohlcv(symbol, timeframe, since, limit):
+        requests.append((symbol, since))
+        if symbol == 'BTC/USDT':
+            await streamed.wait()
+        first = -(-since // MINUTE) * MINUTE
+        return [[t, 1, 2, 0.5, 1.5, 10] for t in range(first, min(first + limit * MINUTE, 120 * MINUTE), MINUTE)]
+
+    async def write(symbol, rows):
+        written.setdefault(symbol, []).extend(row[0] for row in rows)
+        if symbol == 'ETH/USDT' and 100 * MINUTE in written[symbol]:
+            streamed.set()
+        if symbol == 'ETH/USDT' and 99 * MINUTE in written[symbol]:
+            filled.set()
+
+    binance.fetch_ohlcv = AsyncMock(side_effect=fetch_ohlcv)
+    ingest = LiveIngest(
+        binance, ['BTC/USDT', 'ETH/USDT'], write, {'BTC/USDT': 10 * MINUTE, 'ETH/USDT': 10 * MINUTE},
+        url=stream_server['url'], batch_size=1, flush_interval=0.05
+    )
+    runner = asyncio.create_task(ingest.run())
+    await asyncio.wait_for(filled.wait(), 5)
+    ingest.stop()
+    await runner
+
+    assert ('ETH/USDT', 10 * MINUTE + 1) in requests
+    for symbol in ('BTC/USDT', 'ETH/USDT'):
+        assert sorted(written[symbol]) == list(range(11 * MINUTE, 101 * MINUTE, MINUTE))
@@ -0,0 +1,82 @@
+import json
+import os
+from time import time
+from unittest.mock import AsyncMock
+import ccxt.async_support as accxt
+import pytest
+import pytest_asyncio
+
+from BinanceMarkets import MarketCache, load_markets, perpetual_symbols
+
+def swap_market(base, contract_type='PERPETUAL', expiry=''):
+    return {
+        'id': f"{base}USDT{expiry and '_' + expiry}", 'symbol': f"{base}/USDT:USDT{expiry and '-' + expiry}",
+        'base': base, 'quote': 'USDT', 'settle': 'USDT', 'baseId': base, 'quoteId': 'USDT', 'settleId': 'USDT', 'type': 'swap', 'spot': False, 'margin': False,
+        'swap': True, 'future': False, 'option': False, 'active': True, 'contract': True, 'linear': True,
+        'inverse': False, 'contractSize': 1, 'precision': {'price': 0.1, 'amount': 0.001}, 'limits': {},
+        'info': {'contractType': contract_type},
+    }
+
+MARKETS = {
+    'BTC/USDT:USDT': swap_market('BTC'),
+    'ETH/USDT:USDT': swap_market('ETH'),
+    'BTC/USDT:USDT-250328': swap_market('BTC', 'CURRENT_QUARTER', '250328'),
+}
+
+@pytest_asyncio.fixture
+async def binance():
+    exchange = accxt.binance({'options': {'defaultType': 'future'}})
+    exchange.load_markets = AsyncMock(return_value=MARKETS)
+    yield exchange
+    await exchange.close()
+
+def test_perpetual_symbols():
+    assert perpetual_symbols(MARKETS) == ['BTC/USDT:USDT', 'ETH/USDT:USDT']
+
+@pytest.mark.asyncio
+async def test_cold_cache_loads_from_exchange_and_persists(binance, tmp_path):
+    path = tmp_path / "markets.json"
+
+    await load_markets(binance, MarketCache(path))
+
+    binance.load_markets.assert_awaited_once()
+    assert list(json.loads(path.read_text())['future']['markets']) == list(MARKETS)
+
+@pytest.mark.asyncio
+async def test_fresh_cache_skips_exchange(binance, tmp_path):
+    path = tmp_path / "markets.json"
+    MarketCache(path).set('future', MARKETS)
+
+    markets = await load_markets(binance, MarketCache(path))
+
+    binance.load_markets.assert_not_awaited()
+    assert binance.market('ETH/USDT:USDT')['id'] == 'ETHUSDT'
+    assert perpetual_symbols(markets) == ['BTC/USDT:USDT', 'ETH/USDT:USDT']
+
+@pytest.mark.asyncio
+async def test_stale_cache_is_used_and_refreshed_in_background(binance, tmp_path):
+    path = tmp_path / "markets.json"
+    stale = MarketCache(path)
+    stale.set('future', {'BTC/USDT:USDT': MARKETS['BTC/USDT:USDT']})
+    stale.entries['future']['loaded'] = time() - 2 * stale.ttl
+    stale.save()
+
+    cache = MarketCache(path)
+    await load_markets(binance, cache)
+    assert list(binance.markets) == ['BTC/USDT:USDT']
+
+    await cache.wait()
+    binance.load_markets.assert_awaited_once_with(reload=True)
+    assert cache.fresh('future')
+    assert list(MarketCache(path).get('future')) == list(MARKETS)
+
+def test_market_cache_writes_through_own_temp_file_and_keeps_other_writers(tmp_path, mocker):
+    path = tmp_path / "markets.json"
+    spot, future = MarketCache(path), MarketCache(path)
+    spot.set('spot', {'BTC/USDT': {}})
+    replace = mocker.spy(os, 'replace')
+    future.set('future', MARKETS)
+
+    assert set(MarketCache(path).entries) == {'spot', 'future'}
+    assert replace.call_args.args[0] != f"{path}.tmp"
+    assert [p.name for p in tmp_path.iterdir()] == ["markets.json"]
@@ -0,0 +1,58 @@
+from time import time
+from unittest.mock import MagicMock
+import pytest
+
+from BinanceMetrics import Histogram, InstrumentedPool, Metrics
+
+def test_histogram_percentiles_use_bucket_bounds():
+    histogram = Histogram(buckets=(0.01, 0.1, 1.0))
+    for seconds in [0.005] * 50 + [0.05] * 49 + [5.0]:
+        histogram.observe(seconds)
+
+    assert histogram.count == 100
+    assert histogram.percentile(0.5) == 0.01
+    assert histogram.percentile(0.99) == 0.1
+    assert histogram.percentile(1.0) == float("inf")
+    assert list(histogram.cumulative())[-1] == (float("inf"), 100)
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics()
+    pool = MagicMock()
+
+    metrics.observe("fetch", 0.2)
+    metrics.record_page("BTC/USDT", [[0, 1, 1, 1, 1, 1]])
+
+    assert metrics.histograms == {}
+    assert metrics.symbols == {}
+    assert metrics.wrap_pool(pool) is pool
+
+def test_render_exposes_histograms_rows_and_lag():
+    metrics = Metrics()
+    metrics.enabled = True
+    last_closed = int(time() * 1000) // 60_000 * 60_000 - 60_000
+
+    metrics.observe("fetch", 0.2)
+    metrics.record_page("BTC/USDT", [[last_closed - 120_000, 1, 1, 1, 1, 1], [last_closed - 60_000, 1, 1, 1, 1, 1]])
+    text = metrics.render()
+
+    assert 'binance_stage_seconds_bucket{stage="fetch",le="0.25"} 1' in text
+    assert 'binance_stage_seconds_count{stage="fetch"} 1' in text
+    assert 'binance_rows_total{symbol="BTC/USDT"} 2' in text
+    assert 'binance_lag_seconds{symbol="BTC/USDT"} 60' in text
+    assert "2 rows" in metrics.summary()
+
+@pytest.mark.asyncio
+async def test_instrumented_pool_times_acquire():
+    metrics = Metrics()
+    metrics.enabled = True
+    conn = object()
+    pool = MagicMock()
+    pool.acquire.return_value.__aenter__.return_value = conn
+
+    instrumented = metrics.wrap_pool(pool)
+    async with instrumented.acquire() as acquired:
+        assert acquired is conn
+
+    assert isinstance(instrumented, InstrumentedPool)
+    assert metrics.histograms["pool_wait"].count == 1
+    pool.acquire.return_value.__aexit__.assert_awaited_once()
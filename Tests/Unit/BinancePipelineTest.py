@@ -0,0 +1,74 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+import pytest
+
+from BinancePipeline import PipelineStats, fetch_pages, fetch_pages_sync, run_pipeline, run_pipeline_sync
+
+def make_pages(count, size=3):
+    pages = [[[page * size + i, 1, 2, 0.5, 1.5, 10] for i in range(size)] for page in range(count)]
+    return pages + [[]]
+
+@pytest.mark.asyncio
+async def test_run_pipeline_writes_pages_in_order():
+    mock_binance = AsyncMock()
+    mock_binance.fetch_ohlcv.side_effect = make_pages(4)
+    written = []
+
+    async def write(page):
+        written.extend(row[0] for row in page)
+
+    stats = PipelineStats('BTC/USDT', 2)
+    await run_pipeline(fetch_pages(mock_binance, 'BTC/USDT', 0, stats, delay=0), write, stats, 2)
+
+    assert written == list(range(12))
+    assert stats.pages == 4
+    assert stats.rows == 12
+    assert stats.max_depth <= 2
+    assert mock_binance.fetch_ohlcv.call_args_list[1].kwargs['since'] == 3
+
+@pytest.mark.asyncio
+async def test_run_pipeline_reraises_fetch_error_after_draining():
+    mock_binance = AsyncMock()
+    mock_binance.fetch_ohlcv.side_effect = make_pages(2)[:2] + [RuntimeError('boom')]
+    written = []
+
+    async def write(page):
+        written.extend(page)
+
+    stats = PipelineStats('BTC/USDT', 1)
+    with pytest.raises(RuntimeError):
+        await run_pipeline(fetch_pages(mock_binance, 'BTC/USDT', 0, stats, delay=0), write, stats, 1)
+    assert len(written) == 6
+
+@pytest.mark.asyncio
+async def test_run_pipeline_stops_producer_on_write_error():
+    mock_binance = AsyncMock()
+    mock_binance.fetch_ohlcv.side_effect = make_pages(10)
+    write = AsyncMock(side_effect=ValueError('db down'))
+
+    stats = PipelineStats('BTC/USDT', 1)
+    with pytest.raises(ValueError):
+        await run_pipeline(fetch_pages(mock_binance, 'BTC/USDT', 0, stats, delay=0), write, stats, 1)
+    assert mock_binance.fetch_ohlcv.call_count < 10
+
+def test_run_pipeline_sync_writes_pages_in_order():
+    mock_binance = MagicMock()
+    mock_binance.fetch_ohlcv.side_effect = make_pages(5)
+    written = []
+
+    stats = PipelineStats('ETH/USDT', 2)
+    run_pipeline_sync(fetch_pages_sync(mock_binance, 'ETH/USDT', 0, stats, delay=0), written.extend, stats, 2)
+
+    assert [row[0] for row in written] == list(range(15))
+    assert stats.pages == 5
+
+def test_run_pipeline_sync_propagates_write_error():
+    mock_binance = MagicMock()
+    mock_binance.fetch_ohlcv.side_effect = make_pages(10)
+
+    def write(page):
+        raise ValueError('db down')
+
+    stats = PipelineStats('ETH/USDT', 1)
+    with pytest.raises(ValueError):
+        run_pipeline_sync(fetch_pages_sync(mock_binance, 'ETH/USDT', 0, stats, delay=0), write, stats, 1)
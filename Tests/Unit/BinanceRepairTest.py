@@ -0,0 +1,104 @@
+from unittest.mock import AsyncMock, MagicMock
+import pytest
+from ccxt.base.errors import NetworkError
+
+from BinanceRepair import HoleCache, RefetchCoverage, coalesce_gaps, find_gaps, repair_symbol
+from BinanceRetry import RetryPolicy
+from BinanceScheduler import WeightScheduler
+from BinanceStorage import PerSymbolLayout
+
+MINUTE = 60_000
+
+class FakeExchange:
+    """ Serves 1m candles except for a permanent hole, failing the first requests """
+
+    def __init__(self, count, hole, failures=0):
+        self.candles = [[i * MINUTE, 1, 2, 0.5, 1.5, 10] for i in range(count) if not hole[0] <= i < hole[1]]
+        self.last_response_headers = {}
+        self.failures = failures
+        self.requests = 0
+
+    async def fetch_ohlcv(self, symbol, timeframe, since, limit):
+        self.requests += 1
+        if self.failures:
+            self.failures -= 1
+            raise NetworkError("connection reset")
+        return [x for x in self.candles if x[0] >= since][:limit]
+
+    def market(self, symbol):
+        return {'symbol': symbol}
+
+    def milliseconds(self):
+        return self.candles[-1][0] + MINUTE
+
+def fake_pool(gaps, first=0):
+    conn = AsyncMock()
+    conn.fetch.return_value = [{'gap_start': start, 'gap_end': end} for start, end in gaps]
+    conn.fetchval.return_value = first
+    pool = MagicMock()
+    pool.acquire.return_value.__aenter__.return_value = conn
+    return pool, conn
+
+def fake_layout():
+    layout = MagicMock()
+    for method in ("exists", "ensure", "ensure_index", "upsert"):
+        setattr(layout, method, AsyncMock(return_value=True))
+    layout.select_sql.return_value = "SELECT * FROM candles"
+    return layout
+
+def test_coalesce_gaps_merges_holes_within_one_page():
+    gaps = [(10 * MINUTE, 12 * MINUTE), (2 * MINUTE, 3 * MINUTE), (20 * MINUTE, 21 * MINUTE)]
+    assert coalesce_gaps(gaps, max_span=30 * MINUTE) == [(2 * MINUTE, 21 * MINUTE)]
+
+def test_coalesce_gaps_keeps_distant_holes_apart():
+    gaps = [(0, MINUTE), (100 * MINUTE, 101 * MINUTE)]
+    assert coalesce_gaps(gaps, max_span=30 * MINUTE) == gaps
+
+def test_coalesce_gaps_keeps_large_hole_as_one_range():
+    gaps = [(0, 5000 * MINUTE)]
+    assert coalesce_gaps(gaps, max_span=1500 * MINUTE) == gaps
+
+def test_refetch_coverage_finds_holes_across_pages():
+    coverage = RefetchCoverage(10 * MINUTE, 40 * MINUTE)
+    coverage.add([12 * MINUTE, 13 * MINUTE])
+    coverage.add([i * MINUTE for i in range(20, 30)])  # stored candles between the two gaps
+
+    gaps = [(10 * MINUTE, 20 * MINUTE), (30 * MINUTE, 40 * MINUTE)]
+    assert coverage.holes(gaps) == [(10 * MINUTE, 12 * MINUTE), (14 * MINUTE, 20 * MINUTE), (30 * MINUTE, 40 * MINUTE)]
+
+@pytest.mark.asyncio
+async def test_find_gaps_reads_gap_bounds():
+    pool, conn = fake_pool([(10 * MINUTE, 20 * MINUTE)])
+
+    gaps = await find_gaps(conn, PerSymbolLayout(), "BTC/USDT", since=5 * MINUTE)
+
+    assert gaps == [(10 * MINUTE, 20 * MINUTE)]
+    assert conn.fetch.await_args.args[1] == 5 * MINUTE
+    assert 'FROM "BTCUSDT"' in conn.fetch.await_args.args[0]
+
+@pytest.mark.asyncio
+async def test_repair_symbol_refetches_gaps_and_remembers_exchange_holes(tmp_path, mocker):
+    mocker.patch('BinanceBackfill.PAGE_LIMIT', 7)
+    # Stored: 0-9, 20-29 and 40-49; the exchange has nothing for 30-39 and flakes once
+    exchange = FakeExchange(count=50, hole=(30, 40), failures=1)
+    gaps = [(10 * MINUTE, 20 * MINUTE), (30 * MINUTE, 40 * MINUTE)]
+    pool, conn = fake_pool(gaps)
+    layout = fake_layout()
+    holes = HoleCache(str(tmp_path / "holes.json"))
+    scheduler = WeightScheduler(weight_limit=10**9)
+
+    repaired = await repair_symbol("BTC/USDT", exchange, pool, layout, scheduler, retry=RetryPolicy(base=0.001),
+                                   hole_cache=holes)
+
+    upserted = [row[0] for call in layout.upsert.await_args_list for row in call.args[2]]
+    assert repaired == len(upserted)
+    # Written page by page, never as one range-sized transaction
+    assert max(len(call.args[2]) for call in layout.upsert.await_args_list) <= 7
+    assert set(range(10 * MINUTE, 20 * MINUTE, MINUTE)) <= set(upserted)
+    assert HoleCache(holes.path).holes == {"BTC/USDT": [[30 * MINUTE, 40 * MINUTE]]}
+
+    # The next run only finds the exchange's own hole and does not ask for it again
+    pool, conn = fake_pool(gaps[1:])
+    requests = exchange.requests
+    assert await repair_symbol("BTC/USDT", exchange, pool, layout, scheduler, hole_cache=HoleCache(holes.path)) == 0
+    assert exchange.requests == requests
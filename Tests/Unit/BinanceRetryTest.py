@@ -0,0 +1,108 @@
+from time import monotonic
+from unittest.mock import AsyncMock, MagicMock
+import asyncpg
+import pytest
+from ccxt.base.errors import BadSymbol, DDoSProtection, NetworkError, RateLimitExceeded
+
+from BinancePipeline import fetch_pages
+from BinanceRetry import BAN, BAN_PAUSE, FATAL, RATE_LIMIT, TRANSIENT, RetryPolicy, classify, with_retry
+from BinanceScheduler import WeightScheduler
+
+def test_classify():
+    wrapped = RuntimeError("wrapped")
+    wrapped.__cause__ = asyncpg.exceptions.ConnectionDoesNotExistError()
+
+    assert classify(RateLimitExceeded("429")) == RATE_LIMIT
+    assert classify(DDoSProtection("418")) == BAN
+    assert classify(NetworkError("reset")) == TRANSIENT
+    assert classify(wrapped) == TRANSIENT
+    assert classify(BadSymbol("nope")) == FATAL
+    assert classify(asyncpg.exceptions.UndefinedTableError()) == FATAL
+
+def test_delay_honours_retry_after():
+    policy = RetryPolicy(attempts=2)
+
+    assert policy.delay(RateLimitExceeded("429"), 0, {'Retry-After': '7'}) == (RATE_LIMIT, 7.0)
+    assert policy.delay(DDoSProtection("418"), 0) == (BAN, BAN_PAUSE)
+    assert policy.delay(NetworkError("reset"), 1)[1] <= policy.base * 2
+    assert policy.delay(NetworkError("reset"), 2) == (TRANSIENT, None)
+    assert policy.delay(BadSymbol("nope"), 0) == (FATAL, None)
+
+@pytest.mark.asyncio
+async def test_with_retry_recovers_from_transient_errors():
+    call = AsyncMock(side_effect=[NetworkError("reset"), ConnectionResetError(), "page"])
+
+    assert await with_retry(call, RetryPolicy(base=0.001), "BTC/USDT") == "page"
+    assert call.await_count == 3
+
+@pytest.mark.asyncio
+async def test_with_retry_raises_fatal_and_exhausted_errors():
+    fatal = AsyncMock(side_effect=BadSymbol("nope"))
+    flaky = AsyncMock(side_effect=NetworkError("reset"))
+
+    with pytest.raises(BadSymbol):
+        await with_retry(fatal, RetryPolicy(base=0.001), "BTC/USDT")
+    with pytest.raises(NetworkError):
+        await with_retry(flaky, RetryPolicy(attempts=2, base=0.001), "BTC/USDT")
+
+    assert fatal.await_count == 1
+    assert flaky.await_count == 3
+
+@pytest.mark.asyncio
+async def test_nested_layers_do_not_multiply_attempts():
+    policy = RetryPolicy(attempts=2, base=0.001)
+    request = AsyncMock(side_effect=NetworkError("reset"))
+    write = AsyncMock(side_effect=[ConnectionResetError(), None])
+
+    async def ingest():
+        await write()
+        await with_retry(request, policy, "BTC/USDT")
+
+    # The outer layer retries the write the inner one never saw, but not the request the inner one gave up on
+    with pytest.raises(NetworkError):
+        await with_retry(ingest, policy, "BTC/USDT")
+
+    assert write.await_count == 2
+    assert request.await_count == 3
+
+@pytest.mark.asyncio
+async def test_progress_starts_the_backoff_over():
+    committed = 0
+
+    async def ingest():
+        nonlocal committed
+        committed += 1
+        if committed < 5:
+            raise ConnectionResetError()
+        return committed
+
+    assert await with_retry(ingest, RetryPolicy(attempts=1, base=0.001), "BTC/USDT", progress=lambda: committed) == 5
+    with pytest.raises(ConnectionResetError):
+        await with_retry(AsyncMock(side_effect=ConnectionResetError()), RetryPolicy(attempts=1, base=0.001), "BTC/USDT",
+                         progress=lambda: committed)
+
+@pytest.mark.asyncio
+async def test_rate_limit_pauses_the_shared_scheduler():
+    scheduler = WeightScheduler()
+    call = AsyncMock(side_effect=[RateLimitExceeded("429"), "page"])
+
+    started = monotonic()
+    result = await with_retry(call, RetryPolicy(), "BTC/USDT", scheduler, lambda: {'Retry-After': '30'})
+
+    # The breaker holds every symbol's next acquire(), not just the one that was refused
+    assert result == "page"
+    assert scheduler.pauses == 1
+    assert scheduler._delay(1) > 29
+    assert monotonic() - started < 1
+
+@pytest.mark.asyncio
+async def test_fetch_pages_retries_in_place():
+    binance = MagicMock()
+    binance.last_response_headers = {'Retry-After': '0'}
+    page = [[1609459200000, 1, 2, 0.5, 1.5, 10]]
+    binance.fetch_ohlcv = AsyncMock(side_effect=[RateLimitExceeded("429"), NetworkError("reset"), page, []])
+
+    pages = [p async for p in fetch_pages(binance, "BTC/USDT", 0, delay=0, retry=RetryPolicy(base=0.001))]
+
+    assert pages == [page]
+    assert binance.fetch_ohlcv.await_args_list[-1].kwargs['since'] == page[-1][0] + 1
@@ -0,0 +1,51 @@
+import pytest
+
+from BinanceRollup import ROLLUPS, Rollups, bucket_bounds
+from BinanceStorage import PartitionedLayout, PerSymbolLayout
+
+MINUTE = 60_000
+
+def test_bucket_bounds_cover_every_touched_bucket():
+    assert bucket_bounds(7 * MINUTE, 7 * MINUTE, ROLLUPS['5T']) == (5 * MINUTE, 10 * MINUTE)
+    assert bucket_bounds(4 * MINUTE, 11 * MINUTE, ROLLUPS['5T']) == (0, 15 * MINUTE)
+
+def test_rollup_tables_are_named_per_layout():
+    assert Rollups(PerSymbolLayout("_FUTURE")).table('1H') == "rollup_future_1h"
+    assert Rollups(PartitionedLayout()).table('5T') == "ohlcv_rollup_5t"
+
+@pytest.mark.asyncio
+async def test_update_refreshes_each_timeframe_and_registers_coverage_once(mocker):
+    conn = mocker.AsyncMock()
+    rollups = Rollups(PerSymbolLayout(), ['5T', '1H'])
+    await rollups.update(conn, "BTC/USDT", 61 * MINUTE, 62 * MINUTE)
+    await rollups.update(conn, "BTC/USDT", 61 * MINUTE, 62 * MINUTE)
+
+    ranges = [call.args[1:] for call in conn.execute.call_args_list if "rollup_1h" in call.args[0] or "rollup_5t" in call.args[0]]
+    assert ranges[:2] == [("BTCUSDT", 60 * MINUTE, 65 * MINUTE), ("BTCUSDT", 60 * MINUTE, 120 * MINUTE)]
+    coverage = [call for call in conn.execute.call_args_list if "rollup_coverage" in call.args[0]]
+    assert len(coverage) == 1 and coverage[0].args[1:] == ("BTCUSDT", 61 * MINUTE)
+
+def test_update_sync_runs_the_same_refresh_with_psycopg2_parameters(mocker):
+    cursor = mocker.MagicMock()
+    rollups = Rollups(PerSymbolLayout(), ['5T', '1H'])
+    rollups.update_sync(cursor, "BTC/USDT", 61 * MINUTE, 62 * MINUTE)
+    rollups.update_sync(cursor, "BTC/USDT", 61 * MINUTE, 62 * MINUTE)
+
+    statements = [call.args for call in cursor.execute.call_args_list]
+    assert not any("$" in sql for sql, _ in statements)
+    assert [params for sql, params in statements if "rollup_5t" in sql][0] == ("BTCUSDT", 60 * MINUTE, 65 * MINUTE)
+    assert [params for sql, params in statements if "rollup_coverage" in sql] == [("BTCUSDT", 61 * MINUTE)]
+
+@pytest.mark.asyncio
+async def test_rollups_index_per_symbol_tables(mocker):
+    conn = mocker.AsyncMock()
+    conn.transaction = mocker.MagicMock()
+    layout = PerSymbolLayout()
+
+    await layout.ensure(conn, "BTC/USDT")
+    assert not any("INDEX" in call.args[0] for call in conn.execute.call_args_list)
+
+    # Rollup refreshes range-scan every written batch, so the table must not stay unindexed
+    layout.rollups = Rollups(layout)
+    await layout.ensure(conn, "BTC/USDT")
+    assert any('"BTCUSDT_timestamp_key"' in call.args[0] for call in conn.execute.call_args_list)
@@ -0,0 +1,33 @@
+import pytest
+
+from BinanceScheduler import WeightScheduler, kline_weight, used_weight
+
+def test_kline_weight():
+    assert kline_weight(50) == 1
+    assert kline_weight(499) == 2
+    assert kline_weight(1000) == 5
+    assert kline_weight(1500) == 10
+
+def test_used_weight_header_is_case_insensitive():
+    assert used_weight({'X-MBX-USED-WEIGHT-1M': '42'}) == 42
+    assert used_weight({'x-mbx-used-weight-1m': '7'}) == 7
+    assert used_weight({'Content-Type': 'application/json'}) is None
+    assert used_weight(None) is None
+
+@pytest.mark.asyncio
+async def test_acquire_spends_tokens_without_waiting_when_budget_is_free():
+    scheduler = WeightScheduler(weight_limit=600, utilization=1.0)
+    for _ in range(10):
+        await scheduler.acquire(10)
+
+    assert scheduler.requests == 10
+    assert scheduler.waited == 0.0
+    assert scheduler.window_used == 100
+
+def test_observe_trusts_server_counter():
+    scheduler = WeightScheduler(weight_limit=600, utilization=1.0)
+    scheduler.observe({'x-mbx-used-weight-1m': '590'})
+
+    assert scheduler.window_used == 590
+    assert scheduler.tokens <= 10
+    assert scheduler._delay(20) > 0
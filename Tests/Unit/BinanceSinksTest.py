@@ -0,0 +1,64 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+import pytest
+
+from BinancePipeline import PipelineStats
+from BinanceSinks import Sink, export_symbol
+
+class ListSink(Sink):
+    name = "list"
+
+    def __init__(self, symbol, last=None, batch_pages=1, queue_size=4, delay=0, fail=False):
+        super().__init__(symbol, batch_pages, queue_size)
+        self.start = last
+        self.delay = delay
+        self.fail = fail
+        self.written = []
+
+    async def open(self):
+        self.last = self.start
+        return self.last
+
+    async def write_batch(self, pages):
+        if self.fail:
+            raise ValueError("disk full")
+        await asyncio.sleep(self.delay)
+        self.written.extend(row for page in pages for row in page)
+
+def mock_exchange(count, size=3):
+    pages = [[[page * size + i, 1, 2, 0.5, 1.5, 10] for i in range(size)] for page in range(count)]
+    binance = MagicMock()
+    binance.fetch_ohlcv = AsyncMock(side_effect=pages + [[]])
+    return binance
+
+@pytest.mark.asyncio
+async def test_export_symbol_fetches_once_from_oldest_resume_point():
+    binance = mock_exchange(3)
+    behind, ahead = ListSink('BTC/USDT', last=1), ListSink('BTC/USDT', last=5)
+
+    await export_symbol('BTC/USDT', binance, [behind, ahead])
+
+    assert binance.fetch_ohlcv.await_args_list[0].kwargs['since'] == 2
+    assert [row[0] for row in behind.written] == list(range(2, 9))
+    assert [row[0] for row in ahead.written] == [6, 7, 8]
+
+@pytest.mark.asyncio
+async def test_failing_sink_does_not_stop_the_others():
+    binance = mock_exchange(4)
+    good, broken = ListSink('ETH/USDT', last=-1), ListSink('ETH/USDT', last=-1, fail=True)
+
+    await export_symbol('ETH/USDT', binance, [good, broken])
+
+    assert len(good.written) == 12
+    assert broken.written == []
+
+@pytest.mark.asyncio
+async def test_batched_sink_flushes_remainder_on_close():
+    binance = mock_exchange(5)
+    sink = ListSink('SOL/USDT', last=-1, batch_pages=2)
+
+    await export_symbol('SOL/USDT', binance, [sink])
+
+    assert len(sink.written) == 15
+    assert sink.last == 14
+    assert sink.pending == []
@@ -0,0 +1,119 @@
+import struct
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, MagicMock
+import numpy as np
+import pytest
+
+from BinanceCodec import Float8Encoding, ScaledEncoding
+from BinanceKlines import MINUTE_MS, KlineColumns
+from BinanceRollup import Rollups
+from BinanceStorage import PGCOPY_HEADER, PartitionedLayout, PerSymbolLayout, migrate_table, month_partitions
+
+MARKET = {'symbol': 'BTC/USDT:USDT', 'precision': {'price': 0.1, 'amount': 0.001}}
+
+def ms(year, month, day=1):
+    return int(datetime(year, month, day, tzinfo=timezone.utc).timestamp() * 1000)
+
+def mock_conn():
+    conn = AsyncMock()
+    conn.transaction = MagicMock()
+    return conn
+
+@pytest.mark.asyncio
+async def test_scaled_per_symbol_layout_keys_scales_like_its_tables():
+    layout = PerSymbolLayout(encoding=ScaledEncoding())
+    conn = mock_conn()
+    conn.fetchrow.return_value = {'price_digits': 1, 'volume_digits': 3}
+
+    await layout.ensure(conn, "BTC/USDT:USDT", MARKET)
+
+    # Stored, listed (symbol_key) and read back under one key
+    assert conn.fetchrow.await_args.args[1] == "BTCUSDT:USDT"
+    legacy = conn.execute.await_args_list[-1].args
+    assert "SELECT $1, price_digits, volume_digits" in legacy[0] and legacy[1:] == ("BTCUSDT:USDT", "BTC/USDT:USDT")
+    for symbol in ("BTC/USDT:USDT", layout.symbol_key("BTC/USDT:USDT")):
+        assert "WHERE symbol = 'BTCUSDT:USDT') scales" in layout.select_sql(symbol)
+    assert "WHERE symbol = 'BTCUSDT:USDT') scales" in Rollups(layout).update_sql("BTCUSDT:USDT", '1H')
+    assert layout.encode("BTCUSDT:USDT", [(0, 1.5, 2.0, 1.0, 1.5, 0.25)]) == [(0, 15, 20, 10, 15, 250)]
+
+def test_month_partitions_cover_the_range_across_a_year_end():
+    partitions = month_partitions("ohlcv", ms(2023, 11, 15), ms(2024, 1, 3))
+
+    assert partitions == [
+        ("ohlcv_202311", ms(2023, 11), ms(2023, 12)),
+        ("ohlcv_202312", ms(2023, 12), ms(2024, 1)),
+        ("ohlcv_202401", ms(2024, 1), ms(2024, 2)),
+    ]
+    assert month_partitions("ohlcv", ms(2024, 2), ms(2024, 2, 29)) == [("ohlcv_202402", ms(2024, 2), ms(2024, 3))]
+
+@pytest.mark.asyncio
+async def test_partitioned_upsert_creates_each_month_once_and_skips_conflicts():
+    layout = PartitionedLayout()
+    conn = mock_conn()
+    rows = [(ms(2024, 1, 31), 1, 2, 0.5, 1.5, 10), (ms(2024, 2, 1), 1, 2, 0.5, 1.5, 10)]
+
+    await layout.upsert(conn, "BTC/USDT:USDT", rows)
+    await layout.upsert(conn, "BTC/USDT:USDT", rows)
+
+    ddl = [call.args[0] for call in conn.execute.await_args_list if "PARTITION OF" in call.args[0]]
+    assert ddl == [
+        f"CREATE TABLE IF NOT EXISTS ohlcv_202401 PARTITION OF ohlcv FOR VALUES FROM ({ms(2024, 1)}) TO ({ms(2024, 2)});",
+        f"CREATE TABLE IF NOT EXISTS ohlcv_202402 PARTITION OF ohlcv FOR VALUES FROM ({ms(2024, 2)}) TO ({ms(2024, 3)});",
+    ]
+    sql, records = conn.executemany.await_args.args
+    assert sql.startswith("INSERT INTO ohlcv (symbol, timestamp, open, high, low, close, volume)")
+    assert sql.endswith("ON CONFLICT DO NOTHING;")
+    assert records == [("BTC/USDT:USDT", *row) for row in rows]
+    watermark = conn.execute.await_args_list[-1].args
+    assert "ohlcv_watermarks" in watermark[0] and watermark[1:] == ("BTC/USDT:USDT", ms(2024, 2, 1))
+
+@pytest.mark.asyncio
+async def test_partitioned_binary_copy_prefixes_every_row_with_the_symbol():
+    layout = PartitionedLayout(Float8Encoding())
+    conn = mock_conn()
+    timestamps = np.array([ms(2024, 1, 1), ms(2024, 1, 1) + MINUTE_MS], dtype=np.int64)
+    columns = KlineColumns(timestamps, *(np.array([1.5, 2.5]) * k for k in range(1, 6)))
+
+    await layout.copy_columns(conn, "ETH/USDT", columns)
+
+    kwargs = conn.copy_to_table.await_args.kwargs
+    assert conn.copy_to_table.await_args.args == ("ohlcv_f8",)
+    assert kwargs["columns"] == ["symbol", "timestamp", "open", "high", "low", "close", "volume"]
+    payload = kwargs["source"].read()
+    assert payload.startswith(PGCOPY_HEADER) and payload.endswith(struct.pack("!h", -1))
+
+    offset = len(PGCOPY_HEADER)
+    for row in range(2):
+        assert struct.unpack_from("!hi8s", payload, offset) == (7, 8, b"ETH/USDT")
+        offset += 2 + 4 + 8
+        (size, timestamp), offset = struct.unpack_from("!iq", payload, offset), offset + 12
+        assert (size, timestamp) == (8, timestamps[row])
+        values = [struct.unpack_from("!id", payload, offset + 12 * i)[1] for i in range(5)]
+        offset += 12 * 5
+        assert values == [1.5 * k if row == 0 else 2.5 * k for k in range(1, 6)]
+    assert offset == len(payload) - 2
+
+@pytest.mark.asyncio
+async def test_migrate_table_sums_inserted_rows_per_month():
+    layout = PartitionedLayout()
+    conn = mock_conn()
+    conn.fetchrow.return_value = {'first': ms(2024, 1, 20), 'last': ms(2024, 3, 2)}
+
+    async def execute(sql, *args):
+        return "INSERT 0 1440" if "SELECT $1, timestamp" in sql else "CREATE TABLE"
+    conn.execute.side_effect = execute
+
+    assert await migrate_table(conn, layout, "BTCUSDT", "BTC/USDT") == 3 * 1440
+    inserts = [call.args for call in conn.execute.await_args_list if "SELECT $1, timestamp" in call.args[0]]
+    assert [args[1:] for args in inserts] == [
+        ("BTC/USDT", ms(2024, 1), ms(2024, 2)), ("BTC/USDT", ms(2024, 2), ms(2024, 3)), ("BTC/USDT", ms(2024, 3), ms(2024, 4)),
+    ]
+    assert conn.execute.await_args_list[-1].args[1:] == ("BTC/USDT", ms(2024, 3, 2))
+
+@pytest.mark.asyncio
+async def test_migrate_table_skips_empty_tables():
+    conn = mock_conn()
+    conn.fetchrow.return_value = {'first': None, 'last': None}
+
+    assert await migrate_table(conn, PartitionedLayout(), "BTCUSDT", "BTC/USDT") == 0
+    conn.execute.assert_not_awaited()
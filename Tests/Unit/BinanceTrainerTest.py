@@ -0,0 +1,113 @@
+from decimal import Decimal
+from unittest.mock import AsyncMock
+import numpy as np
+import pandas as pd
+import pytest
+
+from BinanceCodec import ScaledEncoding
+from BinanceKlines import MINUTE_MS, KlineColumns
+from BinanceStorage import PerSymbolLayout
+from BinanceTrainer import FeaturePipeline, FeatureSet, RollingSum, build_features, postgres_chunks, window_batches
+
+def candles(count, start=0, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, count)))
+    open = np.concatenate([[close[0]], close[:-1]])
+    spread = rng.uniform(0, 0.002, count) * close
+    return KlineColumns(
+        start + np.arange(count, dtype=np.int64) * MINUTE_MS, open, np.maximum(open, close) + spread,
+        np.minimum(open, close) - spread, close, rng.uniform(1, 10, count)
+    )
+
+def split(columns, size):
+    return [columns.filter(slice(start, start + size)) for start in range(0, len(columns), size)]
+
+async def stream(pages):
+    for page in pages:
+        yield page
+
+def test_features_do_not_depend_on_chunking():
+    columns = candles(500)
+
+    whole = FeaturePipeline((15, 60)).update(columns)
+    pipeline = FeaturePipeline((15, 60))
+    chunked = np.concatenate([pipeline.update(chunk) for chunk in split(columns, 37)])
+
+    np.testing.assert_allclose(chunked, whole, rtol=1e-5, equal_nan=True)
+
+def test_features_match_pandas_rolling():
+    columns = candles(300)
+    pipeline = FeaturePipeline((15,))
+    features = pd.DataFrame(pipeline.update(columns).astype(np.float64), columns=pipeline.names)
+
+    close = pd.Series(columns.close)
+    log_return = np.log(close / close.shift())
+    typical = ((pd.Series(columns.high) + pd.Series(columns.low) + close) / 3).where(log_return.notna())  # no predecessor, no window
+    volume = pd.Series(columns.volume)
+    vwap = (typical * volume).rolling(15).sum() / volume.rolling(15).sum()
+
+    np.testing.assert_allclose(features["volatility_15"], log_return.rolling(15).std(), rtol=1e-4, equal_nan=True)
+    np.testing.assert_allclose(features["momentum_15"], log_return.rolling(15).sum(), rtol=1e-4, atol=1e-7, equal_nan=True)
+    np.testing.assert_allclose(features["vwap_gap_15"], close / vwap - 1, rtol=1e-3, atol=1e-7, equal_nan=True)
+
+def test_rolling_sum_skips_windows_with_invalid_rows():
+    rolling = RollingSum(3)
+
+    first = rolling.update(np.array([[1.0], [np.nan], [2.0], [3.0]]))
+    second = rolling.update(np.array([[4.0], [5.0]]))
+
+    assert np.isnan(first).all()
+    np.testing.assert_array_equal(second[:, 0], [9.0, 12.0])
+
+@pytest.mark.asyncio
+async def test_window_batches_stay_inside_contiguous_runs(tmp_path):
+    # Two runs of candles with a ten-minute hole between them
+    first = candles(200)
+    second = candles(200, start=210 * MINUTE_MS, seed=1)
+    rows = await build_features(stream(split(first, 64) + split(second, 64)), str(tmp_path), "BTC/USDT", windows=(15,))
+
+    dataset = FeatureSet(str(tmp_path), "BTC/USDT")
+    ends = dataset.window_ends(lookback=30, horizon=5)
+    batches = list(window_batches(str(tmp_path), ["BTC/USDT"], lookback=30, horizon=5, batch_size=64, normalize=False))
+
+    assert rows == len(dataset) == 400
+    # Warm-up (first return, 15-minute windows) and windows overlapping the hole are left out
+    assert len(ends) == 2 * (200 - 15 - 29 - 5)
+    assert sum(len(y) for _, y, _ in batches) == len(ends)
+    x, y, symbols = batches[0]
+    assert x.shape == (64, 30, len(dataset.names))
+    assert np.isfinite(x).all()
+    assert (symbols == "BTC/USDT").all()
+
+    end = int(ends[0])
+    close = np.concatenate([first.close, second.close])
+    np.testing.assert_allclose(next(window_batches(str(tmp_path), ["BTC/USDT"], 30, 5, 1, shuffle=False))[1],
+                               [np.log(close[end + 5] / close[end])], rtol=1e-4)
+
+@pytest.mark.asyncio
+async def test_postgres_chunks_page_by_timestamp():
+    conn = AsyncMock()
+    conn.fetchval.return_value = False
+    rows = [(i * MINUTE_MS, Decimal("1.5"), Decimal("2"), Decimal("1"), Decimal("1.5"), Decimal("10")) for i in range(5)]
+    conn.fetch.side_effect = [rows[:2], rows[2:4], rows[4:]]
+
+    chunks = [chunk async for chunk in postgres_chunks(conn, PerSymbolLayout(), "BTC/USDT", chunk_rows=2)]
+
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    assert chunks[1].close.dtype == np.float64
+    assert [call.args[1] for call in conn.fetch.await_args_list] == [-1, MINUTE_MS, 3 * MINUTE_MS]
+    # A read only ever adds a plain index; no DELETE, no unique index
+    (create,) = [call.args[0] for call in conn.execute.await_args_list]
+    assert create.startswith('CREATE INDEX IF NOT EXISTS "BTCUSDT_timestamp_idx"')
+
+@pytest.mark.asyncio
+async def test_postgres_chunks_reads_listed_scaled_symbols():
+    conn = AsyncMock()
+    conn.fetchval.return_value = True
+    conn.fetch.return_value = []
+    layout = PerSymbolLayout(encoding=ScaledEncoding())
+
+    # symbols_sql lists "BTCUSDT:USDT"; its scales are looked up under the same key
+    assert [chunk async for chunk in postgres_chunks(conn, layout, "BTCUSDT:USDT")] == []
+    assert "WHERE symbol = 'BTCUSDT:USDT') scales" in conn.fetch.await_args.args[0]
+    conn.execute.assert_not_awaited()